@@ -4,9 +4,12 @@ import os
 import sys
 import json
 
+from sureal.dataset_reader import DatasetReader
 from sureal.subjective_model import SubjectiveModel
 from sureal.routine import run_subjective_models
-from sureal.tools.misc import get_file_name_with_extension, get_cmd_option, cmd_option_exists
+from sureal.tools.misc import get_file_name_with_extension, get_cmd_option, cmd_option_exists, \
+    import_dataset_file
+from sureal.tools.dataset_store import is_sqlite_file
 from sureal.config import DisplayConfig
 
 __copyright__ = "Copyright 2016-2018, Netflix, Inc."
@@ -16,8 +19,29 @@ SUBJECTIVE_MODELS = ['MOS', 'MLE', 'MLE_CO', 'MLE_CO_AP', 'MLE_CO_AP2', 'DMOS',
 
 
 def print_usage():
-    print("usage: " + os.path.basename(sys.argv[0]) + " subjective_model dataset_filepath [--output-dir output_dir]\n")
+    print("usage: " + os.path.basename(sys.argv[0]) +
+          " subjective_model dataset_filepath [--output-dir output_dir] [--print] [--literal-only]\n")
     print("subjective_model:\n\t" + "\n\t".join(SUBJECTIVE_MODELS) + "\n")
+    print("dataset_filepath: a .py, .json or .npz dataset file, or a .db, .sqlite or .sqlite3 dataset store of a\n"
+          "\tsingle dataset; with --literal-only, a .py file is parsed for\n"
+          "\tliteral assignments only, instead of executed\n")
+    print("or, to convert a dataset file to a .py or .npz one, or to add it to a .db, .sqlite or .sqlite3 dataset\n"
+          "store: " + os.path.basename(sys.argv[0]) + " convert dataset_filepath output_dataset_filepath\n")
+
+
+def convert(dataset_filepath, output_dataset_filepath):
+    if not (output_dataset_filepath.endswith('.py') or output_dataset_filepath.endswith('.npz')
+            or is_sqlite_file(output_dataset_filepath)):
+        print("Error: output_dataset_filepath must be .py, .npz, .db, .sqlite or .sqlite3")
+        return 1
+    try:
+        dataset = import_dataset_file(dataset_filepath)
+        DatasetReader.write_out_dataset(dataset, output_dataset_filepath)
+    except AssertionError as e:
+        print("Error: " + str(e))
+        return 1
+    print("Converted {} to {}.".format(dataset_filepath, output_dataset_filepath))
+    return 0
 
 
 def main():
@@ -25,6 +49,12 @@ def main():
         print_usage()
         return 2
 
+    if sys.argv[1] == 'convert':
+        if len(sys.argv) != 4:
+            print_usage()
+            return 2
+        return convert(sys.argv[2], sys.argv[3])
+
     try:
         subjective_model = sys.argv[1]
         dataset_filepath = sys.argv[2]
@@ -34,6 +64,7 @@ def main():
 
     output_dir = get_cmd_option(sys.argv, 3, len(sys.argv), '--output-dir')
     print_ = cmd_option_exists(sys.argv, 3, len(sys.argv), '--print')
+    literal_only = cmd_option_exists(sys.argv, 3, len(sys.argv), '--literal-only')
 
     do_plot = ['raw_scores', 'quality_scores']
     if subjective_model in ['MLE', 'MLE_CO', 'MLE_CO_AP', 'MLE_CO_AP2', 'DMOS_MLE', 'DMOS_MLE_CO']:
@@ -58,6 +89,7 @@ def main():
         do_plot=do_plot,
         plot_type='errorbar',
         gradient_method='simplified',
+        literal_only=literal_only,
     )
 
     if print_:
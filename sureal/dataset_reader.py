@@ -3,21 +3,93 @@ import copy
 import random
 
 import numpy as np
+import pandas as pd
 
-from sureal.tools.misc import empty_object, get_unique_sorted_list
+from sureal.tools.misc import empty_object, get_unique_sorted_list, export_npz_file, \
+    get_file_name_without_extension
 from sureal.tools.decorator import memoized as persist
 from sureal.tools.misc import get_unique_sorted_list
+from sureal.tools.sparse import dense_to_triplets
+from sureal.tools.blocks import RowBlocks
+from sureal.tools.dataset_store import is_sqlite_file, export_sqlite_file, query_sqlite_file, update_groundtruth
 
 __copyright__ = "Copyright 2016-2018, Netflix, Inc."
 __license__ = "Apache, Version 2.0"
 
 
 class DatasetReader(object):
+    """
+    Reader for a subjective quality test dataset. The fields of the ref_videos
+    and dis_videos dicts used by the properties are compiled into arrays on
+    first use, and cached for the following ones. The cache is dropped when
+    the dataset, or its ref_videos or dis_videos lists, are replaced, or the
+    lists are added to or removed from; after editing the dicts in place,
+    call invalidate_cache().
+    """
 
     def __init__(self, dataset, **kwargs):
         self.dataset = dataset
+        self.invalidate_cache()
         self._assert_dataset()
 
+    def invalidate_cache(self):
+        self._cache = dict()
+        self._cache_key = None
+
+    def _get_cached(self, name, compile_fcn):
+        """
+        The value compiled by compile_fcn() under name, compiled anew if the
+        dataset changed since.
+        """
+        dataset = self.dataset
+        # the cache holds the dataset and its lists, which keeps their ids unique
+        key = (id(dataset), id(dataset.ref_videos), len(dataset.ref_videos),
+               id(dataset.dis_videos), len(dataset.dis_videos))
+        if key != self._cache_key:
+            self._cache = {'_refs': (dataset, dataset.ref_videos, dataset.dis_videos)}
+            self._cache_key = key
+        if name not in self._cache:
+            self._cache[name] = compile_fcn()
+        return self._cache[name]
+
+    def _compile_content_id_of_ref_videos(self):
+        return np.array([ref_video['content_id'] for ref_video in self.dataset.ref_videos], dtype=np.int32)
+
+    def _compile_ref_video_of_content_id(self):
+        content_id_of_ref_videos = self._get_video_array('content_id_of_ref_videos')
+        # ref-video index: the position in ref_videos of each content_id
+        ref_video_of_content_id = -np.ones(np.max(content_id_of_ref_videos) + 1, dtype=np.int32)
+        ref_video_of_content_id[content_id_of_ref_videos] = np.arange(len(content_id_of_ref_videos))
+        return ref_video_of_content_id
+
+    def _compile_content_id_of_dis_videos(self):
+        return np.array([dis_video['content_id'] for dis_video in self.dataset.dis_videos], dtype=np.int32)
+
+    def _compile_asset_id_of_dis_videos(self):
+        asset_id_of_dis_videos = np.array([dis_video['asset_id'] for dis_video in self.dataset.dis_videos])
+        if asset_id_of_dis_videos.dtype.kind in 'iu':
+            asset_id_of_dis_videos = asset_id_of_dis_videos.astype(np.int32)
+        return asset_id_of_dis_videos
+
+    def _compile_disvideo_is_refvideo(self):
+        ref_video_of_dis_videos = self._get_video_array('ref_video_of_content_id')[
+            self._get_video_array('content_id_of_dis_videos')]
+        ref_paths = [self.dataset.ref_videos[i]['path'] for i in ref_video_of_dis_videos]
+        return np.array([ref_path == dis_video['path'] for ref_path, dis_video
+                         in zip(ref_paths, self.dataset.dis_videos)], dtype=bool)
+
+    def _get_video_array(self, name):
+        """
+        The read-only array name, e.g. 'content_id_of_dis_videos', compiled
+        by _compile_<name>() on first use, so that a field of the video
+        dicts is only read by the properties that need it.
+        """
+        def compile_fcn():
+            array = getattr(self, '_compile_' + name)()
+            array.setflags(write=False)
+            return array
+        return self._get_cached(name, compile_fcn)
+
     def _assert_dataset(self):
         # assert content id is from 0 to the total_content - 1
         cids = []
@@ -45,19 +117,20 @@ class DatasetReader(object):
 
     @property
     def max_content_id_of_ref_videos(self):
-        return max(map(lambda ref_video: ref_video['content_id'], self.dataset.ref_videos))
+        return self._get_cached('max_content_id_of_ref_videos',
+                                lambda: int(np.max(self._get_video_array('content_id_of_ref_videos'))))
 
     @property
     def content_ids(self):
-        return list(set(map(lambda ref_video: ref_video['content_id'], self.dataset.ref_videos)))
+        return list(set(self._get_video_array('content_id_of_ref_videos').tolist()))
 
     @property
     def asset_ids(self):
-        return list(set(map(lambda dis_video: dis_video['asset_id'], self.dataset.dis_videos)))
+        return list(set(self._get_video_array('asset_id_of_dis_videos').tolist()))
 
     @property
     def content_id_of_dis_videos(self):
-        return list(map(lambda dis_video: dis_video['content_id'], self.dataset.dis_videos))
+        return self._get_video_array('content_id_of_dis_videos').tolist()
 
     @property
     def _contentid_to_refvideo_map(self):
@@ -68,11 +141,39 @@ class DatasetReader(object):
 
     @property
     def disvideo_is_refvideo(self):
-        d = self._contentid_to_refvideo_map
-        return list(map(
-            lambda dis_video: d[dis_video['content_id']]['path'] == dis_video['path'],
-            self.dataset.dis_videos
-        ))
+        return self._get_video_array('disvideo_is_refvideo').tolist()
+
+    def _compile_ref_dis_video_of_dis_videos(self):
+        content_id_of_dis_videos = np.array(self.content_id_of_dis_videos, dtype=np.int32)
+        disvideo_is_refvideo = np.array(self.disvideo_is_refvideo, dtype=bool)
+        # ref-row index: the position in dis_videos of the ref video of each content_id
+        ref_content_ids = content_id_of_dis_videos[disvideo_is_refvideo]
+        num_ref_dis_videos = np.bincount(ref_content_ids, minlength=self.max_content_id_of_ref_videos + 1)
+        for content_id in np.unique(content_id_of_dis_videos):
+            assert num_ref_dis_videos[content_id] == 1, \
+                'Should have only and one ref video for a dis video, ' \
+                'but got {}'.format(num_ref_dis_videos[content_id])
+        ref_dis_video_of_content_id = -np.ones(len(num_ref_dis_videos), dtype=np.int64)
+        ref_dis_video_of_content_id[ref_content_ids] = np.flatnonzero(disvideo_is_refvideo)
+        ref_dis_video_of_dis_videos = ref_dis_video_of_content_id[content_id_of_dis_videos]
+        ref_dis_video_of_dis_videos.setflags(write=False)
+        return ref_dis_video_of_dis_videos
+
+    @property
+    def ref_dis_video_of_dis_videos(self):
+        """
+        For each dis video, the index in dis_videos of its ref video, i.e. of
+        the one dis video of its content_id that is the ref video.
+        """
+        return self._get_cached('ref_dis_video_of_dis_videos', self._compile_ref_dis_video_of_dis_videos).tolist()
+
+    def _get_ref_rows(self):
+        """
+        For differential scoring, the row of the ref video of each dis video,
+        and the opinion scores of the ref videos those rows index, or None if
+        they index the rows of opinion_score_2darray.
+        """
+        return self.ref_dis_video_of_dis_videos, None
 
     @property
     def ref_score(self):
@@ -85,6 +186,13 @@ class DatasetReader(object):
     def write_out_dataset(dataset, output_dataset_filepath):
         assert (hasattr(dataset, 'ref_videos'))
         assert (hasattr(dataset, 'dis_videos'))
+        if output_dataset_filepath.endswith('.npz'):
+            export_npz_file(dataset, output_dataset_filepath)
+            return
+        if is_sqlite_file(output_dataset_filepath):
+            # replaces the dataset of the same name in the store
+            export_sqlite_file(dataset, output_dataset_filepath)
+            return
         # write out
         with open(output_dataset_filepath, 'wt') as output_file:
             for key in dataset.__dict__.keys():
@@ -110,6 +218,11 @@ class RawDatasetReader(DatasetReader):
     has key of 'os' (opinion score)).
     """
 
+    # SubjectiveModel caches its preprocessed opinion scores in the reader,
+    # per preprocessing config, see _get_cached(), if the opinion scores are
+    # those of the dataset, the same on every read
+    CACHE_PREPROCESSING = True
+
     def _assert_dataset(self):
         """
         Override DatasetReader._assert_dataset
@@ -150,8 +263,7 @@ class RawDatasetReader(DatasetReader):
     def num_observers(self):
         return self._get_num_observers()
 
-    def _get_list_observers(self):
-
+    def _compile_observers(self):
         for dis_video in self.dataset.dis_videos:
             assert isinstance(dis_video['os'], dict)
 
@@ -161,12 +273,18 @@ class RawDatasetReader(DatasetReader):
 
         return get_unique_sorted_list(list_observers)
 
+    def _get_list_observers(self):
+        return list(self._get_cached('observers', self._compile_observers))
+
     @property
-    def opinion_score_2darray(self):
+    def _observer_index(self):
         """
-        2darray storing raw opinion scores, with first dimension the number of
-        distorted videos, second dimension the number of observers
+        Observer index: the column of each observer, for os as dicts.
         """
+        return self._get_cached('observer_index', lambda: {
+            observer: i_observer for i_observer, observer in enumerate(self._get_list_observers())})
+
+    def _compile_opinion_score_2darray(self):
         score_mtx = float('NaN') * np.ones([self.num_dis_videos, self._get_num_observers()])
 
         if isinstance(self.dataset.dis_videos[0]['os'], list) \
@@ -174,15 +292,87 @@ class RawDatasetReader(DatasetReader):
             for i_dis_video, dis_video in enumerate(self.dataset.dis_videos):
                 score_mtx[i_dis_video, :] = dis_video['os']
         elif isinstance(self.dataset.dis_videos[0]['os'], dict):
-            list_observers = self._get_list_observers()
+            observer_index = self._observer_index
             for i_dis_video, dis_video in enumerate(self.dataset.dis_videos):
-                for i_observer, observer in enumerate(list_observers):
-                    if observer in dis_video['os']:
-                        score_mtx[i_dis_video, i_observer] = dis_video['os'][observer]
+                for observer, score in dis_video['os'].items():
+                    score_mtx[i_dis_video, observer_index[observer]] = score
         else:
             assert False
+        score_mtx.setflags(write=False)
         return score_mtx
 
+    @property
+    def opinion_score_2darray(self):
+        """
+        2darray storing raw opinion scores, with first dimension the number of
+        distorted videos, second dimension the number of observers
+        """
+        # a copy, as callers may modify it in place
+        return self._get_cached('opinion_score_2darray', self._compile_opinion_score_2darray).copy()
+
+    @property
+    def opinion_score_triplets(self):
+        """
+        (rows, cols, vals) triplets of the observed opinion scores, with rows
+        indexing the distorted videos and cols the observers, in the same order
+        as opinion_score_2darray. Built directly from dis_videos, without
+        materializing the NaN-padded 2darray.
+        """
+        return tuple(array.copy() for array in
+                     self._get_cached('opinion_score_triplets', self._compile_opinion_score_triplets))
+
+    def _compile_opinion_score_triplets(self):
+        if isinstance(self.dataset.dis_videos[0]['os'], list) \
+                or isinstance(self.dataset.dis_videos[0]['os'], tuple):
+            num_observers = self._get_num_observers()
+            vals = np.fromiter((score for dis_video in self.dataset.dis_videos for score in dis_video['os']),
+                               dtype=float, count=self.num_dis_videos * num_observers)
+            rows = np.repeat(np.arange(self.num_dis_videos), num_observers)
+            cols = np.tile(np.arange(num_observers), self.num_dis_videos)
+        elif isinstance(self.dataset.dis_videos[0]['os'], dict):
+            observer_to_idx = self._observer_index
+            num_scores = sum(len(dis_video['os']) for dis_video in self.dataset.dis_videos)
+            rows = np.repeat(np.arange(self.num_dis_videos),
+                             [len(dis_video['os']) for dis_video in self.dataset.dis_videos])
+            cols = np.fromiter((observer_to_idx[observer] for dis_video in self.dataset.dis_videos
+                                for observer in dis_video['os']), dtype=np.intp, count=num_scores)
+            vals = np.fromiter((score for dis_video in self.dataset.dis_videos
+                                for score in dis_video['os'].values()), dtype=float, count=num_scores)
+            # keep the row-major order of opinion_score_2darray
+            order = np.lexsort((cols, rows))
+            rows, cols, vals = rows[order], cols[order], vals[order]
+        else:
+            assert False
+        observed = ~np.isnan(vals)
+        return rows[observed], cols[observed], vals[observed]
+
+    def _get_view_base(self):
+        """
+        The opinion_score_2darray (as overridden, if so) and the observers,
+        shared read-only by all the views of this reader; the arrays of the
+        dis videos are those of _get_video_array().
+        """
+        return self._get_cached('view_base', self._compile_view_base)
+
+    def _compile_view_base(self):
+        opinion_score_2darray = np.array(self.opinion_score_2darray, dtype=float)
+        opinion_score_2darray.setflags(write=False)
+        try:
+            observers = self._get_list_observers()
+        except AssertionError:
+            observers = None
+        return {
+            'opinion_score_2darray': opinion_score_2darray,
+            'observers': observers,
+        }
+
+    def view(self, dis_video_idxs=None, observer_idxs=None):
+        """
+        RawDatasetReaderView of the distorted videos dis_video_idxs and the
+        observers observer_idxs of this reader (all, if None).
+        """
+        return RawDatasetReaderView(self, dis_video_idxs, observer_idxs)
+
     def to_aggregated_dataset(self, aggregate_scores, **kwargs):
 
         newone = self._prepare_new_dataset(kwargs)
@@ -465,6 +655,9 @@ class RawDatasetReader(DatasetReader):
 
 class MockedRawDatasetReader(RawDatasetReader):
 
+    # the opinion scores may be drawn anew on every read
+    CACHE_PREPROCESSING = False
+
     def __init__(self, dataset, **kwargs):
         super(MockedRawDatasetReader, self).__init__(dataset)
         if 'input_dict' in kwargs:
@@ -494,6 +687,433 @@ class MockedRawDatasetReader(RawDatasetReader):
 
         return newone
 
+    @property
+    def opinion_score_triplets(self):
+        """
+        Override RawDatasetReader.opinion_score_triplets: derive from the
+        overridden opinion_score_2darray.
+        """
+        return dense_to_triplets(self.opinion_score_2darray)
+
+
+class RawDatasetReaderView(RawDatasetReader):
+    """
+    View of a reader restricted to the distorted videos dis_video_idxs and
+    the observers observer_idxs of it, each possibly repeated (as by a
+    resampling) and, if None, all of them. Views are cheap to make, e.g. for
+    each fit of a bootstrap, jackknife or cross-validation: they only hold
+    the index arrays, and a reference to the reader's opinion_score_2darray
+    and metadata arrays, read once, instead of re-reading the dataset. The
+    metadata of the distorted videos, e.g. content_id_of_dis_videos, is
+    resolved through the same indices as the opinion scores.
+
+    The dataset of a view lists the selected dis_videos, as references to the
+    dicts of the reader's dataset, with their original 'os'; to_dataset()
+    copies them, with 'os' overwritten by the view's opinion scores.
+    """
+
+    def __init__(self, dataset_reader, dis_video_idxs=None, observer_idxs=None):
+        # a view of a view is one of the underlying reader, by composing the
+        # indices; the dataset was already asserted by the reader
+        if isinstance(dataset_reader, RawDatasetReaderView):
+            dis_video_idxs = dataset_reader.dis_video_idxs if dis_video_idxs is None \
+                else dataset_reader.dis_video_idxs[np.asarray(dis_video_idxs, dtype=np.intp)]
+            observer_idxs = dataset_reader.observer_idxs if observer_idxs is None \
+                else dataset_reader.observer_idxs[np.asarray(observer_idxs, dtype=np.intp)]
+            dataset_reader = dataset_reader.dataset_reader
+        self.dataset_reader = dataset_reader
+        self._base = dataset_reader._get_view_base()
+
+        num_dis_videos, num_observers = self._base['opinion_score_2darray'].shape
+        self.dis_video_idxs = np.arange(num_dis_videos) if dis_video_idxs is None \
+            else np.asarray(dis_video_idxs, dtype=np.intp)
+        self.observer_idxs = np.arange(num_observers) if observer_idxs is None \
+            else np.asarray(observer_idxs, dtype=np.intp)
+        assert self.dis_video_idxs.ndim == 1 and self.observer_idxs.ndim == 1
+        assert np.all((self.dis_video_idxs >= 0) & (self.dis_video_idxs < num_dis_videos)), \
+            'dis_video_idxs must be in [0, {})'.format(num_dis_videos)
+        assert np.all((self.observer_idxs >= 0) & (self.observer_idxs < num_observers)), \
+            'observer_idxs must be in [0, {})'.format(num_observers)
+
+        base_dataset = dataset_reader.dataset
+        self.dataset = empty_object()
+        self.dataset.__dict__.update(base_dataset.__dict__)
+        self.dataset.dis_videos = [base_dataset.dis_videos[i] for i in self.dis_video_idxs]
+        self.invalidate_cache()
+
+    @property
+    def max_content_id_of_ref_videos(self):
+        return self.dataset_reader.max_content_id_of_ref_videos
+
+    @property
+    def num_dis_videos(self):
+        return len(self.dis_video_idxs)
+
+    def _get_num_observers(self):
+        return len(self.observer_idxs)
+
+    def _get_list_observers(self):
+        assert self._base['observers'] is not None
+        return [self._base['observers'][i] for i in self.observer_idxs]
+
+    @property
+    def opinion_score_2darray(self):
+        return self._base['opinion_score_2darray'][np.ix_(self.dis_video_idxs, self.observer_idxs)]
+
+    @property
+    def opinion_score_triplets(self):
+        return dense_to_triplets(self.opinion_score_2darray)
+
+    @property
+    def content_id_of_dis_videos(self):
+        return self.dataset_reader._get_video_array('content_id_of_dis_videos')[self.dis_video_idxs].tolist()
+
+    @property
+    def asset_ids(self):
+        return list(set(self.dataset_reader._get_video_array('asset_id_of_dis_videos')[self.dis_video_idxs].tolist()))
+
+    @property
+    def disvideo_is_refvideo(self):
+        return self.dataset_reader._get_video_array('disvideo_is_refvideo')[self.dis_video_idxs].tolist()
+
+    def _get_ref_rows(self):
+        # the ref videos are resolved through the reader, so that a resampling
+        # may repeat or drop them; their scores are those of the reader's rows
+        ref_dis_videos = np.asarray(self.dataset_reader.ref_dis_video_of_dis_videos)[self.dis_video_idxs]
+        ref_dis_videos, ref_rows = np.unique(ref_dis_videos, return_inverse=True)
+        return ref_rows, self._base['opinion_score_2darray'][np.ix_(ref_dis_videos, self.observer_idxs)]
+
+    def to_dataset(self):
+        newone = empty_object()
+        newone.__dict__.update(self.dataset.__dict__)
+        newone.ref_videos = copy.deepcopy(self.dataset.ref_videos)
+        newone.dis_videos = copy.deepcopy(self.dataset.dis_videos)
+        for scores, dis_video in zip(self.opinion_score_2darray, newone.dis_videos):
+            dis_video['os'] = list(scores)
+        return newone
+
+
+class TripletsRawDatasetReader(RawDatasetReader):
+    """
+    Reader for a dataset whose dis_videos have no 'os', of raw opinion
+    scores given as triplets instead: the arrays of the dis video indices,
+    the observer indices into list_observers, and the scores. The opinion
+    score 2darray is compiled from the triplets, without a dict per
+    rating; to_dataset() builds the dataset with the 'os', as dicts, or as
+    lists if os_type is 'list'.
+    """
+
+    def __init__(self, dataset, triplets, list_observers, os_type='dict', **kwargs):
+        assert os_type in ['dict', 'list']
+        rows, cols, vals = triplets
+        assert len(rows) == len(cols) == len(vals)
+        self._triplets = (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp),
+                          np.array(vals, dtype=float))
+        for array in self._triplets:
+            array.setflags(write=False)
+        self._list_subjects = list_observers
+        self._os_type = os_type
+        super(TripletsRawDatasetReader, self).__init__(dataset, **kwargs)
+
+    def _assert_dataset(self):
+        # there is no 'os' in the dis_videos, but the triplets
+        DatasetReader._assert_dataset(self)
+        rows, cols, _ = self._triplets
+        assert np.all((rows >= 0) & (rows < self.num_dis_videos))
+        assert np.all((cols >= 0) & (cols < self._get_num_observers()))
+
+    def _get_num_observers(self):
+        return len(self._list_subjects)
+
+    def _compile_observers(self):
+        return self._list_subjects
+
+    def _compile_opinion_score_triplets(self):
+        return self._triplets
+
+    def _compile_opinion_score_2darray(self):
+        rows, cols, vals = self._triplets
+        score_mtx = float('NaN') * np.ones([self.num_dis_videos, self._get_num_observers()])
+        score_mtx[rows, cols] = vals
+        score_mtx.setflags(write=False)
+        return score_mtx
+
+    def to_dataset(self):
+        newone = empty_object()
+        newone.__dict__.update(self.dataset.__dict__)
+        newone.ref_videos = copy.deepcopy(self.dataset.ref_videos)
+        newone.dis_videos = copy.deepcopy(self.dataset.dis_videos)
+        rows, cols, vals = self._triplets
+        if self._os_type == 'list':
+            for dis_video, scores in zip(newone.dis_videos, self.opinion_score_2darray.tolist()):
+                dis_video['os'] = scores
+            return newone
+        for dis_video in newone.dis_videos:
+            dis_video['os'] = dict()
+        for row, col, val in zip(rows.tolist(), cols.tolist(), vals.tolist()):
+            newone.dis_videos[row]['os'][self._list_subjects[col]] = val
+        return newone
+
+
+class TidyRatingsDatasetReader(TripletsRawDatasetReader):
+    """
+    Reader for raw ratings in the long (tidy) format: a CSV file (or TSV,
+    with sep='\\t') of one rating per row, with columns for the subject, the
+    asset (i.e. the distorted video), its content and the score, named by
+    subject_col, asset_col, content_col and score_col.
+
+    The file is read in chunks of chunksize rows, of which only the four
+    columns are kept, as arrays: the subjects, assets and contents coded as
+    dense integers, by factorizing each chunk. The opinion scores, as
+    triplets or as the 2darray, are compiled from the codes, without a dict
+    per rating; to_dataset() builds the dataset with the 'os' dicts.
+
+    The dis videos are in the order of the first rating of their assets,
+    and have dense asset_ids; the observers are sorted, as are the contents
+    coded into content_ids, numerically if they all are integers. The
+    names of the assets and of the contents are kept as the dis videos'
+    'path' and the ref videos' 'content_name' and 'path'. If a subject rated
+    an asset more than once, the last score is kept.
+    """
+
+    DEFAULT_CHUNKSIZE = 1000000
+
+    def __init__(self, filepath, subject_col='subject', asset_col='asset', content_col='content',
+                 score_col='score', sep=',', chunksize=DEFAULT_CHUNKSIZE, dataset_name=None, ref_score=None):
+        assert chunksize > 0
+
+        codes = {'subject': [], 'asset': [], 'content': []}
+        names = {'subject': dict(), 'asset': dict(), 'content': dict()}  # name -> code
+        scores = []
+        columns = {subject_col: 'subject', asset_col: 'asset', content_col: 'content'}
+        for chunk in pd.read_csv(filepath, sep=sep, usecols=list(columns.keys()) + [score_col],
+                                 dtype={col: str for col in columns.keys()}, chunksize=chunksize):
+            for col, kind in columns.items():
+                assert not chunk[col].isnull().any(), 'column {} has missing values'.format(col)
+                chunk_codes, uniques = pd.factorize(chunk[col])
+                # only the distinct names of the chunk go through a dict
+                code_of_name = names[kind]
+                uniques_codes = np.array([code_of_name.setdefault(name, len(code_of_name)) for name in uniques],
+                                         dtype=np.int32)
+                codes[kind].append(uniques_codes[chunk_codes])
+            scores.append(chunk[score_col].to_numpy(dtype=float))
+        assert len(scores) > 0 and sum(map(len, scores)) > 0, 'no ratings in {}'.format(filepath)
+
+        subject_codes, asset_codes, content_codes = \
+            [np.concatenate(codes[kind]) for kind in ['subject', 'asset', 'content']]
+        vals = np.concatenate(scores)
+
+        # subjects and contents by their sorted names
+        list_subjects, subject_codes = self._sort_codes(names['subject'], subject_codes)
+        list_contents, content_codes = self._sort_codes(names['content'], content_codes)
+        list_assets = self._get_names(names['asset'])
+
+        # the content of each asset, which must be unique
+        content_id_of_assets = np.full(len(list_assets), -1, dtype=np.int32)
+        content_id_of_assets[asset_codes] = content_codes
+        mismatched = np.flatnonzero(content_id_of_assets[asset_codes] != content_codes)
+        assert len(mismatched) == 0, 'asset {} has ratings of more than one content'.format(
+            list_assets[asset_codes[mismatched[0]]])
+
+        # the last score of each (asset, subject), in row-major order
+        order = np.lexsort((np.arange(len(vals)), subject_codes, asset_codes))
+        rows, cols, vals = asset_codes[order], subject_codes[order], vals[order]
+        last = np.ones(len(vals), dtype=bool)
+        last[:-1] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        rows, cols, vals = rows[last], cols[last], vals[last]
+        observed = ~np.isnan(vals)
+
+        dataset = empty_object()
+        dataset.dataset_name = dataset_name if dataset_name is not None \
+            else get_file_name_without_extension(filepath)
+        if ref_score is not None:
+            dataset.ref_score = ref_score
+        dataset.ref_videos = [{'content_id': content_id, 'content_name': content, 'path': str(content)}
+                              for content_id, content in enumerate(list_contents)]
+        dataset.dis_videos = [{'asset_id': asset_id, 'content_id': int(content_id), 'path': str(asset)}
+                              for asset_id, (asset, content_id) in enumerate(zip(list_assets, content_id_of_assets))]
+        super(TidyRatingsDatasetReader, self).__init__(
+            dataset, (rows[observed], cols[observed], vals[observed]), list_subjects)
+
+    @staticmethod
+    def _get_names(code_of_name):
+        names = [None] * len(code_of_name)
+        for name, code in code_of_name.items():
+            names[code] = name
+        if all(name.lstrip('-').isdigit() for name in names):
+            names = [int(name) for name in names]
+        return names
+
+    @classmethod
+    def _sort_codes(cls, code_of_name, codes):
+        names = cls._get_names(code_of_name)
+        order = sorted(range(len(names)), key=lambda code: names[code])
+        new_code = np.empty(len(names), dtype=np.int32)
+        new_code[order] = np.arange(len(names))
+        return [names[code] for code in order], new_code[codes]
+
+
+class SqliteDatasetReader(TripletsRawDatasetReader):
+    """
+    Reader for a dataset of raw ratings in a store in a SQLite file, of
+    dataset_name (which may be omitted if it is the only one), see
+    sureal.tools.dataset_store. If content_ids, asset_ids or subjects are
+    specified, only the dis videos of those contents and assets, and the
+    ratings of those subjects, are read, by querying the indexed tables,
+    instead of filtering the whole dataset after loading it.
+
+    The observers are those with ratings of the dis videos read (or, for a
+    dataset of 'os' lists, all of them, if subjects is not specified).
+    write_aggregated_scores() writes the scores of a subjective model back
+    to the store, as the groundtruth of the dis videos read.
+    """
+
+    def __init__(self, filepath, dataset_name=None, content_ids=None, asset_ids=None, subjects=None):
+        query = query_sqlite_file(filepath, dataset_name, content_ids, asset_ids, subjects)
+        assert query.os_type is not None, \
+            'dataset {} in {} has no raw opinion scores'.format(query.dataset.dataset_name, filepath)
+        self.filepath = filepath
+        self.dis_video_idxs = query.dis_video_idxs
+
+        if query.os_type == 'list' and subjects is None:
+            list_observers = list(range(query.num_observers))
+            cols = query.subjects.astype(np.intp)
+        else:
+            cols, list_observers = pd.factorize(query.subjects, sort=True)
+            list_observers = list_observers.tolist()
+        super(SqliteDatasetReader, self).__init__(
+            query.dataset, (query.rows, cols, query.scores), list_observers, os_type=query.os_type)
+
+    def write_aggregated_scores(self, aggregate_scores, scores_std=None):
+        """
+        Write the aggregate scores, e.g. the quality_scores of a subjective
+        model, and their std if specified, to the store, as the groundtruth
+        and groundtruth_std of the dis videos read.
+        """
+        assert len(aggregate_scores) == self.num_dis_videos
+        update_groundtruth(self.filepath, self.dis_video_idxs, aggregate_scores, scores_std,
+                           dataset_name=self.dataset.dataset_name)
+
+
+class MemmapRawDatasetReader(RawDatasetReader):
+    """
+    Reader for a dataset whose raw opinion scores are in a .npy file, of the
+    dis videos by the observers, NaN where missing, memory-mapped read-only
+    instead of loaded, for score matrices that do not fit in memory: the
+    dis_videos have no 'os', and opinion_score_2darray is the np.memmap
+    itself, not a copy. opinion_score_blocks reads it in blocks of
+    block_size rows (by default, of about DEFAULT_BLOCK_BYTES), as do
+    MosModel (and its subclasses) and SubjectMLEModelProjectionSolver, whose
+    resident memory is then bounded by a block, and arrays per dis video and
+    per observer.
+
+    from_dataset_reader() writes such a file from another reader, e.g. a
+    SqliteDatasetReader or a TidyRatingsDatasetReader, from its triplets.
+    """
+
+    DEFAULT_BLOCK_BYTES = 64 * 1024 * 1024
+
+    # a preprocessed copy of the opinion scores would not fit in memory
+    CACHE_PREPROCESSING = False
+
+    def __init__(self, dataset, filepath, list_observers=None, block_size=None):
+        self.filepath = filepath
+        self._os_memmap = np.load(filepath, mmap_mode='r')
+        assert len(self._os_memmap.shape) == 2, 'expect a 2darray in {}'.format(filepath)
+        self._list_subjects = list_observers
+        if block_size is None:
+            row_bytes = max(1, self._os_memmap.shape[1] * np.dtype(float).itemsize)
+            block_size = max(1, self.DEFAULT_BLOCK_BYTES // row_bytes)
+        assert block_size > 0
+        self.block_size = block_size
+        super(MemmapRawDatasetReader, self).__init__(dataset)
+
+    @classmethod
+    def from_dataset_reader(cls, dataset_reader, filepath, block_size=None):
+        """
+        Write the opinion scores of dataset_reader to a .npy file at filepath,
+        a block of rows at a time from its opinion_score_triplets, and return
+        a MemmapRawDatasetReader of it, with the dataset of dataset_reader
+        (without 'os') and its observers, if named.
+        """
+        rows, cols, vals = dataset_reader.opinion_score_triplets
+        if np.any(np.diff(rows) < 0):
+            order = np.argsort(rows, kind='stable')
+            rows, cols, vals = rows[order], cols[order], vals[order]
+        num_dis_videos, num_observers = dataset_reader.num_dis_videos, dataset_reader.num_observers
+        if block_size is None:
+            block_size = max(1, cls.DEFAULT_BLOCK_BYTES // max(1, num_observers * np.dtype(float).itemsize))
+
+        os_memmap = np.lib.format.open_memmap(filepath, mode='w+', dtype=float,
+                                              shape=(num_dis_videos, num_observers))
+        for start in range(0, num_dis_videos, block_size):
+            stop = min(start + block_size, num_dis_videos)
+            lo, hi = np.searchsorted(rows, [start, stop])
+            block = np.full([stop - start, num_observers], float('NaN'))
+            block[rows[lo:hi] - start, cols[lo:hi]] = vals[lo:hi]
+            os_memmap[start:stop] = block
+        os_memmap.flush()
+        del os_memmap
+
+        dataset = dataset_reader._prepare_new_dataset({})
+        dataset.ref_videos = copy.deepcopy(dataset_reader.dataset.ref_videos)
+        dataset.dis_videos = [{key: copy.deepcopy(value) for key, value in dis_video.items() if key != 'os'}
+                              for dis_video in dataset_reader.dataset.dis_videos]
+        try:
+            list_observers = dataset_reader._get_list_observers()
+        except AssertionError:
+            list_observers = None
+        return cls(dataset, filepath, list_observers=list_observers, block_size=block_size)
+
+    def _assert_dataset(self):
+        # there is no 'os' in the dis_videos, but the memmap
+        DatasetReader._assert_dataset(self)
+        assert self._os_memmap.shape[0] == self.num_dis_videos, \
+            'expect {} rows of opinion scores, but got {}'.format(self.num_dis_videos, self._os_memmap.shape[0])
+        if self._list_subjects is not None:
+            assert len(self._list_subjects) == self._os_memmap.shape[1]
+
+    def _get_num_observers(self):
+        return self._os_memmap.shape[1]
+
+    def _compile_observers(self):
+        assert self._list_subjects is not None, 'observers are not named'
+        return self._list_subjects
+
+    @property
+    def opinion_score_2darray(self):
+        """
+        The read-only np.memmap of the opinion scores.
+        """
+        return self._os_memmap
+
+    @property
+    def opinion_score_blocks(self):
+        return RowBlocks(self._os_memmap, self.block_size)
+
+    def _compile_opinion_score_triplets(self):
+        rows, cols, vals = [], [], []
+        for start, _, block in self.opinion_score_blocks:
+            block_rows, block_cols, block_vals = dense_to_triplets(block)
+            rows.append(block_rows + start)
+            cols.append(block_cols)
+            vals.append(block_vals)
+        return np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+
+    def to_dataset(self):
+        newone = empty_object()
+        newone.__dict__.update(self.dataset.__dict__)
+        newone.ref_videos = copy.deepcopy(self.dataset.ref_videos)
+        newone.dis_videos = copy.deepcopy(self.dataset.dis_videos)
+        for start, stop, block in self.opinion_score_blocks:
+            for dis_video, scores in zip(newone.dis_videos[start:stop], block.tolist()):
+                if self._list_subjects is None:
+                    dis_video['os'] = scores
+                else:
+                    dis_video['os'] = {observer: score for observer, score
+                                       in zip(self._list_subjects, scores) if not np.isnan(score)}
+        return newone
+
 
 class SyntheticRawDatasetReader(MockedRawDatasetReader):
     """
@@ -628,7 +1248,8 @@ class SelectSubjectRawDatasetReader(MockedRawDatasetReader):
     """
     Dataset reader that only output selected subjects. It reads a dataset as a
     baseline, and override the opinion_score_2darray and other fields based on
-    input_dict.
+    input_dict. For many selections of the same dataset, e.g. resamplings, a
+    RawDatasetReader.view() does not re-read it for each.
     """
     def _assert_input_dict(self):
         assert 'selected_subjects' in self.input_dict
@@ -657,6 +1278,11 @@ class SelectSubjectRawDatasetReader(MockedRawDatasetReader):
 
 
 class SelectDisVideoRawDatasetReader(MockedRawDatasetReader):
+    """
+    Dataset reader that only output selected distorted videos, as rows of the
+    opinion_score_2darray. Unlike a RawDatasetReader.view(), the metadata of
+    the dis videos, e.g. content_id_of_dis_videos, is not selected.
+    """
 
     def _assert_input_dict(self):
         assert 'selected_dis_videos' in self.input_dict
@@ -2,18 +2,45 @@ import copy
 
 import numpy as np
 
-from sureal.dataset_reader import SelectSubjectRawDatasetReader, SelectDisVideoRawDatasetReader
-from sureal.subjective_model import MaximumLikelihoodEstimationModel
-
-
-class MaximumLikelihoodEstimationModelWithBootstrapping(MaximumLikelihoodEstimationModel):
-
-    TYPE = 'MLE_BSTP'
-    VERSION = MaximumLikelihoodEstimationModel.VERSION + "_0.1"
+from sureal.subjective_model import MaximumLikelihoodEstimationModel, SubjectMLEModelProjectionSolver
+from sureal.tools.executor import ProcessExecutor
+
+
+class BootstrappingMixin(object):
+    """
+    Mixin to a subjective model, estimating the confidence intervals of the
+    quality scores, and of the observer biases and inconsistencies, by
+    n_bootstrap fits of the subjects, and of the distorted videos, resampled
+    with replacement.
+
+    With bootstrap_method 'resample' (the default), each replicate is a fit
+    of the model to a reader of the resampled subjects or videos. The
+    replicates are fitted in bootstrap_processes worker processes (default 1,
+    i.e. in the calling process; None for one per CPU), on views of the
+    reader (see RawDatasetReader.view()), which share its opinion scores,
+    read once.
+
+    With bootstrap_method 'weights', each replicate is instead drawn as the
+    multinomial counts of the subjects or videos, and all replicates are
+    solved at once, as a batch of weightings of the one opinion score matrix,
+    warm started from the fit to the whole dataset (see the model's
+    _run_modeling_weighted_batch()). The counts are those of a resampling,
+    but not the same as the 'resample' draws.
+
+    Each replicate is drawn from its own random generator: seeded with its
+    index, as in earlier versions, by default, or spawned from
+    np.random.SeedSequence(bootstrap_seed). Either way, the results do not
+    depend on the number of processes.
+    """
 
     DEFAULT_N_BOOTSTRAP = 30
     DEFAULT_BOOTSTRAP_SUBJECTS = True
     DEFAULT_BOOSTRAP_DIS_VIDEOS = True
+    DEFAULT_BOOTSTRAP_PROCESSES = 1
+    DEFAULT_BOOTSTRAP_METHOD = 'resample'
+
+    # the parts of a replicate's result used, and sent back by the workers
+    BOOTSTRAP_RESULT_KEYS = ['quality_scores', 'observer_bias', 'observer_inconsistency']
 
     @classmethod
     def _run_modeling(cls, dataset_reader, **kwargs):
@@ -25,10 +52,9 @@ class MaximumLikelihoodEstimationModelWithBootstrapping(MaximumLikelihoodEstimat
         new_kwargs = copy.deepcopy(kwargs)
         new_kwargs['force_subjbias_zeromean'] = False
 
-        result = super(MaximumLikelihoodEstimationModelWithBootstrapping, cls).\
+        result = super(BootstrappingMixin, cls).\
             _run_modeling(dataset_reader, **new_kwargs)
 
-        dataset = dataset_reader.to_dataset()
         n_subj = dataset_reader.num_observers
         n_disvideo = dataset_reader.num_dis_videos
 
@@ -46,45 +72,128 @@ class MaximumLikelihoodEstimationModelWithBootstrapping(MaximumLikelihoodEstimat
                and kwargs['boostrap_dis_videos'] is not None else cls.DEFAULT_BOOSTRAP_DIS_VIDEOS
         assert isinstance(boostrap_dis_videos, bool)
 
-        if bootstrap_subjects:
-            quality_scores_ci95 = \
-                cls._bootstrap_subjects(dataset, result, n_subj, n_bootstrap, new_kwargs)
-            result['quality_scores_ci95'] = quality_scores_ci95
-        else:
-            del result['quality_scores_ci95']
-
-        if boostrap_dis_videos:
-            observer_bias_ci95, observer_inconsistency_ci95 = \
-                cls._boostrap_dis_videos(dataset, result, n_disvideo, n_bootstrap, new_kwargs)
-            result['observer_bias_ci95'] = observer_bias_ci95
-            result['observer_inconsistency_ci95'] = observer_inconsistency_ci95
-        else:
-            del result['observer_bias_ci95']
-            del result['observer_inconsistency_ci95']
-
+        bootstrap_processes = kwargs['bootstrap_processes'] if 'bootstrap_processes' in kwargs \
+            else cls.DEFAULT_BOOTSTRAP_PROCESSES
+        assert bootstrap_processes is None or (isinstance(bootstrap_processes, int) and bootstrap_processes > 0)
+
+        bootstrap_seed = kwargs['bootstrap_seed'] if 'bootstrap_seed' in kwargs else None
+        assert bootstrap_seed is None or isinstance(bootstrap_seed, int)
+        subjects_rngs, dis_videos_rngs = cls._get_bootstrap_rngs(n_bootstrap, bootstrap_seed)
+
+        bootstrap_method = kwargs['bootstrap_method'] if 'bootstrap_method' in kwargs \
+                                                         and kwargs['bootstrap_method'] is not None \
+            else cls.DEFAULT_BOOTSTRAP_METHOD
+        assert bootstrap_method in ['resample', 'weights']
+
+        if bootstrap_method == 'weights':
+
+            if bootstrap_subjects:
+                result['quality_scores_ci95'] = \
+                    cls._bootstrap_subjects_by_weights(dataset_reader, result, n_subj, new_kwargs, subjects_rngs)
+            else:
+                del result['quality_scores_ci95']
+
+            if boostrap_dis_videos:
+                result['observer_bias_ci95'], result['observer_inconsistency_ci95'] = \
+                    cls._boostrap_dis_videos_by_weights(dataset_reader, result, n_disvideo, new_kwargs,
+                                                        dis_videos_rngs)
+            else:
+                del result['observer_bias_ci95']
+                del result['observer_inconsistency_ci95']
+
+            return cls._force_subjbias_zeromean(result, force_subjbias_zeromean)
+
+        # read the opinion scores before the (forked) workers inherit the reader
+        dataset_reader = dataset_reader.view()
+
+        with ProcessExecutor(bootstrap_processes) as executor:
+
+            if bootstrap_subjects:
+                quality_scores_ci95 = \
+                    cls._bootstrap_subjects(dataset_reader, result, n_subj, n_bootstrap, new_kwargs,
+                                            subjects_rngs, executor)
+                result['quality_scores_ci95'] = quality_scores_ci95
+            else:
+                del result['quality_scores_ci95']
+
+            if boostrap_dis_videos:
+                observer_bias_ci95, observer_inconsistency_ci95 = \
+                    cls._boostrap_dis_videos(dataset_reader, result, n_disvideo, n_bootstrap, new_kwargs,
+                                             dis_videos_rngs, executor)
+                result['observer_bias_ci95'] = observer_bias_ci95
+                result['observer_inconsistency_ci95'] = observer_inconsistency_ci95
+            else:
+                del result['observer_bias_ci95']
+                del result['observer_inconsistency_ci95']
+
+        return cls._force_subjbias_zeromean(result, force_subjbias_zeromean)
+
+    @staticmethod
+    def _force_subjbias_zeromean(result, force_subjbias_zeromean):
         if force_subjbias_zeromean is True:
             assert 'quality_scores' in result
             assert 'observer_bias' in result
             mean_b_s = np.mean(result['observer_bias'])
             result['observer_bias'] = list(np.array(result['observer_bias']) - mean_b_s)
             result['quality_scores'] = list(np.array(result['quality_scores']) + mean_b_s)
-
         return result
 
+    @staticmethod
+    def _get_ci95(estimates, bootstrap_estimatess):
+        return [
+            np.array(estimates) - np.percentile(bootstrap_estimatess, 2.5, axis=0),
+            np.percentile(bootstrap_estimatess, 97.5, axis=0) - np.array(estimates)
+        ]
+
+    @staticmethod
+    def _get_bootstrap_rngs(n_bootstrap, bootstrap_seed=None):
+        """
+        Random generators of the subjects' and of the dis videos' replicates,
+        one per replicate, so that each replicate is drawn the same wherever,
+        and in whichever order, it is fitted.
+        """
+        if bootstrap_seed is None:
+            # as np.random.seed(ibootstrap), without touching the global state
+            return [np.random.RandomState(ibootstrap) for ibootstrap in range(n_bootstrap)], \
+                   [np.random.RandomState(ibootstrap) for ibootstrap in range(n_bootstrap)]
+        subjects_seq, dis_videos_seq = np.random.SeedSequence(bootstrap_seed).spawn(2)
+        return [np.random.default_rng(seq) for seq in subjects_seq.spawn(n_bootstrap)], \
+               [np.random.default_rng(seq) for seq in dis_videos_seq.spawn(n_bootstrap)]
+
     @classmethod
-    def _bootstrap_subjects(cls, dataset, result, n_subj, n_bootstrap, kwargs):
-        bootstrap_results = []
-        for ibootstrap in range(n_bootstrap):
-            print(f"Bootstrap with seed {ibootstrap}")
+    def _fit_bootstrap_replicates(cls, get_reader, list_selected, kwargs, executor):
+        """
+        Fit the replicates, the reader of each made by get_reader() from its
+        selected indices. Only the indices are sent to the workers, which
+        inherit everything else from the fork.
+        """
+
+        def fit(ibootstrap_and_selected):
+            ibootstrap, selected = ibootstrap_and_selected
+            if 'display' in kwargs and kwargs['display']:
+                print(f"Bootstrap with seed {ibootstrap}")
+            bootstrap_result = super(BootstrappingMixin, cls). \
+                _run_modeling(get_reader(selected), **kwargs)
+            return {key: bootstrap_result[key] for key in cls.BOOTSTRAP_RESULT_KEYS}
+
+        list_args = list(enumerate(list_selected))
+        if executor is None:
+            return [fit(args) for args in list_args]
+        return executor.map(fit, list_args)
 
-            np.random.seed(ibootstrap)
-            selected_subjects = np.random.choice(range(n_subj), size=n_subj, replace=True)
+    @classmethod
+    def _bootstrap_subjects(cls, dataset_reader, result, n_subj, n_bootstrap, kwargs, rngs=None, executor=None):
+        if rngs is None:
+            rngs, _ = cls._get_bootstrap_rngs(n_bootstrap)
+        list_selected_subjects = [rng.choice(range(n_subj), size=n_subj, replace=True) for rng in rngs]
 
-            select_subj_reader = SelectSubjectRawDatasetReader(
-                dataset, input_dict={'selected_subjects': selected_subjects})
+        def get_reader(selected_subjects):
+            return dataset_reader.view(observer_idxs=selected_subjects)
 
-            bootstrap_result = super(MaximumLikelihoodEstimationModelWithBootstrapping, cls). \
-                _run_modeling(select_subj_reader, **kwargs)
+        bootstrap_results = []
+        for selected_subjects, bootstrap_result in zip(
+                list_selected_subjects,
+                cls._fit_bootstrap_replicates(get_reader, list_selected_subjects, kwargs, executor)):
 
             bootstrap_observer_bias_offset = np.mean(
                 np.array(bootstrap_result['observer_bias']) -
@@ -98,26 +207,35 @@ class MaximumLikelihoodEstimationModelWithBootstrapping(MaximumLikelihoodEstimat
 
             bootstrap_results.append(bootstrap_result)
         bootstrap_quality_scoress = np.array([r['quality_scores'] for r in bootstrap_results])
-        quality_scores_ci95 = [
-            np.array(result['quality_scores']) - np.percentile(bootstrap_quality_scoress, 2.5, axis=0),
-            np.percentile(bootstrap_quality_scoress, 97.5, axis=0) - np.array(result['quality_scores'])
-        ]
+        quality_scores_ci95 = cls._get_ci95(result['quality_scores'], bootstrap_quality_scoress)
         return quality_scores_ci95
 
     @classmethod
-    def _boostrap_dis_videos(cls, dataset, result, n_dis_videos, n_bootstrap, kwargs):
-        bootstrap_results = []
-        for ibootstrap in range(n_bootstrap):
-            print(f"Bootstrap with seed {ibootstrap}")
+    def _bootstrap_subjects_by_weights(cls, dataset_reader, result, n_subj, kwargs, rngs):
+        weights_s = np.array([rng.multinomial(n_subj, [1.0 / n_subj] * n_subj) for rng in rngs])
+        bootstrap_results = cls._run_modeling_weighted_batch(dataset_reader, None, weights_s, result, **kwargs)
+
+        # as in _bootstrap_subjects(), the offset is the mean over the drawn subjects
+        bootstrap_observer_bias_offsets = np.sum(
+            weights_s * (bootstrap_results['observer_bias'] - np.array(result['observer_bias'])), axis=1) / n_subj
+        bootstrap_quality_scoress = \
+            bootstrap_results['quality_scores'] + bootstrap_observer_bias_offsets[:, np.newaxis]
+        quality_scores_ci95 = cls._get_ci95(result['quality_scores'], bootstrap_quality_scoress)
+        return quality_scores_ci95
 
-            np.random.seed(ibootstrap)
-            selected_dis_videos = np.random.choice(range(n_dis_videos), size=n_dis_videos, replace=True)
+    @classmethod
+    def _boostrap_dis_videos(cls, dataset_reader, result, n_dis_videos, n_bootstrap, kwargs, rngs=None, executor=None):
+        if rngs is None:
+            _, rngs = cls._get_bootstrap_rngs(n_bootstrap)
+        list_selected_dis_videos = [rng.choice(range(n_dis_videos), size=n_dis_videos, replace=True) for rng in rngs]
 
-            select_dis_video_reader = SelectDisVideoRawDatasetReader(
-                dataset, input_dict={'selected_dis_videos': selected_dis_videos})
+        def get_reader(selected_dis_videos):
+            return dataset_reader.view(dis_video_idxs=selected_dis_videos)
 
-            bootstrap_result = super(MaximumLikelihoodEstimationModelWithBootstrapping, cls). \
-                _run_modeling(select_dis_video_reader, **kwargs)
+        bootstrap_results = []
+        for selected_dis_videos, bootstrap_result in zip(
+                list_selected_dis_videos,
+                cls._fit_bootstrap_replicates(get_reader, list_selected_dis_videos, kwargs, executor)):
 
             bootstrap_quality_scores_offset = np.mean(
                 np.array(bootstrap_result['quality_scores']) -
@@ -131,19 +249,39 @@ class MaximumLikelihoodEstimationModelWithBootstrapping(MaximumLikelihoodEstimat
 
             bootstrap_results.append(bootstrap_result)
         bootstrap_observer_biass = np.array([r['observer_bias'] for r in bootstrap_results])
-        observer_bias_ci95 = [
-            np.array(result['observer_bias']) - np.percentile(bootstrap_observer_biass, 2.5, axis=0),
-            np.percentile(bootstrap_observer_biass, 97.5, axis=0) - np.array(result['observer_bias'])
-        ]
+        observer_bias_ci95 = cls._get_ci95(result['observer_bias'], bootstrap_observer_biass)
         bootstrap_observer_inconsistencys = np.array([r['observer_inconsistency'] for r in bootstrap_results])
-        observer_inconsistency_ci95 = [
-            np.array(result['observer_inconsistency']) - np.percentile(bootstrap_observer_inconsistencys, 2.5, axis=0),
-            np.percentile(bootstrap_observer_inconsistencys, 97.5, axis=0) - np.array(result['observer_inconsistency'])
-        ]
+        observer_inconsistency_ci95 = cls._get_ci95(result['observer_inconsistency'], bootstrap_observer_inconsistencys)
+        return observer_bias_ci95, observer_inconsistency_ci95
+
+    @classmethod
+    def _boostrap_dis_videos_by_weights(cls, dataset_reader, result, n_dis_videos, kwargs, rngs):
+        weights_e = np.array([rng.multinomial(n_dis_videos, [1.0 / n_dis_videos] * n_dis_videos) for rng in rngs])
+        bootstrap_results = cls._run_modeling_weighted_batch(dataset_reader, weights_e, None, result, **kwargs)
+
+        # as in _boostrap_dis_videos(), the offset is the mean over the drawn videos
+        bootstrap_quality_scores_offsets = np.sum(
+            weights_e * (bootstrap_results['quality_scores'] - np.array(result['quality_scores'])), axis=1) / n_dis_videos
+        bootstrap_observer_biass = \
+            bootstrap_results['observer_bias'] + bootstrap_quality_scores_offsets[:, np.newaxis]
+        observer_bias_ci95 = cls._get_ci95(result['observer_bias'], bootstrap_observer_biass)
+        observer_inconsistency_ci95 = cls._get_ci95(result['observer_inconsistency'],
+                                                    bootstrap_results['observer_inconsistency'])
         return observer_bias_ci95, observer_inconsistency_ci95
 
 
+class MaximumLikelihoodEstimationModelWithBootstrapping(BootstrappingMixin, MaximumLikelihoodEstimationModel):
+
+    TYPE = 'MLE_BSTP'
+    VERSION = MaximumLikelihoodEstimationModel.VERSION + "_0.1"
+
+
 class MaximumLikelihoodEstimationModelContentObliviousWithBootstrapping(MaximumLikelihoodEstimationModelWithBootstrapping):
     TYPE = 'MLE_CO_BSTP' # maximum likelihood estimation (no content modeling) with bootstrapping
     VERSION = MaximumLikelihoodEstimationModelWithBootstrapping.VERSION + "_0.1"
-    mode = 'CONTENT_OBLIVIOUS'
\ No newline at end of file
+    mode = 'CONTENT_OBLIVIOUS'
+
+
+class SubjectMLEModelProjectionSolverWithBootstrapping(BootstrappingMixin, SubjectMLEModelProjectionSolver):
+    TYPE = 'Subject_MLE_Projection_BSTP'
+    VERSION = SubjectMLEModelProjectionSolver.VERSION + "_0.1"
@@ -0,0 +1,1025 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+from sureal.tools.sparse import dense_to_triplets, segment_sum, segment_count, \
+    segment_mean, segment_std
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+def one_or_nan(x):
+    y = np.ones(x.shape)
+    y[np.isnan(x)] = float('nan')
+    return y
+
+
+def sum_over_content_id(xs, cids, num_c):
+    assert len(xs) == len(cids)
+    for cid in set(cids):
+        assert cid in range(num_c), \
+            'content id must be in [0, {num_c}), but is {cid}'.format(num_c=num_c, cid=cid)
+    sums = np.zeros(num_c)
+    for x, cid in zip(xs, cids):
+        sums[cid] += x
+    return sums
+
+
+def std_over_subject_and_content_id(x_es, cids, num_c):
+    assert x_es.shape[0] == len(cids)
+    for cid in set(cids):
+        assert cid in range(num_c), \
+            'content id must be in [0, {num_c}), but is {cid}'.format(num_c=num_c, cid=cid)
+    ls = [[] for _ in range(num_c)]
+    for idx_cid, cid in enumerate(cids):
+        ls[cid] = ls[cid] + list(x_es[idx_cid, :])
+    stds = []
+    for l in ls:
+        stds.append(pd.Series(l).std(ddof=0))
+    return np.array(stds)
+
+
+class _LbfgsStopped(Exception):
+    """ Raised from the L-BFGS-B callback to stop the solve early. """
+    pass
+
+
+class MleEngine(object):
+    """
+    Storage-specific implementation of one belief-propagation sweep of
+    MaximumLikelihoodEstimationModel, i.e. the damped update of b_s, v_s, a_c
+    and x_e, in that order. The iteration loop, convergence check and result
+    assembly stay with the model; an engine only knows how to touch the
+    opinion scores.
+    """
+
+    REFRESH_RATE = 0.1
+    EPSILON = 1e-3
+
+    LBFGS_MAX_ITR = 15000
+    LBFGS_FTOL = 1e-15
+    LBFGS_GTOL = 1e-10
+    LBFGS_MIN_STD = 1e-4
+
+    def __init__(self, content_id_of_dis_videos, num_contents, mode, gradient_method, numerical_pdf):
+        assert mode in ['DEFAULT', 'SUBJECT_OBLIVIOUS', 'CONTENT_OBLIVIOUS']
+        self.content_id_of_dis_videos = list(content_id_of_dis_videos)
+        self.C = num_contents
+        self.mode = mode
+        self.gradient_method = gradient_method
+        self.numerical_pdf = numerical_pdf
+        self.sweep_stats = []
+        self._assert_args()
+
+    def _assert_args(self):
+        pass
+
+    def get_initial_params(self, mos):
+        """
+        Initial x_e, b_s, v_s and a_c: MOS, zero bias, and the std of the
+        residuals against MOS per subject and per content.
+        """
+        raise NotImplementedError
+
+    def sweep(self, x_e, b_s, v_s, a_c):
+        """
+        Run one damped update of all parameters. Return the updated
+        (x_e, b_s, v_s, a_c) and their stds (x_e_std, b_s_std, v_s_std, a_c_std).
+        """
+        raise NotImplementedError
+
+    def profiled_sweep(self, x_e, b_s, v_s, a_c):
+        """
+        Same as sweep(), but also append to self.sweep_stats the wall time of
+        the sweep and the peak memory it allocates (traced by tracemalloc, hence
+        None if something else is tracing already).
+        """
+        tracing = tracemalloc is not None and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        then = time.time()
+        ret = self.sweep(x_e, b_s, v_s, a_c)
+        sec = time.time() - then
+        alloc_bytes = None
+        if tracing:
+            _, alloc_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self.sweep_stats.append({'sec': sec, 'alloc_bytes': alloc_bytes})
+        return ret
+
+    def loglikelihood(self, x_e, b_s, v_s, a_c):
+        """ Total log-likelihood over all observed scores. """
+        raise NotImplementedError
+
+    def loglikelihood_gradient(self, x_e, b_s, v_s, a_c):
+        """
+        Gradient of the gaussian loglikelihood() with respect to x_e, b_s, v_s
+        and a_c. With a_es = x_es - x_e - b_s and d_es = v_s^2 + a_c(e)^2,
+        summing over the observed scores:
+        d/dx_e = sum_s a_es / d_es
+        d/db_s = sum_e a_es / d_es
+        d/dv_s = v_s * sum_e (a_es^2 / d_es^2 - 1 / d_es)
+        d/da_c = a_c * sum_{e:c(e)=c, s} (a_es^2 / d_es^2 - 1 / d_es)
+        """
+        raise NotImplementedError
+
+    def loglikelihood_and_gradient(self, x_e, b_s, v_s, a_c):
+        return self.loglikelihood(x_e, b_s, v_s, a_c), self.loglikelihood_gradient(x_e, b_s, v_s, a_c)
+
+    def solve_lbfgs(self, x_e, b_s, v_s, a_c, callback=None):
+        """
+        Maximize the log-likelihood jointly over all parameters with L-BFGS-B,
+        starting from (x_e, b_s, v_s, a_c), instead of sweeping coordinate-wise.
+        v_s and a_c are bounded to be non-negative, by LBFGS_MIN_STD rather
+        than 0, so that the variance v_s^2 + a_c^2 cannot vanish. The
+        likelihood leaves the offset between x_e and b_s free, so b_s is kept
+        zero-mean explicitly, by optimizing over its first S - 1 entries with
+        the last being minus their sum. Parameters switched off by the mode
+        stay at zero, and those of videos, subjects or contents without any
+        score are NaN.
+
+        callback(itr, (x_e, b_s, v_s, a_c)), if given, is called after each
+        iteration with the current parameters; if it returns True, the solve
+        stops there.
+
+        Return the optimal (x_e, b_s, v_s, a_c) and the number of iterations.
+        """
+
+        E, S, C = self.E, self.S, self.C
+        x_e, b_s, v_s, a_c = [np.array(p, dtype=float) for p in [x_e, b_s, v_s, a_c]]
+        nans = [np.isnan(p) for p in [x_e, b_s, v_s, a_c]]
+        # subjects without any score only enter the zero-mean constraint
+        subjects = np.flatnonzero(self.num_os_per_subject() > 0)
+        nans[1][np.setdiff1d(np.arange(S), subjects)] = True
+        nans[2] |= nans[1]
+        x_e, b_s, v_s, a_c = [np.where(nan, 0.0, p) for p, nan in zip([x_e, b_s, v_s, a_c], nans)]
+
+        with_subject = self.mode != 'SUBJECT_OBLIVIOUS'
+        with_content = self.mode != 'CONTENT_OBLIVIOUS'
+        num_os = float(self.num_os)
+        S_ = len(subjects)
+
+        # start from the zero-mean b_s equivalent of the input
+        mean_b_s = np.mean(b_s[subjects])
+        theta0 = [x_e + mean_b_s]
+        bounds = [(None, None)] * E
+        if with_subject:
+            theta0 += [(b_s - mean_b_s)[subjects[:-1]], v_s[subjects]]
+            bounds += [(None, None)] * (S_ - 1) + [(self.LBFGS_MIN_STD, None)] * S_
+        if with_content:
+            theta0 += [a_c]
+            bounds += [(self.LBFGS_MIN_STD, None)] * C
+        theta0 = np.hstack(theta0)
+
+        def unpack(theta):
+            x_e = theta[:E]
+            b_s = np.zeros(S)
+            v_s = np.zeros(S)
+            if with_subject:
+                b_s[subjects] = np.append(theta[E:E + S_ - 1], -np.sum(theta[E:E + S_ - 1]))
+                v_s[subjects] = theta[E + S_ - 1:E + 2 * S_ - 1]
+            a_c = theta[-C:] if with_content else np.zeros(C)
+            return x_e, b_s, v_s, a_c
+
+        def fun(theta):
+            params = unpack(theta)
+            loglikelihood, (d_x_e, d_b_s, d_v_s, d_a_c) = self.loglikelihood_and_gradient(*params)
+            grad = [d_x_e]
+            if with_subject:
+                grad += [d_b_s[subjects[:-1]] - d_b_s[subjects[-1]], d_v_s[subjects]]
+            if with_content:
+                grad += [d_a_c]
+            # minimize the negative log-likelihood per observation
+            return - loglikelihood / num_os, - np.hstack(grad) / num_os
+
+        def params_of(theta):
+            return tuple(np.where(nan, float('NaN'), p) for p, nan in zip(unpack(theta), nans))
+
+        # the last iterate, kept should the callback stop the solve
+        state = {'itr': 0, 'theta': theta0}
+
+        def iteration_callback(theta):
+            state['itr'] += 1
+            state['theta'] = np.array(theta)
+            if callback is not None and callback(state['itr'], params_of(state['theta'])):
+                raise _LbfgsStopped()
+
+        try:
+            res = minimize(fun, theta0, method='L-BFGS-B', jac=True, bounds=bounds, callback=iteration_callback,
+                           options={'maxiter': self.LBFGS_MAX_ITR, 'maxfun': self.LBFGS_MAX_ITR,
+                                    'ftol': self.LBFGS_FTOL, 'gtol': self.LBFGS_GTOL})
+            state['theta'] = res.x
+        except _LbfgsStopped:
+            pass
+
+        return params_of(state['theta']), state['itr']
+
+    @property
+    def workspace_nbytes(self):
+        """ Bytes held by the engine for the whole solve. """
+        return 0
+
+    @property
+    def num_os(self):
+        """ Number of observed opinion scores. """
+        raise NotImplementedError
+
+    def num_os_per_subject(self):
+        raise NotImplementedError
+
+
+class DenseMleEngine(MleEngine):
+    """
+    Engine working on the dense E x S opinion score matrix, with missing scores
+    padded by NaN. This is the reference implementation.
+    """
+
+    def __init__(self, x_es, content_id_of_dis_videos, num_contents, mode,
+                 gradient_method, numerical_pdf, loglikelihood_fcn):
+        self.x_es = x_es
+        self.E, self.S = x_es.shape
+        self.loglikelihood_fcn = loglikelihood_fcn
+        super(DenseMleEngine, self).__init__(content_id_of_dis_videos, num_contents, mode,
+                                             gradient_method, numerical_pdf)
+
+    def _assert_args(self):
+        assert self.gradient_method in ['simplified', 'original', 'numerical']
+        assert len(self.content_id_of_dis_videos) == self.E
+
+    def get_initial_params(self, mos):
+        x_es = self.x_es
+        E, S, C = self.E, self.S, self.C
+        r_es = x_es - np.tile(mos, (S, 1)).T # r_es: residual at e, s
+        sigma_r_s = pd.DataFrame(r_es).std(axis=0, ddof=0) # along e
+        assert len(sigma_r_s) == S
+        sigma_r_c = std_over_subject_and_content_id(r_es, self.content_id_of_dis_videos, C)
+        assert len(sigma_r_c) == C
+        return mos, np.zeros(S), sigma_r_s, sigma_r_c
+
+    def sweep(self, x_e, b_s, v_s, a_c):
+
+        x_es = self.x_es
+        E, S, C = self.E, self.S, self.C
+        content_id_of_dis_videos = self.content_id_of_dis_videos
+        gradient_method = self.gradient_method
+        numerical_pdf = self.numerical_pdf
+        REFRESH_RATE = self.REFRESH_RATE
+        EPSILON = self.EPSILON
+
+        # ==== (12) b_s ====
+
+        if gradient_method == 'simplified':
+            a_c_e = np.array([a_c[i] for i in content_id_of_dis_videos])
+            num_num = x_es - np.tile(x_e, (S, 1)).T
+            num_den = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+            num = pd.DataFrame(num_num / num_den).sum(axis=0) # sum over e
+            den_num = one_or_nan(x_es) # 1 and nan
+            den_den = num_den
+            den = pd.DataFrame(den_num / den_den).sum(axis=0) # sum over e
+            b_s_new = num / den
+            b_s = b_s * (1.0 - REFRESH_RATE) + b_s_new * REFRESH_RATE
+            b_s_std = 1.0 / np.sqrt(np.maximum(0., den))  # calculate std of x_e
+
+        elif gradient_method == 'original':
+            a_c_e = np.array([a_c[i] for i in content_id_of_dis_videos])
+            vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+            order1 = (x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))) / vs2_add_ace2
+            order1 = pd.DataFrame(order1).sum(axis=0) # sum over e
+            order2 = - one_or_nan(x_es) / vs2_add_ace2
+            order2 = pd.DataFrame(order2).sum(axis=0) # sum over e
+            b_s_new = b_s - order1 / order2
+            b_s = b_s * (1.0 - REFRESH_RATE) + b_s_new * REFRESH_RATE
+            b_s_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of x_e
+
+        elif gradient_method == 'numerical':
+            axis = 0 # sum over e
+            order1 = (self.loglikelihood_fcn(x_es, x_e, b_s + EPSILON / 2.0, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf) -
+                     self.loglikelihood_fcn(x_es, x_e, b_s - EPSILON / 2.0, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON
+            order2 = (self.loglikelihood_fcn(x_es, x_e, b_s + EPSILON, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)
+                              - 2 * self.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)
+                              + self.loglikelihood_fcn(x_es, x_e, b_s - EPSILON, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON**2
+            b_s_new = b_s - order1 / order2
+            b_s = b_s * (1.0 - REFRESH_RATE) + b_s_new * REFRESH_RATE
+            b_s_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of x_e
+
+        else:
+            assert False
+
+        if self.mode == 'SUBJECT_OBLIVIOUS':
+            b_s = np.zeros(S) # forcing zero, hence disabling
+            b_s_std = np.zeros(S)
+
+        # ==== (14) v_s ====
+
+        if gradient_method == 'simplified':
+            a_c_e = np.array([a_c[i] for i in content_id_of_dis_videos])
+            a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
+            vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+            vs2_minus_ace2 = np.tile(v_s**2, (E, 1)) - np.tile(a_c_e**2, (S, 1)).T
+            num = - np.tile(v_s, (E, 1)) / vs2_add_ace2 + np.tile(v_s, (E, 1)) * a_es**2 / vs2_add_ace2**2
+            num = pd.DataFrame(num).sum(axis=0) # sum over e
+            poly_term = np.tile(a_c_e**4, (S, 1)).T \
+                  - 3 * np.tile(v_s**4, (E, 1)) \
+                  - 2 * np.tile(v_s**2, (E, 1)) * np.tile(a_c_e**2, (S, 1)).T
+            den = vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
+            den = pd.DataFrame(den).sum(axis=0) # sum over e
+            v_s_new = v_s - num / den
+            v_s = v_s * (1.0 - REFRESH_RATE) + v_s_new * REFRESH_RATE
+            # calculate std of v_s
+            lpp = pd.DataFrame(
+                vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
+            ).sum(axis=0) # sum over e
+            v_s_std = 1.0 / np.sqrt(np.maximum(0., -lpp))
+
+        elif gradient_method == 'original':
+            a_c_e = np.array([a_c[i] for i in content_id_of_dis_videos])
+            a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
+            vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+            vs2_minus_ace2 = np.tile(v_s**2, (E, 1)) - np.tile(a_c_e**2, (S, 1)).T
+            poly_term = np.tile(a_c_e**4, (S, 1)).T \
+                  - 3 * np.tile(v_s**4, (E, 1)) \
+                  - 2 * np.tile(v_s**2, (E, 1)) * np.tile(a_c_e**2, (S, 1)).T
+            order1 = - np.tile(v_s, (E, 1)) / vs2_add_ace2 + np.tile(v_s, (E, 1)) * a_es**2 / vs2_add_ace2**2
+            order1 = pd.DataFrame(order1).sum(axis=0) # sum over e
+            order2 = vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
+            order2 = pd.DataFrame(order2).sum(axis=0) # sum over e
+            v_s_new = v_s - order1 / order2
+            v_s = v_s * (1.0 - REFRESH_RATE) + v_s_new * REFRESH_RATE
+            v_s_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of v_s
+
+        elif gradient_method == 'numerical':
+            axis = 0 # sum over e
+            order1 = (self.loglikelihood_fcn(x_es, x_e, b_s, v_s + EPSILON / 2.0, a_c, content_id_of_dis_videos, axis, numerical_pdf) -
+                     self.loglikelihood_fcn(x_es, x_e, b_s, v_s - EPSILON / 2.0, a_c, content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON
+            order2 = (self.loglikelihood_fcn(x_es, x_e, b_s, v_s + EPSILON, a_c, content_id_of_dis_videos, axis, numerical_pdf)
+                              - 2 * self.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)
+                              + self.loglikelihood_fcn(x_es, x_e, b_s, v_s - EPSILON, a_c, content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON**2
+            v_s_new = v_s - order1 / order2
+            v_s = v_s * (1.0 - REFRESH_RATE) + v_s_new * REFRESH_RATE
+            v_s_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of v_s
+
+        else:
+            assert False
+
+        # force non-negative
+        v_s = np.maximum(v_s, 0.0 * np.ones(v_s.shape))
+
+        if self.mode == 'SUBJECT_OBLIVIOUS':
+            v_s = np.zeros(S) # forcing zero, hence disabling
+            v_s_std = np.zeros(S)
+
+        # ==== (15) a_c ====
+
+        if gradient_method == 'simplified':
+            a_c_e = np.array([a_c[i] for i in content_id_of_dis_videos])
+            a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
+            vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+            vs2_minus_ace2 = np.tile(v_s**2, (E, 1)) - np.tile(a_c_e**2, (S, 1)).T
+            num = - np.tile(a_c_e, (S, 1)).T / vs2_add_ace2 + np.tile(a_c_e, (S, 1)).T * a_es**2 / vs2_add_ace2**2
+            num = pd.DataFrame(num).sum(axis=1) # sum over s
+            num = sum_over_content_id(num, content_id_of_dis_videos, C)  # sum over e:c(e)=c
+            poly_term = np.tile(v_s**4, (E, 1)) \
+                  - 3 * np.tile(a_c_e**4, (S, 1)).T \
+                  - 2 * np.tile(v_s**2, (E, 1)) * np.tile(a_c_e**2, (S, 1)).T
+            den = - vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
+            den = pd.DataFrame(den).sum(axis=1) # sum over s
+            den = sum_over_content_id(den, content_id_of_dis_videos, C)  # sum over e:c(e)=c
+            # check: 'den' is 0 in test/subjective_model_test.py::SubjectiveModelPartialTest::test_observer_content_aware_subjective_model_nocontent
+            a_c_new = a_c - num / den
+            a_c = a_c * (1.0 - REFRESH_RATE) + a_c_new * REFRESH_RATE
+            # calculate std of a_c
+            lpp = sum_over_content_id(
+                pd.DataFrame(
+                    -vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
+                ).sum(axis=1),
+                content_id_of_dis_videos,
+                C
+            )  # sum over e:c(e)=c
+            # check: max(0, ...) leads to division by zero
+            a_c_std = 1.0 /np.sqrt(np.maximum(0., -lpp))
+
+        elif gradient_method == 'original':
+            a_c_e = np.array([a_c[i] for i in content_id_of_dis_videos])
+            a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
+            vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+            vs2_minus_ace2 = np.tile(v_s**2, (E, 1)) - np.tile(a_c_e**2, (S, 1)).T
+            poly_term = np.tile(v_s**4, (E, 1)) \
+                  - 3 * np.tile(a_c_e**4, (S, 1)).T \
+                  - 2 * np.tile(v_s**2, (E, 1)) * np.tile(a_c_e**2, (S, 1)).T
+            order1 = - np.tile(a_c_e, (S, 1)).T / vs2_add_ace2 + np.tile(a_c_e, (S, 1)).T * a_es**2 / vs2_add_ace2**2
+            order1 = pd.DataFrame(order1).sum(axis=1) # sum over s
+            order1 = sum_over_content_id(order1, content_id_of_dis_videos, C) # sum over e:c(e)=c
+            order2 = - vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
+            order2 = pd.DataFrame(order2).sum(axis=1) # sum over s
+            order2 = sum_over_content_id(order2, content_id_of_dis_videos, C) # sum over e:c(e)=c
+            a_c_new = a_c - order1 / order2
+            a_c = a_c * (1.0 - REFRESH_RATE) + a_c_new * REFRESH_RATE
+            a_c_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of a_c
+
+        elif gradient_method == 'numerical':
+            axis = 1 # sum over s
+            order1 = (self.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c + EPSILON / 2.0, content_id_of_dis_videos, axis, numerical_pdf) -
+                     self.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c - EPSILON / 2.0, content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON
+            order2 = (self.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c + EPSILON, content_id_of_dis_videos, axis, numerical_pdf)
+                              - 2 * self.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)
+                              + self.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c - EPSILON, content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON**2
+            order1 = sum_over_content_id(order1, content_id_of_dis_videos, C) # sum over e:c(e)=c
+            order2 = sum_over_content_id(order2, content_id_of_dis_videos, C) # sum over e:c(e)=c
+            a_c_new = a_c - order1 / order2
+            a_c = a_c * (1.0 - REFRESH_RATE) + a_c_new * REFRESH_RATE
+            a_c_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of a_c
+
+        else:
+            assert False
+
+        # force non-negative
+        a_c = np.maximum(a_c, 0.0 * np.ones(a_c.shape))
+
+        if self.mode == 'CONTENT_OBLIVIOUS':
+            a_c = np.zeros(C) # forcing zero, hence disabling
+            a_c_std = np.zeros(C)
+
+        # (11) ==== x_e ====
+
+        if gradient_method == 'simplified':
+            a_c_e = np.array([a_c[i] for i in content_id_of_dis_videos])
+            num_num = x_es - np.tile(b_s, (E, 1))
+            num_den = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+            num = pd.DataFrame(num_num / num_den).sum(axis=1) # sum over s
+            den_num = one_or_nan(x_es) # 1 and nan
+            den_den = num_den
+            den = pd.DataFrame(den_num / den_den).sum(axis=1) # sum over s
+            x_e_new = num / den
+            x_e = x_e * (1.0 - REFRESH_RATE) + x_e_new * REFRESH_RATE
+            x_e_std = 1.0 / np.sqrt(np.maximum(0., den))  # calculate std of x_e
+
+        elif gradient_method == 'original':
+            a_c_e = np.array([a_c[i] for i in content_id_of_dis_videos])
+            a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
+            vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+            order1 = a_es / vs2_add_ace2
+            order1 = pd.DataFrame(order1).sum(axis=1) # sum over s
+            order2 = - one_or_nan(x_es) / vs2_add_ace2
+            order2 = pd.DataFrame(order2).sum(axis=1) # sum over s
+            x_e_new = x_e - order1 / order2
+            x_e = x_e * (1.0 - REFRESH_RATE) + x_e_new * REFRESH_RATE
+            x_e_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of x_e
+
+        elif gradient_method == 'numerical':
+            axis = 1 # sum over s
+            order1 = (self.loglikelihood_fcn(x_es, x_e + EPSILON / 2.0, b_s, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf) -
+                     self.loglikelihood_fcn(x_es, x_e - EPSILON / 2.0, b_s, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON
+            order2 = (self.loglikelihood_fcn(x_es, x_e + EPSILON, b_s, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)
+                              - 2 * self.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)
+                              + self.loglikelihood_fcn(x_es, x_e - EPSILON, b_s, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON**2
+            x_e_new = x_e - order1 / order2
+            x_e = x_e * (1.0 - REFRESH_RATE) + x_e_new * REFRESH_RATE
+            x_e_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of x_e
+
+        else:
+            assert False
+
+        return (x_e, b_s, v_s, a_c), (x_e_std, b_s_std, v_s_std, a_c_std)
+
+    def loglikelihood(self, x_e, b_s, v_s, a_c):
+        return np.sum(self.loglikelihood_fcn(
+            self.x_es, x_e, b_s, v_s, a_c, self.content_id_of_dis_videos, 1, self.numerical_pdf))
+
+    def loglikelihood_gradient(self, x_e, b_s, v_s, a_c):
+        x_es = self.x_es
+        E, S = self.E, self.S
+        a_c = np.asarray(a_c)
+        a_c_e = a_c[self.content_id_of_dis_videos]
+        a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
+        vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+        order1 = a_es / vs2_add_ace2
+        order2 = order1 ** 2 - 1.0 / vs2_add_ace2
+        d_x_e = np.nansum(order1, axis=1) # sum over s
+        d_b_s = np.nansum(order1, axis=0) # sum over e
+        d_v_s = v_s * np.nansum(order2, axis=0) # sum over e
+        d_a_c = a_c * sum_over_content_id(np.nansum(order2, axis=1), self.content_id_of_dis_videos, self.C) # sum over e:c(e)=c and s
+        return d_x_e, d_b_s, d_v_s, d_a_c
+
+    def loglikelihood_and_gradient(self, x_e, b_s, v_s, a_c):
+        # the gaussian log-likelihood is taken in log domain here, as the pdf
+        # underflows to zero on the small stds the line search may probe
+        x_es = self.x_es
+        E, S = self.E, self.S
+        a_c_e = np.asarray(a_c)[self.content_id_of_dis_videos]
+        a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
+        vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
+        loglikelihood = - 0.5 * np.nansum(np.log(vs2_add_ace2) + a_es**2 / vs2_add_ace2) \
+                        - 0.5 * np.log(2 * np.pi) * self.num_os
+        return loglikelihood, self.loglikelihood_gradient(x_e, b_s, v_s, a_c)
+
+    @property
+    def num_os(self):
+        return np.sum(~np.isnan(self.x_es))
+
+    def num_os_per_subject(self):
+        return np.sum(~np.isnan(self.x_es), axis=0)
+
+    @property
+    def workspace_nbytes(self):
+        return self.x_es.nbytes
+
+
+class InplaceMleEngine(MleEngine):
+    """
+    Engine working on the dense E x S opinion score matrix, like
+    DenseMleEngine, but allocating its E x S workspace buffers once per solve
+    and updating them in place through broadcasting, instead of rebuilding
+    tiled temporaries on every sweep. Missing scores are handled by masking:
+    the weight and residual buffers are multiplied by the 0/1 mask of observed
+    scores, and every other buffer is a product with one of those, so the
+    unobserved cells stay at zero and plain sums are NaN-skipping sums. Sums
+    over e:c(e)=c are a product with the E x C one-hot content matrix.
+
+    x_es may carry leading batch axes, i.e. be of shape (..., E, S), in which
+    case the parameters are of shape (..., E), (..., S) and (..., C) and all
+    problems are swept at once.
+
+    weights_e and weights_s, if given, are nonnegative multiplicities of the
+    videos and of the subjects, e.g. how many times each was drawn by a
+    bootstrap resampling: the fit is then that of x_es with its rows and
+    columns repeated as many times. They may carry batch axes of their own, of shape (..., E)
+    and (..., S), which x_es is broadcast against: a batch of weightings of
+    one opinion score matrix is swept without copying it. Sums over e and s
+    become products with the weights; a video or subject of zero weight is
+    fitted to its own scores, given the others, without affecting them.
+
+    Only the analytic gradient methods ('simplified' and 'original') with the
+    'gaussian' numerical_pdf are supported.
+    """
+
+    def __init__(self, x_es, content_id_of_dis_videos, num_contents, mode,
+                 gradient_method, numerical_pdf, weights_e=None, weights_s=None):
+        self.x_es = np.asarray(x_es, dtype=float)
+        assert self.x_es.ndim >= 2
+        self.E, self.S = self.x_es.shape[-2:]
+        self.weights_e = np.asarray(weights_e, dtype=float) if weights_e is not None else None
+        self.weights_s = np.asarray(weights_s, dtype=float) if weights_s is not None else None
+        super(InplaceMleEngine, self).__init__(content_id_of_dis_videos, num_contents, mode,
+                                               gradient_method, numerical_pdf)
+
+        self.cids_e = np.asarray(self.content_id_of_dis_videos, dtype=np.intp)
+        self.onehot_ec = np.zeros((self.E, self.C))
+        self.onehot_ec[np.arange(self.E), self.cids_e] = 1.0
+
+        observed = ~np.isnan(self.x_es)
+        self._mask = observed.astype(float) # 1 on observed cells, 0 on the others
+        self._unmask = 1.0 - self._mask
+        self._x = np.where(observed, self.x_es, 0.0) # x_es, zero-filled
+        self.cnt_s = self._sum_over_e(self._mask)
+        self.cnt_e = self._sum_over_s(self._mask)
+
+        # workspace, over the batch axes of x_es and of the weights
+        shape = np.broadcast(self.x_es,
+                             self.weights_e[..., :, np.newaxis] if self.weights_e is not None else 1.0,
+                             self.weights_s[..., np.newaxis, :] if self.weights_s is not None else 1.0).shape
+        self._w = np.zeros(shape) # 1 / (v_s^2 + a_c(e)^2), masked
+        self._r = np.zeros(shape) # residual x_es - x_e - b_s (or its square), masked
+        self._t = np.zeros(shape)
+        self._u = np.zeros(shape)
+
+    def _assert_args(self):
+        assert self.gradient_method in ['simplified', 'original'], \
+            'inplace engine only supports analytic gradient_method, but got {}'.format(self.gradient_method)
+        assert self.numerical_pdf == 'gaussian', \
+            'inplace engine only supports gaussian numerical_pdf, but got {}'.format(self.numerical_pdf)
+        assert len(self.content_id_of_dis_videos) == self.E
+        for cid in set(self.content_id_of_dis_videos):
+            assert cid in range(self.C), \
+                'content id must be in [0, {num_c}), but is {cid}'.format(num_c=self.C, cid=cid)
+        assert self.weights_e is None or (self.weights_e.shape[-1] == self.E and np.all(self.weights_e >= 0))
+        assert self.weights_s is None or (self.weights_s.shape[-1] == self.S and np.all(self.weights_s >= 0))
+
+    @property
+    def workspace_nbytes(self):
+        return sum(buf.nbytes for buf in [self._mask, self._unmask, self._x, self.onehot_ec,
+                                          self._w, self._r, self._t, self._u])
+
+    def subset(self, indices):
+        """
+        Engine over the problems selected by indices (or a boolean mask) along
+        the leading batch axis, e.g. to stop sweeping converged ones.
+        """
+        assert self._w.ndim == 3
+
+        def select(xs, ndim):
+            # x_es or weights without the batch axis are shared by all problems
+            return xs[indices] if xs is not None and xs.ndim == ndim else xs
+
+        return InplaceMleEngine(select(self.x_es, 3), self.content_id_of_dis_videos, self.C, self.mode,
+                                self.gradient_method, self.numerical_pdf,
+                                select(self.weights_e, 2), select(self.weights_s, 2))
+
+    @staticmethod
+    def _nan_to_zero(xs):
+        # parameters of videos or subjects without any score are NaN; zero them
+        # before broadcasting, so that NaN * 0 does not leak into the masked cells
+        return np.where(np.isnan(xs), 0.0, xs)
+
+    def _fill_weight(self, v_s, a_c):
+        # _t <- v_s^2 + a_c(e)^2, and 1 on the unobserved cells
+        # _w <- 1 / (v_s^2 + a_c(e)^2), and 0 on the unobserved cells
+        vs2 = self._nan_to_zero(v_s ** 2)
+        ace2 = self._nan_to_zero((a_c ** 2)[..., self.cids_e])
+        np.add(vs2[..., np.newaxis, :], ace2[..., :, np.newaxis], out=self._t)
+        np.multiply(self._t, self._mask, out=self._t)
+        np.add(self._t, self._unmask, out=self._t)
+        np.divide(self._mask, self._t, out=self._w)
+        return vs2, ace2
+
+    def _fill_residual(self, x_e, b_s):
+        # _r <- x_es - x_e - b_s, and 0 on the unobserved cells
+        np.subtract(self._x, self._nan_to_zero(x_e)[..., :, np.newaxis], out=self._r)
+        np.subtract(self._r, self._nan_to_zero(b_s)[..., np.newaxis, :], out=self._r)
+        np.multiply(self._r, self._mask, out=self._r)
+
+    def _sum_over_e(self, xs):
+        if self.weights_e is None:
+            return np.sum(xs, axis=-2)
+        return np.matmul(self.weights_e[..., np.newaxis, :], xs)[..., 0, :]
+
+    def _sum_over_s(self, xs):
+        if self.weights_s is None:
+            return np.sum(xs, axis=-1)
+        return np.matmul(xs, self.weights_s[..., :, np.newaxis])[..., 0]
+
+    def _sum_over_es(self, xs):
+        if self.weights_e is None and self.weights_s is None:
+            return np.sum(xs, axis=(-2, -1))
+        xs = self._sum_over_s(xs)
+        if self.weights_e is not None:
+            xs = xs * self.weights_e
+        return np.sum(xs, axis=-1)
+
+    def _sum_over_content_id(self, xs):
+        # xs is per video, e.g. summed over s already
+        if self.weights_e is not None:
+            xs = xs * self.weights_e
+        return np.dot(xs, self.onehot_ec)
+
+    def get_initial_params(self, mos):
+        mos = np.asarray(mos, dtype=float)
+        mask, r, t = self._mask, self._r, self._t
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._fill_residual(mos, np.zeros(self.cnt_s.shape)) # residual against MOS
+
+            mean_s = self._sum_over_e(r) / self.cnt_s
+            np.subtract(r, self._nan_to_zero(mean_s)[..., np.newaxis, :], out=t)
+            np.multiply(t, mask, out=t)
+            np.square(t, out=t)
+            sigma_r_s = np.sqrt(self._sum_over_e(t) / self.cnt_s)
+
+            cnt_c = self._sum_over_content_id(self.cnt_e)
+            mean_c = self._sum_over_content_id(self._sum_over_s(r)) / cnt_c
+            np.subtract(r, self._nan_to_zero(mean_c[..., self.cids_e])[..., :, np.newaxis], out=t)
+            np.multiply(t, mask, out=t)
+            np.square(t, out=t)
+            sigma_r_c = np.sqrt(self._sum_over_content_id(self._sum_over_s(t)) / cnt_c)
+
+        return mos, np.zeros(mean_s.shape), sigma_r_s, sigma_r_c
+
+    def sweep(self, x_e, b_s, v_s, a_c):
+
+        x, w, r, t, u = self._x, self._w, self._r, self._t, self._u
+        REFRESH_RATE = self.REFRESH_RATE
+        x_e, b_s, v_s, a_c = np.asarray(x_e), np.asarray(b_s), np.asarray(v_s), np.asarray(a_c)
+
+        # ==== (12) b_s ====
+
+        vs2, ace2 = self._fill_weight(v_s, a_c)
+        den = self._sum_over_e(w) # sum over e
+        if self.gradient_method == 'simplified':
+            np.subtract(x, self._nan_to_zero(x_e)[..., :, np.newaxis], out=t)
+            np.multiply(t, w, out=t)
+            b_s_new = self._sum_over_e(t) / den # sum over e
+        else:
+            self._fill_residual(x_e, b_s)
+            np.multiply(r, w, out=t)
+            b_s_new = b_s + self._sum_over_e(t) / den # sum over e
+        b_s = b_s * (1.0 - REFRESH_RATE) + b_s_new * REFRESH_RATE
+        b_s_std = 1.0 / np.sqrt(np.maximum(0., den))
+
+        if self.mode == 'SUBJECT_OBLIVIOUS':
+            b_s = np.zeros(b_s.shape) # forcing zero, hence disabling
+            b_s_std = np.zeros(b_s.shape)
+
+        # ==== (14) v_s ====
+
+        # the weights are unchanged, as v_s and a_c are not updated yet
+        self._fill_residual(x_e, b_s)
+        np.square(r, out=r) # r now holds the squared residual
+        # first order: v_s * (a_es^2 / (v_s^2 + a_c^2)^2 - 1 / (v_s^2 + a_c^2))
+        np.multiply(r, w, out=t)
+        np.multiply(t, w, out=t)
+        np.subtract(t, w, out=t)
+        num = v_s * self._sum_over_e(t) # sum over e
+        # second order: ((v_s^2 - a_c^2) + a_es^2 * (a_c^2 - 3 v_s^2) / (v_s^2 + a_c^2)) / (v_s^2 + a_c^2)^2
+        np.subtract(ace2[..., :, np.newaxis], 3.0 * vs2[..., np.newaxis, :], out=u)
+        np.multiply(u, r, out=u)
+        np.multiply(u, w, out=u)
+        np.subtract(vs2[..., np.newaxis, :], ace2[..., :, np.newaxis], out=t)
+        np.add(t, u, out=t)
+        np.multiply(t, w, out=t)
+        np.multiply(t, w, out=t)
+        lpp = self._sum_over_e(t) # sum over e
+        v_s_new = v_s - num / lpp
+        v_s = v_s * (1.0 - REFRESH_RATE) + v_s_new * REFRESH_RATE
+        v_s_std = 1.0 / np.sqrt(np.maximum(0., -lpp))
+
+        # force non-negative
+        v_s = np.maximum(v_s, 0.0)
+
+        if self.mode == 'SUBJECT_OBLIVIOUS':
+            v_s = np.zeros(v_s.shape) # forcing zero, hence disabling
+            v_s_std = np.zeros(v_s.shape)
+
+        # ==== (15) a_c ====
+
+        # the squared residual is unchanged, as x_e and b_s are not updated
+        vs2, ace2 = self._fill_weight(v_s, a_c)
+        # first order: a_c * (a_es^2 / (v_s^2 + a_c^2)^2 - 1 / (v_s^2 + a_c^2))
+        np.multiply(r, w, out=t)
+        np.multiply(t, w, out=t)
+        np.subtract(t, w, out=t)
+        num = a_c * self._sum_over_content_id(self._sum_over_s(t)) # sum over e:c(e)=c and s
+        # second order: ((a_c^2 - v_s^2) + a_es^2 * (v_s^2 - 3 a_c^2) / (v_s^2 + a_c^2)) / (v_s^2 + a_c^2)^2
+        np.subtract(vs2[..., np.newaxis, :], 3.0 * ace2[..., :, np.newaxis], out=u)
+        np.multiply(u, r, out=u)
+        np.multiply(u, w, out=u)
+        np.subtract(ace2[..., :, np.newaxis], vs2[..., np.newaxis, :], out=t)
+        np.add(t, u, out=t)
+        np.multiply(t, w, out=t)
+        np.multiply(t, w, out=t)
+        lpp = self._sum_over_content_id(self._sum_over_s(t)) # sum over e:c(e)=c and s
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a_c_new = a_c - num / lpp
+        a_c = a_c * (1.0 - REFRESH_RATE) + a_c_new * REFRESH_RATE
+        with np.errstate(divide='ignore'):
+            a_c_std = 1.0 / np.sqrt(np.maximum(0., -lpp))
+
+        # force non-negative
+        a_c = np.maximum(a_c, 0.0)
+
+        if self.mode == 'CONTENT_OBLIVIOUS':
+            a_c = np.zeros(a_c.shape) # forcing zero, hence disabling
+            a_c_std = np.zeros(a_c.shape)
+
+        # (11) ==== x_e ====
+
+        self._fill_weight(v_s, a_c)
+        den = self._sum_over_s(w) # sum over s
+        if self.gradient_method == 'simplified':
+            np.subtract(x, self._nan_to_zero(b_s)[..., np.newaxis, :], out=t)
+            np.multiply(t, w, out=t)
+            x_e_new = self._sum_over_s(t) / den # sum over s
+        else:
+            self._fill_residual(x_e, b_s)
+            np.multiply(r, w, out=t)
+            x_e_new = x_e + self._sum_over_s(t) / den # sum over s
+        x_e = x_e * (1.0 - REFRESH_RATE) + x_e_new * REFRESH_RATE
+        x_e_std = 1.0 / np.sqrt(np.maximum(0., den))
+
+        return (x_e, b_s, v_s, a_c), (x_e_std, b_s_std, v_s_std, a_c_std)
+
+    def loglikelihood(self, x_e, b_s, v_s, a_c):
+        """
+        Total log-likelihood over all observed scores; one per problem if
+        x_es carries batch axes.
+        """
+        w, r, t = self._w, self._r, self._t
+        x_e, b_s, v_s, a_c = np.asarray(x_e), np.asarray(b_s), np.asarray(v_s), np.asarray(a_c)
+        self._fill_weight(v_s, a_c)
+        self._fill_residual(x_e, b_s)
+        # log N(x; mu, sigma) = - 0.5 * log(sigma^2) - 0.5 * (x - mu)^2 / sigma^2 - 0.5 * log(2 * pi),
+        # where t holds sigma^2 on the observed cells and 1 on the others
+        np.log(t, out=t)
+        np.square(r, out=r)
+        np.multiply(r, w, out=r)
+        np.add(t, r, out=t)
+        return - 0.5 * self._sum_over_es(t) - 0.5 * np.log(2 * np.pi) * self.num_os
+
+    def loglikelihood_gradient(self, x_e, b_s, v_s, a_c):
+        w, r, t = self._w, self._r, self._t
+        x_e, b_s, v_s, a_c = np.asarray(x_e), np.asarray(b_s), np.asarray(v_s), np.asarray(a_c)
+        self._fill_weight(v_s, a_c)
+        self._fill_residual(x_e, b_s)
+        np.multiply(r, w, out=r) # a_es / (v_s^2 + a_c^2)
+        d_x_e = self._sum_over_s(r) # sum over s
+        d_b_s = self._sum_over_e(r) # sum over e
+        np.square(r, out=t)
+        np.subtract(t, w, out=t)
+        d_v_s = v_s * self._sum_over_e(t) # sum over e
+        d_a_c = a_c * self._sum_over_content_id(self._sum_over_s(t)) # sum over e:c(e)=c and s
+        # each video's (subject's) own terms count as many times as its weight
+        if self.weights_e is not None:
+            d_x_e = d_x_e * self.weights_e
+        if self.weights_s is not None:
+            d_b_s, d_v_s = d_b_s * self.weights_s, d_v_s * self.weights_s
+        return d_x_e, d_b_s, d_v_s, d_a_c
+
+    @property
+    def num_os(self):
+        return self._sum_over_es(self._mask)
+
+    def num_os_per_subject(self):
+        return self.cnt_s
+
+
+class SparseMleEngine(MleEngine):
+    """
+    Engine working on the list of observed (dis_video, subject, score)
+    triplets only, in COO layout. Sums over videos, subjects and content ids
+    become segment reductions (np.bincount), so both memory and work scale with
+    the number of ratings rather than with E x S. Suited for crowdsourced
+    studies where most of the E x S cells are empty.
+
+    If free_params is set to a tuple of boolean masks over videos, subjects and
+    contents, sweep() only updates the x_e, b_s (and v_s) and a_c under the
+    masks, and holds the others fixed, e.g. to refine the parameters touched by
+    new ratings on the triplets involving them only.
+
+    Only the analytic gradient methods ('simplified' and 'original') with the
+    'gaussian' numerical_pdf are supported.
+    """
+
+    def __init__(self, rows, cols, vals, shape, content_id_of_dis_videos, num_contents, mode,
+                 gradient_method, numerical_pdf):
+        self.free_params = None
+        self.E, self.S = shape
+        self.rows = np.asarray(rows, dtype=np.intp)
+        self.cols = np.asarray(cols, dtype=np.intp)
+        self.vals = np.asarray(vals, dtype=float)
+        super(SparseMleEngine, self).__init__(content_id_of_dis_videos, num_contents, mode,
+                                              gradient_method, numerical_pdf)
+        # content id of each observation, for segment sums over e:c(e)=c
+        self.cids_e = np.asarray(self.content_id_of_dis_videos, dtype=np.intp)
+        self.cids = self.cids_e[self.rows]
+
+    @classmethod
+    def from_opinion_score_2darray(cls, x_es, *args, **kwargs):
+        rows, cols, vals = dense_to_triplets(x_es)
+        return cls(rows, cols, vals, x_es.shape, *args, **kwargs)
+
+    def _assert_args(self):
+        assert self.gradient_method in ['simplified', 'original'], \
+            'sparse engine only supports analytic gradient_method, but got {}'.format(self.gradient_method)
+        assert self.numerical_pdf == 'gaussian', \
+            'sparse engine only supports gaussian numerical_pdf, but got {}'.format(self.numerical_pdf)
+        assert len(self.rows) == len(self.cols) == len(self.vals)
+        assert len(self.content_id_of_dis_videos) == self.E
+        assert not np.any(np.isnan(self.vals))
+        for cid in set(self.content_id_of_dis_videos):
+            assert cid in range(self.C), \
+                'content id must be in [0, {num_c}), but is {cid}'.format(num_c=self.C, cid=cid)
+
+    def get_initial_params(self, mos):
+        mos = np.asarray(mos, dtype=float)
+        r = self.vals - mos[self.rows] # residual of each observation
+        sigma_r_s = segment_std(self.cols, r, self.S, ddof=0)
+        sigma_r_c = segment_std(self.cids, r, self.C, ddof=0)
+        return mos, np.zeros(self.S), sigma_r_s, sigma_r_c
+
+    @staticmethod
+    def _hold(xs, xs_prev, free):
+        return xs if free is None else np.where(free, xs, xs_prev)
+
+    def sweep(self, x_e, b_s, v_s, a_c):
+
+        rows, cols, cids, vals = self.rows, self.cols, self.cids, self.vals
+        E, S, C = self.E, self.S, self.C
+        REFRESH_RATE = self.REFRESH_RATE
+        x_e, b_s, v_s, a_c = np.asarray(x_e), np.asarray(b_s), np.asarray(v_s), np.asarray(a_c)
+        free_e, free_s, free_c = self.free_params if self.free_params is not None else (None, None, None)
+
+        x_e_prev, b_s_prev, v_s_prev, a_c_prev = x_e, b_s, v_s, a_c
+
+        # ==== (12) b_s ====
+
+        ace2 = (a_c ** 2)[cids]
+        vs2_add_ace2 = (v_s ** 2)[cols] + ace2
+        den = segment_sum(cols, 1.0 / vs2_add_ace2, S) # sum over e
+        if self.gradient_method == 'simplified':
+            num = segment_sum(cols, (vals - x_e[rows]) / vs2_add_ace2, S) # sum over e
+            b_s_new = num / den
+        else:
+            order1 = segment_sum(cols, (vals - x_e[rows] - b_s[cols]) / vs2_add_ace2, S) # sum over e
+            b_s_new = b_s + order1 / den
+        b_s = b_s * (1.0 - REFRESH_RATE) + b_s_new * REFRESH_RATE
+        b_s_std = 1.0 / np.sqrt(np.maximum(0., den))
+
+        if self.mode == 'SUBJECT_OBLIVIOUS':
+            b_s = np.zeros(S) # forcing zero, hence disabling
+            b_s_std = np.zeros(S)
+
+        b_s = self._hold(b_s, b_s_prev, free_s)
+
+        # ==== (14) v_s ====
+
+        v = v_s[cols]
+        vs2 = v ** 2
+        a_es2 = (vals - x_e[rows] - b_s[cols]) ** 2
+        vs2_add_ace2 = vs2 + ace2
+        vs2_minus_ace2 = vs2 - ace2
+        num = segment_sum(cols, - v / vs2_add_ace2 + v * a_es2 / vs2_add_ace2**2, S) # sum over e
+        poly_term = ace2**2 - 3 * vs2**2 - 2 * vs2 * ace2
+        lpp = segment_sum(cols, vs2_minus_ace2 / vs2_add_ace2**2 + a_es2 * poly_term / vs2_add_ace2**4, S) # sum over e
+        v_s_new = v_s - num / lpp
+        v_s = v_s * (1.0 - REFRESH_RATE) + v_s_new * REFRESH_RATE
+        v_s_std = 1.0 / np.sqrt(np.maximum(0., -lpp))
+
+        # force non-negative
+        v_s = np.maximum(v_s, 0.0)
+
+        if self.mode == 'SUBJECT_OBLIVIOUS':
+            v_s = np.zeros(S) # forcing zero, hence disabling
+            v_s_std = np.zeros(S)
+
+        v_s = self._hold(v_s, v_s_prev, free_s)
+
+        # ==== (15) a_c ====
+
+        ace = a_c[cids]
+        vs2 = (v_s ** 2)[cols]
+        vs2_add_ace2 = vs2 + ace2
+        vs2_minus_ace2 = vs2 - ace2
+        num = segment_sum(cids, - ace / vs2_add_ace2 + ace * a_es2 / vs2_add_ace2**2, C) # sum over e:c(e)=c and s
+        poly_term = vs2**2 - 3 * ace2**2 - 2 * vs2 * ace2
+        lpp = segment_sum(cids, - vs2_minus_ace2 / vs2_add_ace2**2 + a_es2 * poly_term / vs2_add_ace2**4, C) # sum over e:c(e)=c and s
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a_c_new = a_c - num / lpp
+        a_c = a_c * (1.0 - REFRESH_RATE) + a_c_new * REFRESH_RATE
+        with np.errstate(divide='ignore'):
+            a_c_std = 1.0 / np.sqrt(np.maximum(0., -lpp))
+
+        # force non-negative
+        a_c = np.maximum(a_c, 0.0)
+
+        if self.mode == 'CONTENT_OBLIVIOUS':
+            a_c = np.zeros(C) # forcing zero, hence disabling
+            a_c_std = np.zeros(C)
+
+        a_c = self._hold(a_c, a_c_prev, free_c)
+
+        # (11) ==== x_e ====
+
+        vs2_add_ace2 = (v_s ** 2)[cols] + (a_c ** 2)[cids]
+        den = segment_sum(rows, 1.0 / vs2_add_ace2, E) # sum over s
+        if self.gradient_method == 'simplified':
+            num = segment_sum(rows, (vals - b_s[cols]) / vs2_add_ace2, E) # sum over s
+            x_e_new = num / den
+        else:
+            order1 = segment_sum(rows, (vals - x_e[rows] - b_s[cols]) / vs2_add_ace2, E) # sum over s
+            x_e_new = x_e + order1 / den
+        x_e = x_e * (1.0 - REFRESH_RATE) + x_e_new * REFRESH_RATE
+        x_e_std = 1.0 / np.sqrt(np.maximum(0., den))
+
+        x_e = self._hold(x_e, x_e_prev, free_e)
+
+        return (x_e, b_s, v_s, a_c), (x_e_std, b_s_std, v_s_std, a_c_std)
+
+    def loglikelihood(self, x_e, b_s, v_s, a_c):
+        x_e, b_s, v_s, a_c = np.asarray(x_e), np.asarray(b_s), np.asarray(v_s), np.asarray(a_c)
+        vs2_add_ace2 = (v_s ** 2)[self.cols] + (a_c ** 2)[self.cids]
+        a_es = self.vals - x_e[self.rows] - b_s[self.cols]
+        # in log domain, as in InplaceMleEngine.loglikelihood()
+        return - 0.5 * np.sum(np.log(vs2_add_ace2) + a_es ** 2 / vs2_add_ace2) \
+               - 0.5 * np.log(2 * np.pi) * len(self.vals)
+
+    def loglikelihood_gradient(self, x_e, b_s, v_s, a_c):
+        rows, cols, cids = self.rows, self.cols, self.cids
+        x_e, b_s, v_s, a_c = np.asarray(x_e), np.asarray(b_s), np.asarray(v_s), np.asarray(a_c)
+        vs2_add_ace2 = (v_s ** 2)[cols] + (a_c ** 2)[cids]
+        order1 = (self.vals - x_e[rows] - b_s[cols]) / vs2_add_ace2
+        order2 = order1 ** 2 - 1.0 / vs2_add_ace2
+        d_x_e = segment_sum(rows, order1, self.E) # sum over s
+        d_b_s = segment_sum(cols, order1, self.S) # sum over e
+        d_v_s = v_s * segment_sum(cols, order2, self.S) # sum over e
+        d_a_c = a_c * segment_sum(cids, order2, self.C) # sum over e:c(e)=c and s
+        return d_x_e, d_b_s, d_v_s, d_a_c
+
+    @property
+    def num_os(self):
+        return len(self.vals)
+
+    def num_os_per_subject(self):
+        return segment_count(self.cols, self.S)
+
+    @property
+    def workspace_nbytes(self):
+        return sum(arr.nbytes for arr in [self.rows, self.cols, self.vals, self.cids])
+
+    def mos(self):
+        return segment_mean(self.rows, self.vals, self.E)
@@ -0,0 +1,274 @@
+import numpy as np
+
+from sureal.mle_engine import SparseMleEngine
+from sureal.tools.sparse import segment_mean
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+class OnlineMaximumLikelihoodEstimator(object):
+    """
+    Incremental estimator of the MaximumLikelihoodEstimationModel parameters,
+    for ratings arriving in batches, e.g. from a crowdsourcing pipeline, instead
+    of a complete dataset.
+
+    Each batch passed to ingest() is appended to the (dis_video, subject,
+    score) triplets, and followed by num_local_sweeps damped sweeps on the
+    triplets of the videos and subjects it touches, updating their x_e, b_s
+    and v_s only; every other parameter, and the content ambiguities a_c, are
+    held fixed. refresh() runs the full solve over all the triplets, warm
+    started from the current x_e and b_s, until the change of x_e falls under
+    delta_thr; it is also run on the first batch and, if refresh_every is set,
+    every time that many ratings came in since the last one.
+
+    Dis videos are passed in the dataset format, i.e. as dicts with 'asset_id',
+    'content_id' and 'os', the latter a dict of new scores keyed by subject (or
+    a list, keyed by position). A new score of a subject for a video replaces
+    the previous one. The current estimates can be read at any time, in the
+    order of asset_ids and observers, with the observer biases made zero-mean.
+
+    >>> estimator = OnlineMaximumLikelihoodEstimator(mode='CONTENT_OBLIVIOUS')
+    >>> estimator.ingest([{'asset_id': 0, 'content_id': 0, 'os': {'Tom': 3, 'Jerry': 4}},
+    ...                   {'asset_id': 1, 'content_id': 0, 'os': {'Tom': 2, 'Jerry': 4}}])
+    >>> estimator.observers
+    ['Tom', 'Jerry']
+    >>> estimator.num_ratings
+    4
+    >>> estimator.ingest([{'asset_id': 1, 'content_id': 0, 'os': {'Pinokio': 1}}])
+    >>> estimator.asset_ids
+    [0, 1]
+    >>> len(estimator.observer_bias)
+    3
+    """
+
+    DEFAULT_NUM_LOCAL_SWEEPS = 20
+    DEFAULT_DELTA_THR = 1e-8
+    MAX_ITR = 10000
+
+    # with few ratings, a subject's (or content's) residuals may be fitted
+    # exactly, which would drive its std, and the variance, to zero
+    MIN_STD = 1e-2
+
+    def __init__(self, mode='DEFAULT', num_local_sweeps=DEFAULT_NUM_LOCAL_SWEEPS, refresh_every=None,
+                 delta_thr=DEFAULT_DELTA_THR, gradient_method='simplified'):
+        assert mode in ['DEFAULT', 'SUBJECT_OBLIVIOUS', 'CONTENT_OBLIVIOUS']
+        assert num_local_sweeps >= 0
+        assert refresh_every is None or refresh_every > 0
+        self.mode = mode
+        self.num_local_sweeps = num_local_sweeps
+        self.refresh_every = refresh_every
+        self.delta_thr = delta_thr
+        self.gradient_method = gradient_method
+
+        self._asset_ids = []
+        self._observers = []
+        self._row_of_asset_id = dict()
+        self._col_of_observer = dict()
+        self.content_id_of_dis_videos = []
+
+        self._rows = np.zeros(0, dtype=np.intp)
+        self._cols = np.zeros(0, dtype=np.intp)
+        self._vals = np.zeros(0)
+        self._position = dict() # (row, col) -> position in the triplets
+
+        self._x_e = np.zeros(0)
+        self._b_s = np.zeros(0)
+        self._v_s = np.zeros(0)
+        self._a_c = np.zeros(0)
+
+        self.num_ratings_since_refresh = 0
+        self.num_refreshes = 0
+
+    @property
+    def num_ratings(self):
+        return len(self._vals)
+
+    @property
+    def asset_ids(self):
+        return list(self._asset_ids)
+
+    @property
+    def observers(self):
+        return list(self._observers)
+
+    @property
+    def quality_scores(self):
+        return list(self._x_e + self._get_mean_b_s())
+
+    @property
+    def observer_bias(self):
+        return list(self._b_s - self._get_mean_b_s())
+
+    @property
+    def observer_inconsistency(self):
+        return list(self._v_s)
+
+    @property
+    def content_ambiguity(self):
+        return list(self._a_c)
+
+    def _get_mean_b_s(self):
+        return np.mean(self._b_s) if len(self._b_s) > 0 else 0.0
+
+    def _get_engine(self, mask=None):
+        rows, cols, vals = self._rows, self._cols, self._vals
+        if mask is not None:
+            rows, cols, vals = rows[mask], cols[mask], vals[mask]
+        return SparseMleEngine(rows, cols, vals, (len(self._asset_ids), len(self._observers)),
+                               self.content_id_of_dis_videos, len(self._a_c), self.mode,
+                               self.gradient_method, 'gaussian')
+
+    def _add_dis_video(self, asset_id, content_id):
+        if asset_id in self._row_of_asset_id:
+            row = self._row_of_asset_id[asset_id]
+            assert self.content_id_of_dis_videos[row] == content_id, \
+                'asset_id {} was ingested with content_id {}, but now has {}'.format(
+                    asset_id, self.content_id_of_dis_videos[row], content_id)
+            return row
+        row = len(self._asset_ids)
+        self._asset_ids.append(asset_id)
+        self._row_of_asset_id[asset_id] = row
+        self.content_id_of_dis_videos.append(content_id)
+        self._x_e = np.append(self._x_e, float('NaN'))
+        if content_id >= len(self._a_c):
+            # new contents start from the average ambiguity so far
+            a_c = np.nanmean(self._a_c) if np.any(~np.isnan(self._a_c)) else 0.0
+            self._a_c = np.append(self._a_c, [a_c] * (content_id + 1 - len(self._a_c)))
+        return row
+
+    def _add_observer(self, observer):
+        if observer in self._col_of_observer:
+            return self._col_of_observer[observer]
+        col = len(self._observers)
+        self._observers.append(observer)
+        self._col_of_observer[observer] = col
+        # new subjects start unbiased, with the average inconsistency so far
+        v_s = np.nanmean(self._v_s) if np.any(~np.isnan(self._v_s)) else 0.0
+        self._b_s = np.append(self._b_s, 0.0)
+        self._v_s = np.append(self._v_s, v_s)
+        return col
+
+    def ingest(self, dis_videos):
+        """
+        Add a batch of ratings, and update the estimates: by a full refresh()
+        on the first batch, or when refresh_every ratings are due, and by
+        num_local_sweeps local sweeps otherwise.
+        """
+
+        rows, cols, vals = [], [], []
+        for dis_video in dis_videos:
+            assert 'asset_id' in dis_video and 'content_id' in dis_video and 'os' in dis_video
+            assert dis_video['content_id'] >= 0
+            row = self._add_dis_video(dis_video['asset_id'], dis_video['content_id'])
+            os = dis_video['os']
+            items = os.items() if isinstance(os, dict) else enumerate(os)
+            for observer, score in items:
+                if score is None or np.isnan(score):
+                    continue
+                rows.append(row)
+                cols.append(self._add_observer(observer))
+                vals.append(float(score))
+
+        new_rows, new_cols, new_vals = [], [], []
+        for row, col, val in zip(rows, cols, vals):
+            if (row, col) in self._position:
+                position = self._position[(row, col)]
+                if position < len(self._vals):
+                    self._vals[position] = val
+                else:
+                    new_vals[position - len(self._vals)] = val
+            else:
+                self._position[(row, col)] = len(self._vals) + len(new_vals)
+                new_rows.append(row)
+                new_cols.append(col)
+                new_vals.append(val)
+        self._rows = np.append(self._rows, np.array(new_rows, dtype=np.intp))
+        self._cols = np.append(self._cols, np.array(new_cols, dtype=np.intp))
+        self._vals = np.append(self._vals, new_vals)
+
+        self.num_ratings_since_refresh += len(vals)
+
+        if self.num_refreshes == 0 or \
+                (self.refresh_every is not None and self.num_ratings_since_refresh >= self.refresh_every):
+            self.refresh()
+        elif len(vals) > 0:
+            self._local_update(np.unique(rows), np.unique(cols))
+
+    def _local_update(self, rows, cols):
+        E, S = len(self._asset_ids), len(self._observers)
+        free_e = np.zeros(E, dtype=bool)
+        free_e[rows] = True
+        free_s = np.zeros(S, dtype=bool)
+        free_s[cols] = True
+        if self.mode == 'SUBJECT_OBLIVIOUS':
+            free_s[:] = False
+
+        # every rating of the touched videos and subjects, so that their
+        # updates are exact given the parameters held fixed
+        mask = free_e[self._rows] | free_s[self._cols]
+        engine = self._get_engine(mask)
+        engine.free_params = (free_e, free_s, np.zeros(len(self._a_c), dtype=bool))
+
+        # new videos start from the mean of their bias-corrected scores
+        new_e = np.isnan(self._x_e)
+        if np.any(new_e):
+            x_e = segment_mean(engine.rows, engine.vals - self._b_s[engine.cols], E)
+            self._x_e = np.where(new_e, x_e, self._x_e)
+
+        params = (self._x_e, self._b_s, self._v_s, self._a_c)
+        for _ in range(self.num_local_sweeps):
+            params_prev = params
+            params, _ = engine.sweep(*params)
+            params = self._sanitize(params, params_prev)
+        self._x_e, self._b_s, self._v_s, self._a_c = params
+
+    def _sanitize(self, params, params_prev):
+        # keep the previous value where the damped Newton step blew up, which
+        # the few ratings of a new subject or video may cause, and floor the stds
+        params = [np.where(np.isnan(p_prev) | np.isfinite(p), p, p_prev) for p, p_prev in zip(params, params_prev)]
+        x_e, b_s, v_s, a_c = params
+        with np.errstate(invalid='ignore'):
+            if self.mode != 'SUBJECT_OBLIVIOUS':
+                v_s = np.where(v_s < self.MIN_STD, self.MIN_STD, v_s)
+            else:
+                a_c = np.where(a_c < self.MIN_STD, self.MIN_STD, a_c)
+        return x_e, b_s, v_s, a_c
+
+    def refresh(self):
+        """
+        Solve over all the ratings so far, warm started from the current x_e
+        and b_s (or from the MOS, on the first call). Return the number of
+        sweeps.
+        """
+
+        engine = self._get_engine()
+
+        # the stds restart from their initial values, as those fitted to the
+        # few ratings of earlier batches may be stuck at MIN_STD
+        x_e, b_s, v_s, a_c = engine.get_initial_params(engine.mos())
+        if self.num_refreshes > 0:
+            x_e = np.where(np.isnan(self._x_e), x_e, self._x_e)
+            b_s = self._b_s
+        if self.mode == 'SUBJECT_OBLIVIOUS':
+            b_s, v_s = np.zeros(engine.S), np.zeros(engine.S)
+        if self.mode == 'CONTENT_OBLIVIOUS':
+            a_c = np.zeros(engine.C)
+
+        params = self._sanitize((x_e, b_s, v_s, a_c), (x_e, b_s, v_s, a_c))
+
+        itr = 0
+        while True:
+            params_prev = params
+            params, _ = engine.sweep(*params)
+            params = self._sanitize(params, params_prev)
+            x_e, x_e_prev = params[0], params_prev[0]
+            itr += 1
+            # videos without any rating yet stay NaN
+            if np.sqrt(np.nansum((x_e_prev - x_e) ** 2)) < self.delta_thr or itr >= self.MAX_ITR:
+                break
+
+        self._x_e, self._b_s, self._v_s, self._a_c = params
+        self.num_ratings_since_refresh = 0
+        self.num_refreshes += 1
+        return itr
@@ -1,5 +1,4 @@
 import sys
-import time
 from functools import partial
 
 import numpy as np
@@ -9,6 +8,7 @@ from scipy.stats import norm
 
 from sureal.subjective_model import SubjectiveModel
 from sureal.dataset_reader import PairedCompDatasetReader
+from sureal.tools.trace import IterationTrace
 
 __copyright__ = "Copyright 2016-2019, Netflix, Inc."
 __license__ = "Apache, Version 2.0"
@@ -131,6 +131,9 @@ class BradleyTerryNewtonRaphsonPairedCompSubjectiveModel(PairedCompSubjectiveMod
 
         DELTA_THR = 1e-8
 
+        # Newton-Raphson converges in a few iterations; the trace grows if not
+        trace = IterationTrace.from_kwargs(['change', 'x_e'], 100, kwargs)
+
         while linalg.norm(change) > DELTA_THR:
             iteration += 1
             pi = np.exp(gamma)
@@ -151,10 +154,10 @@ class BradleyTerryNewtonRaphsonPairedCompSubjectiveModel(PairedCompSubjectiveMod
             change = np.hstack([change, np.array([0])])
             gamma -= change
 
-            msg = 'Iteration {itr:4d}: change {change}, mean x_e {x_e}'.format(itr=iteration, change=linalg.norm(change), x_e=np.mean(gamma))
-            sys.stdout.write(msg + '\r')
-            sys.stdout.flush()
-            time.sleep(0.1)
+            if trace.record(iteration, change=linalg.norm(change), x_e=lambda: np.mean(gamma)):
+                break
+
+        trace.close()
 
         # scores = np.exp(gamma)
         # scores[-1] = 1.
@@ -174,7 +177,8 @@ class BradleyTerryNewtonRaphsonPairedCompSubjectiveModel(PairedCompSubjectiveMod
             # std = std / scores_std
 
         result = {'quality_scores': list(scores),
-                  'quality_scores_std': None}
+                  'quality_scores_std': None,
+                  'trace': trace.to_dict()}
         return result
 
 
@@ -185,12 +189,18 @@ class BradleyTerryMlePairedCompSubjectiveModel(PairedCompSubjectiveModel):
     TYPE = 'BT_MLE'
     VERSION = '1.0'
 
+    # the fixed-point iterations run until convergence; the trace is preallocated
+    # for that many, and grows beyond
+    TRACE_CAPACITY = 1000
+
     @classmethod
     def _run_modeling(cls, dataset_reader, **kwargs):
 
         alpha = np.nansum(dataset_reader.opinion_score_3darray, axis=2)
 
-        v, stdv_v, p, stdv_p, cova_v, cova_p = cls.resolve_model(alpha, **kwargs)
+        trace = IterationTrace.from_kwargs(['change', 'p'], cls.TRACE_CAPACITY, kwargs)
+
+        v, stdv_v, p, stdv_p, cova_v, cova_p = cls.resolve_model(alpha, trace=trace, **kwargs)
 
         return {'quality_scores': v,
                 'quality_scores_std': stdv_v,
@@ -198,13 +208,16 @@ class BradleyTerryMlePairedCompSubjectiveModel(PairedCompSubjectiveModel):
                 'quality_scores_p': p,
                 'quality_scores_p_std': stdv_p,
                 'quality_scores_p_cov': cova_p,
-                'quality_scores_v_cov': cova_v}
+                'quality_scores_v_cov': cova_v,
+                'trace': trace.to_dict()}
 
     @staticmethod
     def resolve_model(alpha, **more):
 
-        display = more['display'] if 'display' in more else True
-        assert isinstance(display, bool)
+        # trace: IterationTrace recording the iterations, set up from the trace_every, callback and display
+        #        keyword arguments if not given
+        trace = more['trace'] if 'trace' in more and more['trace'] is not None else \
+            IterationTrace.from_kwargs(['change', 'p'], BradleyTerryMlePairedCompSubjectiveModel.TRACE_CAPACITY, more)
 
         # example: alpha is paired-comparison matrix
         # alpha = np.array(
@@ -245,11 +258,10 @@ class BradleyTerryMlePairedCompSubjectiveModel(PairedCompSubjectiveModel):
 
             change = linalg.norm(p - p_prev)
 
-            if display:
-                msg = 'Iteration {itr:4d}: change {change}, mean p {p}'.format(itr=iteration, change=linalg.norm(change), p=np.mean(p))
-                sys.stdout.write(msg + '\r')
-                sys.stdout.flush()
-                time.sleep(0.001)
+            if trace.record(iteration, change=change, p=lambda: np.mean(p)):
+                break
+
+        trace.close()
 
         # lambda_ii = sum_j -alpha_ij / p_i^2 + n_ij / (p_i + p_j)^2
         # lambda_ij = n_ij / (p_i + p_j)^2, i != j
@@ -318,12 +330,15 @@ class ThurstoneMlePairedCompSubjectiveModel(PairedCompSubjectiveModel):
         use_simplified_lbda = more['use_simplified_lbda'] if 'use_simplified_lbda' in more else True
         assert isinstance(use_simplified_lbda, bool)
 
+        display = more['display'] if 'display' in more and more['display'] is not None else False
+        assert isinstance(display, bool)
+
         M, M_ = alpha.shape
         assert M == M_
         nllf_partial = partial(cls.neg_log_likelihood_function, alpha=alpha)
         v0 = np.zeros(M)
         ret = minimize(nllf_partial, v0, method='SLSQP', jac='2-point',
-                       options={'ftol': 1e-8, 'disp': True, 'maxiter': 1000})
+                       options={'ftol': 1e-8, 'disp': display, 'maxiter': 1000})
         assert ret.success, "minimization is unsuccessful."
         v = ret.x
 
@@ -0,0 +1,308 @@
+import numpy as np
+
+from sureal.tools.blocks import RowBlocks
+from sureal.tools.sparse import segment_sum, segment_count, segment_mean
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+class PreprocessingStage(object):
+    """
+    A stage of a PreprocessingPipeline, transforming the opinion scores, a
+    2darray of the dis videos by the observers, NaN where missing, by
+    statistics of its input. A stage declares its statistics per row, by
+    row_stats() of a block of rows, and its statistics per column, by
+    col_stats() of a block and its row statistics, merged over the blocks by
+    merge_col_stats(); a block holds whole rows, so that the statistics of
+    a stage take a single pass over the blocks. transform() then adds the
+    transform of the stage to the RowBlocks of its input, from the row
+    statistics of all the blocks and the merged column statistics.
+    """
+
+    def row_stats(self, block):
+        """
+        An array of the statistics of each row of block, or None.
+        """
+        return None
+
+    def col_stats(self, block, row_stats):
+        """
+        An array of the statistics of each column of block, from its
+        row_stats, or None.
+        """
+        return None
+
+    def merge_col_stats(self, col_stats, col_stats2):
+        return col_stats + col_stats2
+
+    def transform(self, blocks, row_stats, col_stats):
+        """
+        The transformed RowBlocks, and a dict of the estimates to report.
+        """
+        raise NotImplementedError
+
+
+class DscoreStage(PreprocessingStage):
+    """
+    Differential scoring: the scores of each dis video, offset by ref_score
+    minus the mean score of its ref video, at the row ref_rows[e]. If
+    ref_os_2darray is given, ref_rows index its rows instead of those of the
+    blocks, e.g. for a view whose ref videos need not be among its rows.
+    """
+
+    def __init__(self, ref_score, ref_rows, ref_os_2darray=None):
+        self.ref_score = ref_score
+        self.ref_rows = np.asarray(ref_rows)
+        self.ref_os_2darray = ref_os_2darray
+
+    def row_stats(self, block):
+        return np.nanmean(block, axis=1)  # mean along s
+
+    def transform(self, blocks, row_stats, col_stats):
+        if self.ref_os_2darray is not None:
+            row_stats = np.nanmean(self.ref_os_2darray, axis=1)
+        return blocks.transformed(row_offsets=self.ref_score - row_stats[self.ref_rows]), {}
+
+
+class ZscoreStage(PreprocessingStage):
+    """
+    Z-scoring: the scores of each observer, normalized to 0-mean 1-std
+    (sample std, of ddof 1). The count, mean and sum of squared deviations
+    of each column of the blocks are merged pairwise, so that the std takes
+    the same single pass as the mean.
+    """
+
+    def col_stats(self, block, row_stats):
+        cnt = np.sum(~np.isnan(block), axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mu = np.nansum(block, axis=0) / cnt
+        m2 = np.nansum((block - mu) ** 2, axis=0)
+        return np.array([cnt, mu, m2])
+
+    def merge_col_stats(self, col_stats, col_stats2):
+        cnt, mu, m2 = col_stats
+        cnt2, mu2, m22 = col_stats2
+        total = cnt + cnt2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = mu2 - mu
+            merged_mu = np.where(cnt == 0, mu2, np.where(cnt2 == 0, mu, mu + delta * cnt2 / total))
+            merged_m2 = np.where(cnt == 0, m22, np.where(cnt2 == 0, m2, m2 + m22 + delta ** 2 * cnt * cnt2 / total))
+        return np.array([total, merged_mu, merged_m2])
+
+    def transform(self, blocks, row_stats, col_stats):
+        cnt, mu_s, m2 = col_stats
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sigma_s = np.sqrt(m2 / (cnt - 1))  # std along e, ddof 1
+        return blocks.transformed(col_offsets=mu_s, col_scales=sigma_s), {}
+
+
+class BiasOffsetStage(PreprocessingStage):
+    """
+    Bias offset according to ITU-T P.913: the scores of each observer,
+    offset by its mean deviation from the MOS of the dis videos, reported
+    as the 'bias_offset_estimate'.
+    """
+
+    def row_stats(self, block):
+        # video-by-video, estimate MOS by averageing over subjects
+        return np.nanmean(block, axis=1)  # mean along s
+
+    def col_stats(self, block, row_stats):
+        # subject by subject, estimate subject bias by comparing
+        # against MOS
+        delta_es = block - row_stats[:, np.newaxis]
+        return np.array([np.nansum(delta_es, axis=0), np.sum(~np.isnan(delta_es), axis=0)])
+
+    def transform(self, blocks, row_stats, col_stats):
+        sums, cnt = col_stats
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta_s = sums / cnt  # mean along e
+        return blocks.transformed(col_offsets=delta_s), {'bias_offset_estimate': delta_s}
+
+
+class SubjectRejectionStage(PreprocessingStage):
+    """
+    ITU-R BT.500 subject rejection: the observers that scored too many dis
+    videos off their thresholds, see get_subject_rejection(), are left out,
+    and reported as 'observer_rejected', with the statistics of the
+    decision. The thresholds are by row, and the counts by column are
+    summed over the blocks.
+    """
+
+    def row_stats(self, block):
+        observed = ~np.isnan(block)
+        cnt = np.sum(observed, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mu = np.sum(np.where(observed, block, 0.), axis=1) / cnt
+            d2_es = np.where(observed, block - mu[:, np.newaxis], 0.) ** 2
+            m2 = np.sum(d2_es, axis=1) / cnt
+            m4 = np.sum(d2_es ** 2, axis=1) / cnt
+        return np.column_stack(get_subject_rejection_thresholds(mu, m2, m4))
+
+    def col_stats(self, block, row_stats):
+        lo, hi = row_stats[:, 0], row_stats[:, 1]
+        with np.errstate(invalid='ignore'):
+            # NaN compares False
+            ps = np.sum(block >= hi[:, np.newaxis], axis=0).astype(float)
+            qs = np.sum(block <= lo[:, np.newaxis], axis=0).astype(float)
+        return np.array([ps, qs])
+
+    def transform(self, blocks, row_stats, col_stats):
+        E, _ = blocks.shape
+        ps, qs = col_stats
+        observer_rejected, reject_1st_stats, reject_2nd_stats = get_subject_rejection(ps, qs, E)
+        return blocks.transformed(cols=~observer_rejected), {
+            'observer_rejected': observer_rejected.tolist(),
+            'observer_rejected_1st_stats': list(reject_1st_stats),
+            'observer_rejected_2nd_stats': list(reject_2nd_stats),
+        }
+
+
+class PreprocessingPipeline(object):
+    """
+    The stages, applied in order to the RowBlocks of the opinion scores: in
+    a pass over the blocks per stage, the statistics of the stage are
+    computed from its input, i.e. the blocks as transformed by the previous
+    stages, as they are read; the scores are never transformed as a whole,
+    so that the same pipeline applies to a 2darray in memory, see
+    run_2darray(), and to a memmap, a block at a time.
+
+    >>> s_es = np.array([[1., 2., 3.], [3., np.nan, 5.], [2., 4., 4.], [4., 5., 6.]])
+    >>> pipeline = PreprocessingPipeline([DscoreStage(5., [0, 0, 2, 2]), BiasOffsetStage()])
+    >>> blocks, ret = pipeline.run(RowBlocks(s_es, block_size=3))
+    >>> blocks.to_array()
+    array([[5.08333333, 4.77777778, 5.08333333],
+           [7.08333333,        nan, 7.08333333],
+           [4.75      , 5.44444444, 4.75      ],
+           [6.75      , 6.44444444, 6.75      ]])
+    >>> ret['bias_offset_estimate']
+    array([-1.08333333,  0.22222222,  0.91666667])
+    >>> blocks2, _ = pipeline.run(RowBlocks(s_es, block_size=4))
+    >>> np.allclose(blocks2.to_array(), blocks.to_array(), equal_nan=True)
+    True
+    """
+
+    # the blocks of run_2darray(), of about the size of a CPU cache, so that
+    # a pass over a 2darray in memory keeps its temporaries in cache
+    DEFAULT_BLOCK_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, stages):
+        for stage in stages:
+            assert isinstance(stage, PreprocessingStage)
+        self.stages = list(stages)
+
+    def run(self, blocks):
+        """
+        The RowBlocks of blocks, transformed by the stages, and a dict of
+        the estimates reported by them.
+        """
+        ret = dict()
+        for stage in self.stages:
+            row_stats, col_stats = self._get_stats(stage, blocks)
+            blocks, estimates = stage.transform(blocks, row_stats, col_stats)
+            ret.update(estimates)
+        return blocks, ret
+
+    def run_2darray(self, s_es):
+        """
+        run() of the 2darray s_es, in blocks of about DEFAULT_BLOCK_BYTES,
+        with the transformed scores as a 2darray.
+        """
+        E, S = s_es.shape
+        block_size = max(self.DEFAULT_BLOCK_BYTES // (s_es.itemsize * max(S, 1)), 1)
+        blocks, ret = self.run(RowBlocks(s_es, block_size))
+        return blocks.to_array(), ret
+
+    @staticmethod
+    def _get_stats(stage, blocks):
+        row_stats = []
+        col_stats = None
+        for _, _, block in blocks:
+            block_row_stats = stage.row_stats(block)
+            block_col_stats = stage.col_stats(block, block_row_stats)
+            if block_row_stats is not None:
+                row_stats.append(block_row_stats)
+            if block_col_stats is not None:
+                col_stats = block_col_stats if col_stats is None \
+                    else stage.merge_col_stats(col_stats, block_col_stats)
+        return (np.concatenate(row_stats) if len(row_stats) > 0 else None), col_stats
+
+
+def get_subject_rejection_thresholds(mu, m2, m4):
+    """
+    The low and high thresholds of ITU-R BT.500 subject rejection, per
+    video, from the mean, and the 2nd and 4th central moments of its
+    scores: 2 stds off the mean if the scores are about normal (of a
+    kurtosis in [2, 4], as scipy.stats.kurtosis(fisher=False)), else
+    sqrt(20) stds.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zero = m2 <= (np.finfo(float).resolution * mu) ** 2
+        kurt = np.where(zero, np.nan, m4 / m2 ** 2.0)
+    num_stds = np.where((2 <= kurt) & (kurt <= 4), 2, np.sqrt(20))
+    sigma = np.sqrt(m2)
+    return mu - num_stds * sigma, mu + num_stds * sigma
+
+
+def get_subject_rejection_counts(s_es):
+    """
+    The ps and qs counts of ITU-R BT.500 subject rejection: for each
+    subject, the number of videos it scored at or above the high threshold,
+    and at or below the low one, see get_subject_rejection_thresholds(); as
+    masked reductions along the rows of s_es, with NaN for the missing
+    scores.
+
+    >>> s_es = np.array([[3., 3., 4., 3., 2., 3., 1., np.nan],
+    ...                  [4., 4., 5., 4., 3., 4., 2., 4.],
+    ...                  [2., 3., 3., 2., np.nan, 3., 1., 2.]])
+    >>> ps, qs = get_subject_rejection_counts(s_es)
+    >>> ps
+    array([0., 0., 0., 0., 0., 0., 0., 0.])
+    >>> qs
+    array([0., 0., 0., 0., 0., 0., 1., 0.])
+    """
+    stage = SubjectRejectionStage()
+    ps, qs = stage.col_stats(s_es, stage.row_stats(s_es))
+    return ps, qs
+
+
+def get_subject_rejection_counts_sparse(rows, cols, vals, shape):
+    """
+    get_subject_rejection_counts() of the scores given as the (rows, cols,
+    vals) triplets of the observed entries of an E x S 2darray.
+
+    >>> s_es = np.array([[3., 3., 4., 3., 2., 3., 1., np.nan],
+    ...                  [4., 4., 5., 4., 3., 4., 2., 4.],
+    ...                  [2., 3., 3., 2., np.nan, 3., 1., 2.]])
+    >>> rows, cols = np.nonzero(~np.isnan(s_es))
+    >>> ps, qs = get_subject_rejection_counts_sparse(rows, cols, s_es[rows, cols], s_es.shape)
+    >>> qs
+    array([0., 0., 0., 0., 0., 0., 1., 0.])
+    """
+    E, S = shape
+    cnt = segment_count(rows, E)
+    mu = segment_mean(rows, vals, E)
+    d2 = (vals - mu[rows]) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m2 = segment_sum(rows, d2, E) / cnt
+        m4 = segment_sum(rows, d2 ** 2, E) / cnt
+        lo, hi = get_subject_rejection_thresholds(mu, m2, m4)
+    ps = segment_count(cols[vals >= hi[rows]], S).astype(float)
+    qs = segment_count(cols[vals <= lo[rows]], S).astype(float)
+    return ps, qs
+
+
+def get_subject_rejection(ps, qs, E):
+    """
+    Which subjects ITU-R BT.500 rejects, from their ps and qs counts over E
+    videos, with the 1st and 2nd statistics of the decision. If all of the
+    subjects would be rejected, none is.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reject_1st_stats = (ps + qs) / E
+        reject_2nd_stats = np.abs((ps - qs) / (ps + qs))
+        observer_rejected = (reject_1st_stats > 0.05) & (reject_2nd_stats < 0.3)
+    if np.all(observer_rejected):
+        observer_rejected[:] = False
+    return observer_rejected, reject_1st_stats, reject_2nd_stats
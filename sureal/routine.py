@@ -14,7 +14,7 @@ except (ImportError, RuntimeError):
     plt = None
 
 from sureal.dataset_reader import RawDatasetReader, PairedCompDatasetReader, MissingDataRawDatasetReader
-from sureal.tools.misc import import_python_file, import_json_file, Timer
+from sureal.tools.misc import import_dataset_file, Timer
 
 __copyright__ = "Copyright 2016-2018, Netflix, Inc."
 __license__ = "Apache, Version 2.0"
@@ -72,12 +72,11 @@ def run_subjective_models(dataset_filepath, subjective_model_classes, do_plot=No
 
     colors = ['black', 'gray', 'blue', 'red'] * 2
 
-    if dataset_filepath.endswith('.py'):
-        dataset = import_python_file(dataset_filepath)
-    elif dataset_filepath.endswith('.json'):
-        dataset = import_json_file(dataset_filepath)
-    else:
-        raise AssertionError("Unknown input type, must be .py or .json")
+    # parse a .py dataset file instead of executing it
+    literal_only = kwargs['literal_only'] if 'literal_only' in kwargs else False
+    assert isinstance(literal_only, bool)
+
+    dataset = import_dataset_file(dataset_filepath, literal_only)
     dataset_reader = dataset_reader_class(dataset, input_dict=dataset_reader_info_dict)
 
     subjective_models = [
@@ -523,7 +522,7 @@ def run_subjective_models(dataset_filepath, subjective_model_classes, do_plot=No
 
 def visualize_pc_dataset(dataset_filepath):
 
-    dataset = import_python_file(dataset_filepath)
+    dataset = import_dataset_file(dataset_filepath)
     dataset_reader = PairedCompDatasetReader(dataset)
     tensor_pvs_pvs_subject = dataset_reader.opinion_score_3darray
 
@@ -562,7 +561,7 @@ def validate_with_synthetic_dataset(synthetic_dataset_reader_class,
         measure_runtime = more['measure_runtime'] if 'measure_runtime' in more else False
         assert isinstance(measure_runtime, bool)
 
-        dataset = import_python_file(dataset_filepath)
+        dataset = import_dataset_file(dataset_filepath)
         dataset_reader = synthetic_dataset_reader_class(dataset, input_dict=synthetic_result)
 
         if missing_probability is not None:
@@ -1,19 +1,25 @@
 import copy
 from abc import ABCMeta, abstractmethod
-import sys
-import time
 
 import numpy as np
-from scipy import linalg
-from scipy import stats
+from scipy import linalg, sparse
+from scipy.sparse import linalg as sparse_linalg
+from scipy.sparse.csgraph import connected_components
 import pandas as pd
 from scipy.stats import chi2, norm
 
 from sureal.core.mixin import TypeVersionEnabled
-from sureal.tools.misc import import_python_file, indices, weighed_nanmean_2d
-from sureal.dataset_reader import RawDatasetReader
-from sureal.tools.stats import vectorized_gaussian, vectorized_convolution_of_two_logistics, \
-    vectorized_convolution_of_two_uniforms
+from sureal.tools.misc import import_dataset_file, weighed_nanmean_2d
+from sureal.tools.sparse import dense_to_triplets
+from sureal.tools.accelerate import Squarem
+from sureal.tools.trace import IterationTrace
+from sureal.dataset_reader import RawDatasetReader, SqliteDatasetReader, MemmapRawDatasetReader
+from sureal.tools.dataset_store import is_sqlite_file, import_sqlite_file
+from sureal.mle_engine import DenseMleEngine, InplaceMleEngine, SparseMleEngine
+from sureal.preprocessing import PreprocessingPipeline, DscoreStage, ZscoreStage, BiasOffsetStage, \
+    SubjectRejectionStage
+from sureal.tools.stats import vectorized_gaussian, vectorized_log_convolution_of_two_logistics, \
+    vectorized_log_convolution_of_two_uniforms
 
 __copyright__ = "Copyright 2016-2018, Netflix, Inc."
 __license__ = "Apache, Version 2.0"
@@ -47,7 +53,10 @@ class SubjectiveModel(TypeVersionEnabled):
 
     @classmethod
     def _import_dataset_and_filter(cls, dataset_filepath, content_ids, asset_ids):
-        dataset = import_python_file(dataset_filepath)
+        if is_sqlite_file(dataset_filepath):
+            # filtered by the store's query
+            return import_sqlite_file(dataset_filepath, content_ids=content_ids, asset_ids=asset_ids)
+        dataset = import_dataset_file(dataset_filepath)
         if content_ids is not None:
             dataset.dis_videos = [dis_video for dis_video in dataset.dis_videos if dis_video['content_id'] in content_ids]
         if asset_ids is not None:
@@ -56,6 +65,8 @@ class SubjectiveModel(TypeVersionEnabled):
 
     @classmethod
     def from_dataset_file(cls, dataset_filepath, content_ids=None, asset_ids=None):
+        if is_sqlite_file(dataset_filepath):
+            return cls(SqliteDatasetReader(dataset_filepath, content_ids=content_ids, asset_ids=asset_ids))
         dataset = cls._import_dataset_and_filter(dataset_filepath, content_ids, asset_ids)
         dataset_reader = RawDatasetReader(dataset)
         return cls(dataset_reader)
@@ -89,32 +100,66 @@ class SubjectiveModel(TypeVersionEnabled):
 
     @staticmethod
     def _get_ref_mos(dataset_reader, mos):
-        ref_mos = []
-        for dis_video in dataset_reader.dataset.dis_videos:
-            # get the dis video's ref video's mos
-            curr_content_id = dis_video['content_id']
-            ref_indices = indices(
-                list(zip(dataset_reader.content_id_of_dis_videos,
-                    dataset_reader.disvideo_is_refvideo)),
-                lambda content_id_is_refvideo:
-                content_id_is_refvideo[1] and content_id_is_refvideo[0] == curr_content_id
-            )
-            assert len(ref_indices) == 1, \
-                'Should have only and one ref video for a dis video, ' \
-                'but got {}'.format(len(ref_indices))
-            ref_idx = ref_indices[0]
-
-            ref_mos.append(mos[ref_idx])
-        return np.array(ref_mos)
+        # get each dis video's ref video's mos
+        return np.asarray(mos)[dataset_reader.ref_dis_video_of_dis_videos]
+
+    PREPROCESSING_KWARGS = ['dscore_mode', 'zscore_mode', 'bias_offset', 'subject_rejection']
 
     @staticmethod
     def _get_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs):
+        """
+        The opinion scores of dataset_reader, preprocessed by the
+        PREPROCESSING_KWARGS of kwargs, see
+        _compile_opinion_score_2darray_with_preprocessing(). If the reader's
+        CACHE_PREPROCESSING, they are compiled once per preprocessing config,
+        and cached in the reader, so that models run on the same reader share
+        them, and the unprocessed scores: the arrays are then read-only
+        views, to copy before editing.
+
+        >>> from sureal.tools.misc import empty_object
+        >>> dataset = empty_object()
+        >>> dataset.ref_videos = [{'content_id': 0, 'content_name': 'c0'}]
+        >>> dataset.dis_videos = [{'content_id': 0, 'asset_id': 0, 'os': [1., 2.]},
+        ...                       {'content_id': 0, 'asset_id': 1, 'os': [3., 5.]}]
+        >>> dataset_reader = RawDatasetReader(dataset)
+        >>> ret = SubjectiveModel._get_opinion_score_2darray_with_preprocessing(dataset_reader, zscore_mode=True)
+        >>> ret['opinion_score_2darray']
+        array([[-0.70710678, -0.70710678],
+               [ 0.70710678,  0.70710678]])
+        >>> ret['opinion_score_2darray'].flags.writeable
+        False
+        >>> ret2 = SubjectiveModel._get_opinion_score_2darray_with_preprocessing(dataset_reader, zscore_mode=True)
+        >>> np.shares_memory(ret['opinion_score_2darray'], ret2['opinion_score_2darray'])
+        True
+        """
+        if not dataset_reader.CACHE_PREPROCESSING:
+            return SubjectiveModel._compile_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs)
+
+        config = tuple(kwargs[key] if key in kwargs else False for key in SubjectiveModel.PREPROCESSING_KWARGS)
+        kwargs2 = dict(zip(SubjectiveModel.PREPROCESSING_KWARGS, config))
+
+        def compile_fcn():
+            ret = SubjectiveModel._compile_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs2)
+            # one copy of the unprocessed scores, for all the configs
+            original = dataset_reader._get_cached('original_opinion_score_2darray',
+                                                  lambda: ret['original_opinion_score_2darray'])
+            ret['original_opinion_score_2darray'] = original
+            if not any(config):
+                ret['opinion_score_2darray'] = original
+            for value in ret.values():
+                if isinstance(value, np.ndarray):
+                    value.flags.writeable = False
+            return ret
+
+        ret = dataset_reader._get_cached(('opinion_score_2darray_with_preprocessing',) + config, compile_fcn)
+
+        # a view of each array, and a copy of the rest, to keep the cached
+        # ones from edits of the models' results
+        return {key: value.view() if isinstance(value, np.ndarray) else copy.copy(value)
+                for key, value in ret.items()}
 
-        s_es = dataset_reader.opinion_score_2darray
-
-        original_opinion_score_2darray = copy.deepcopy(s_es)
-
-        ret = dict()
+    @staticmethod
+    def _get_preprocessing_pipeline(dataset_reader, **kwargs):
 
         # dscore_mode: True - do differential-scoring
         #              False - don't do differential-scoring
@@ -134,100 +179,127 @@ class SubjectiveModel(TypeVersionEnabled):
 
         assert not (zscore_mode is True and bias_offset is True)
 
+        stages = []
+
         if dscore_mode is True:
 
             # make sure dataset has ref_score
             assert dataset_reader.dataset.ref_score is not None, \
                 "For differential score, dataset must have attribute ref_score."
 
-            E, S = s_es.shape
-            s_e = pd.DataFrame(s_es).mean(axis=1) # mean along s
-            s_e_ref = DmosModel._get_ref_mos(dataset_reader, s_e)
-            s_es = s_es + dataset_reader.ref_score - np.tile(s_e_ref, (S, 1)).T
+            ref_rows, ref_os_2darray = dataset_reader._get_ref_rows()
+            stages.append(DscoreStage(dataset_reader.ref_score, ref_rows, ref_os_2darray))
 
         if zscore_mode is True:
-            E, S = s_es.shape
-            mu_s = pd.DataFrame(s_es).mean(axis=0) # mean along e
-            simga_s = pd.DataFrame(s_es).std(ddof=1, axis=0) # std along e
-            s_es = (s_es - np.tile(mu_s, (E, 1))) / np.tile(simga_s, (E, 1))
+            stages.append(ZscoreStage())
 
         if bias_offset is True:
-            E, S = s_es.shape
-
-            # video-by-video, estimate MOS by averageing over subjects
-            s_e = pd.DataFrame(s_es).mean(axis=1) # mean along s
+            stages.append(BiasOffsetStage())
 
-            # subject by subject, estimate subject bias by comparing
-            # against MOS
-            delta_es = s_es - np.tile(s_e, (S, 1)).T
-            delta_s = pd.DataFrame(delta_es).mean(axis=0)  # mean along e
-
-            # remove bias from opinion scores
-            s_es = s_es - np.tile(delta_s, (E, 1))
+        if subject_rejection is True:
+            stages.append(SubjectRejectionStage())
 
-            ret['bias_offset_estimate'] = delta_s
+        return PreprocessingPipeline(stages)
 
-        if subject_rejection is True:
-            E, S = s_es.shape
-
-            ps = np.zeros(S)
-            qs = np.zeros(S)
-
-            for s_e in s_es:
-                s_e_notnan = s_e[~np.isnan(s_e)]
-                mu = np.mean(s_e_notnan)
-                sigma = np.std(s_e_notnan)
-                kurt = stats.kurtosis(s_e_notnan, fisher=False)
-
-                if 2 <= kurt and kurt <= 4:
-                    for idx_s, s in enumerate(s_e):
-                        if not np.isnan(s):
-                            if s >= mu + 2 * sigma:
-                                ps[idx_s] += 1
-                            if s <= mu - 2 * sigma:
-                                qs[idx_s] += 1
-                else:
-                    for idx_s, s in enumerate(s_e):
-                        if not np.isnan(s):
-                            if s >= mu + np.sqrt(20) * sigma:
-                                ps[idx_s] += 1
-                            if s <= mu - np.sqrt(20) * sigma:
-                                qs[idx_s] += 1
-            rejections = []
-            acceptions = []
-            reject_1st_stats = []
-            reject_2nd_stats = []
-            for idx_s, subject in zip(list(range(S)), list(range(S))):
-                reject_1st_stat = (ps[idx_s] + qs[idx_s]) / E
-                reject_2nd_stat = np.abs((ps[idx_s] - qs[idx_s]) / (ps[idx_s] + qs[idx_s]))
-                reject_1st_stats.append(reject_1st_stat)
-                reject_2nd_stats.append(reject_2nd_stat)
-                if reject_1st_stat > 0.05 and reject_2nd_stat < 0.3:
-                    rejections.append(subject)
-                else:
-                    acceptions.append(subject)
+    @staticmethod
+    def _compile_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs):
 
-            # if all of the subjects would be rejected, none will
-            if len(rejections) == S:
-                for idx_rej in range(S):
-                    acceptions.append(rejections[idx_rej])
-                rejections = []
+        s_es = dataset_reader.opinion_score_2darray
 
-            s_es = s_es[:, acceptions]
+        original_opinion_score_2darray = copy.deepcopy(s_es)
 
-            observer_rejected = [False for _ in range(S)]
-            for rejection_idx in rejections:
-                observer_rejected[rejection_idx] = True
+        pipeline = SubjectiveModel._get_preprocessing_pipeline(dataset_reader, **kwargs)
 
-            ret['observer_rejected'] = observer_rejected
-            ret['observer_rejected_1st_stats'] = reject_1st_stats
-            ret['observer_rejected_2nd_stats'] = reject_2nd_stats
+        s_es, ret = pipeline.run_2darray(s_es)
 
         ret['opinion_score_2darray'] = s_es
         ret['original_opinion_score_2darray'] = original_opinion_score_2darray
 
         return ret
 
+    @staticmethod
+    def _get_opinion_score_blocks_with_preprocessing(dataset_reader, **kwargs):
+        """
+        _get_opinion_score_2darray_with_preprocessing() out of core, for a
+        MemmapRawDatasetReader: the opinion scores are kept as the RowBlocks
+        of the memmap, under 'opinion_score_blocks' (and the unprocessed ones
+        under 'original_opinion_score_blocks'), and the preprocessing is
+        applied to each block as it is read, from statistics computed a block
+        at a time.
+        """
+
+        s_es = dataset_reader.opinion_score_blocks
+
+        pipeline = SubjectiveModel._get_preprocessing_pipeline(dataset_reader, **kwargs)
+        processed_s_es, ret = pipeline.run(s_es)
+
+        ret['original_opinion_score_blocks'] = s_es
+        ret['opinion_score_blocks'] = processed_s_es
+
+        return ret
+
+    @staticmethod
+    def _get_warm_start_params(dataset_reader, initial_params, default_params):
+        """
+        Seed the solver parameters from initial_params, a dict keyed like a
+        model result ('quality_scores', 'observer_bias', 'observer_inconsistency'
+        and 'content_ambiguity'), e.g. the result of a previous run on an
+        earlier version of the dataset. default_params holds the cold-start
+        value of each key to seed, and is returned updated.
+
+        Subjects are matched by name if initial_params has 'observers' and the
+        dataset names them too, videos by asset id if initial_params has
+        'asset_ids', and by position otherwise (for contents, always by content
+        id). Entries of the dataset without a finite match in initial_params,
+        e.g. subjects or videos added since, keep their cold-start value, and
+        entries of initial_params without a match in the dataset are dropped.
+        """
+
+        def get_positions(keys, keys0):
+            # position in keys0 of each of keys, or -1
+            index0 = {key: i for i, key in enumerate(keys0)}
+            return np.array([index0[key] if key in index0 else -1 for key in keys], dtype=int)
+
+        num_dis_videos = len(default_params['quality_scores'])
+        if 'asset_ids' in initial_params:
+            asset_ids = [dis_video['asset_id'] for dis_video in dataset_reader.dataset.dis_videos]
+            assert len(asset_ids) == num_dis_videos
+            video_positions = get_positions(asset_ids, initial_params['asset_ids'])
+        else:
+            video_positions = np.arange(num_dis_videos)
+
+        num_observers = len(default_params['observer_bias']) if 'observer_bias' in default_params else 0
+        try:
+            observers = dataset_reader._get_list_observers()  # may not exist
+        except AssertionError:
+            observers = None
+        if 'observers' in initial_params and observers is not None:
+            subject_positions = get_positions(observers, initial_params['observers'])
+        else:
+            subject_positions = np.arange(num_observers)
+
+        ret = dict()
+        for key, default in default_params.items():
+            default = np.array(default, dtype=float)
+            if key not in initial_params or initial_params[key] is None:
+                ret[key] = default
+                continue
+            if key == 'quality_scores':
+                positions = video_positions
+            elif key in ['observer_bias', 'observer_inconsistency']:
+                positions = subject_positions
+            elif key == 'content_ambiguity':
+                positions = np.arange(len(default))
+            else:
+                assert False, 'unknown initial parameter: {}'.format(key)
+            values0 = np.array(initial_params[key], dtype=float)
+            positions = np.where(positions < len(values0), positions, -1)
+            matched = positions >= 0
+            values = np.full(len(default), float('NaN'))
+            values[matched] = values0[positions[matched]]
+            ret[key] = np.where(np.isfinite(values), values, default)
+        return ret
+
     @staticmethod
     def _postprocess_model_result(result, **kwargs):
 
@@ -275,10 +347,7 @@ class MosModel(SubjectiveModel):
 
     @classmethod
     def _run_modeling(cls, dataset_reader, **kwargs):
-        ret = cls._get_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs)
-        os_2darray = ret['opinion_score_2darray']
-        original_os_2darray = ret['original_opinion_score_2darray']
-        result = cls._get_mos_and_stats(os_2darray, original_os_2darray)
+        ret, result = cls._get_preprocessed_mos_and_stats(dataset_reader, **kwargs)
         if 'observer_rejected' in ret:
             result['observer_rejected'] = ret['observer_rejected']
             assert 'observer_rejected_1st_stats' in ret
@@ -287,6 +356,59 @@ class MosModel(SubjectiveModel):
             result['observer_rejected_2nd_stats'] = ret['observer_rejected_2nd_stats']
         return result
 
+    @classmethod
+    def _get_preprocessed_mos_and_stats(cls, dataset_reader, **kwargs):
+        if isinstance(dataset_reader, MemmapRawDatasetReader):
+            ret = cls._get_opinion_score_blocks_with_preprocessing(dataset_reader, **kwargs)
+            result = cls._get_mos_and_stats_blocked(ret['opinion_score_blocks'], ret['original_opinion_score_blocks'])
+        else:
+            ret = cls._get_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs)
+            result = cls._get_mos_and_stats(ret['opinion_score_2darray'], ret['original_opinion_score_2darray'])
+        return ret, result
+
+    @classmethod
+    def _get_mos_and_stats_blocked(cls, os_blocks, original_os_blocks):
+        """
+        _get_mos_and_stats() a block of rows at a time. The 'raw_scores' are
+        the memmap, if not preprocessed, else left out; the 'reconstructions'
+        are a broadcast view of the MOS, without a copy per observer.
+        """
+        mos = os_blocks.nanmean(axis=1)  # mean along s, ignore NaN
+        std = os_blocks.nanstd(axis=1, ddof=1)  # sample std -- use ddof 1
+        cnt = os_blocks.count(axis=1)
+        mos_std = std / np.sqrt(cnt)  # std / sqrt(N), ignoring NaN
+        result = {'quality_scores': list(mos),
+                  'quality_scores_std': list(mos_std),
+                  'quality_scores_ci95': [list(1.95996 * mos_std), list(1.95996 * mos_std)],
+                  'quality_ambiguity': list(std),
+                  }
+        if not os_blocks.is_transformed:
+            result['raw_scores'] = os_blocks.array
+        num_pvs, num_obs = os_blocks.shape
+        num_os = np.sum(cnt)
+
+        result['reconstructions'] = np.broadcast_to(mos[:, np.newaxis], (num_pvs, num_obs))
+
+        original_num_pvs, original_num_obs = original_os_blocks.shape
+        original_num_os = np.sum(original_os_blocks.count(axis=1))
+        dof = cls._get_dof(original_num_pvs, original_num_obs) / original_num_os  # dof per observation
+        result['dof'] = dof
+
+        loglikelihood = np.sum(os_blocks.reduce(lambda start, stop, block: np.nansum(np.log(vectorized_gaussian(
+            block,
+            mos[start:stop, np.newaxis],
+            std[start:stop, np.newaxis],
+        ))))) / num_os  # log-likelihood per observation
+        result['loglikelihood'] = loglikelihood
+
+        aic = 2 * dof - 2 * loglikelihood  # aic per observation
+        result['aic'] = aic
+
+        bic = np.log(original_num_os) * dof - 2 * loglikelihood  # bic per observation
+        result['bic'] = bic
+
+        return result
+
     @classmethod
     def _get_mos_and_stats(cls, os_2darray, original_os_2darray):
         mos = np.nanmean(os_2darray, axis=1)  # mean along s, ignore NaN
@@ -398,7 +520,8 @@ class LeastSquaresModel(SubjectiveModel):
     Simple model considering:
     z_e,s = q_e + b_s
     Solve by forming linear systems and find least squares solution
-    can recover q_e and b_s
+    can recover q_e and b_s. The system has a row per observed score only,
+    so that missing scores are left out, and is solved sparse, by LSQR.
     """
     TYPE = 'LS'
     VERSION = '0.1'
@@ -415,26 +538,39 @@ class LeastSquaresModel(SubjectiveModel):
 
         num_video, num_subject = score_mtx.shape
 
-        A = np.zeros([num_video * num_subject, num_video + num_subject])
-        for idx_video in range(num_video):
-            for idx_subject in range(num_subject):
-                cur_row = idx_video * num_subject + idx_subject
-                A[cur_row][idx_subject] = 1.0
-                A[cur_row][num_subject + idx_video] = 1.0
-        y = np.array(score_mtx.ravel())
-
-        # add the extra constraint that the first ref video has score MOS
-        mos = pd.DataFrame(score_mtx).mean(axis=1)
-        row = np.zeros(num_subject + num_video)
-        row[num_subject + 0] = 1
-        score = mos[0]
-        A = np.vstack([A, row])
-        y = np.hstack([y, [score]])
-
-        b_q = np.dot(linalg.pinv(A), y)
+        # one row per observed score z_e,s, of the unknowns b_s then q_e,
+        # each scaled by 1 / sqrt(its number of scores) for LSQR to converge
+        rows, cols, vals = dense_to_triplets(score_mtx)
+        num_os = len(vals)
+        cnts = np.hstack([np.bincount(cols, minlength=num_subject), np.bincount(rows, minlength=num_video)])
+        scales = 1.0 / np.sqrt(np.maximum(cnts, 1))
+        A = sparse.csr_matrix((np.hstack([scales[cols], scales[num_subject + rows]]),
+                               (np.tile(np.arange(num_os), 2), np.hstack([cols, num_subject + rows]))),
+                              shape=(num_os, num_subject + num_video))
+
+        # a least squares solution, by LSQR
+        b_q = sparse_linalg.lsqr(A, vals, atol=1e-12, btol=1e-12, iter_lim=10 * (num_subject + num_video))[0] * scales
         b = b_q[:num_subject]
         q = b_q[num_subject:]
 
+        # q_e + c and b_s - c fit equally well, for any c per connected
+        # component of the unknowns linked by a score: add the extra
+        # constraint that the first rated video of each component has score MOS
+        graph = sparse.csr_matrix((np.ones(num_os), (cols, num_subject + rows)),
+                                  shape=(num_subject + num_video, num_subject + num_video))
+        num_components, components = connected_components(graph, directed=False)
+        mos = np.asarray(pd.DataFrame(score_mtx).mean(axis=1))
+        rated_videos = np.flatnonzero(cnts[num_subject:] > 0)
+        anchored_components, first_rated = np.unique(components[num_subject + rated_videos], return_index=True)
+        c = np.zeros(num_components)
+        c[anchored_components] = mos[rated_videos[first_rated]] - q[rated_videos[first_rated]]
+        b = b - c[components[:num_subject]]
+        q = q + c[components[num_subject:]]
+
+        # without a score, the unknown is not determined
+        b[cnts[:num_subject] == 0] = float('NaN')
+        q[cnts[num_subject:] == 0] = float('NaN')
+
         result = {
             'quality_scores': list(q),
             'observer_bias': list(b),
@@ -482,6 +618,11 @@ class LegacyMaximumLikelihoodEstimationModel(SubjectiveModel):
 
         use_log = kwargs['use_log'] if 'use_log' in kwargs else False
 
+        # acceleration: None - plain damped iterations
+        #               squarem - SQUAREM extrapolation, falling back to plain iterations if the likelihood drops
+        acceleration = kwargs['acceleration'] if 'acceleration' in kwargs else None
+        assert acceleration in [None, 'squarem']
+
         # === initialization ===
 
         mos = pd.DataFrame(x_es).mean(axis=1)
@@ -492,20 +633,15 @@ class LegacyMaximumLikelihoodEstimationModel(SubjectiveModel):
         r_es = x_es - np.tile(x_e, (S, 1)).T # r_es: residual at e, s
         v_s = np.array(pd.DataFrame(r_es).std(axis=0, ddof=0))
 
-        log_v_s = np.log(v_s)
-
         # === iteration ===
 
         MAX_ITR = 5000
         REFRESH_RATE = 0.1
         DELTA_THR = 1e-8
 
-        print('=== Belief Propagation ===')
-
-        itr = 0
-        while True:
+        def sweep(params):
 
-            x_e_prev = x_e
+            x_e, b_s, v_s = params
 
             # (8) b_s
             num = pd.DataFrame(x_es - np.tile(x_e, (S, 1)).T).sum(axis=0) # sum over e
@@ -516,6 +652,7 @@ class LegacyMaximumLikelihoodEstimationModel(SubjectiveModel):
             a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
             if use_log:
                 # (9') log_v_s
+                log_v_s = np.log(v_s)
                 num = pd.DataFrame(-np.ones([E, S]) + a_es**2 / np.tile(v_s**2, (E, 1))).sum(axis=0) # sum over e
                 den = pd.DataFrame(-2 * a_es**2 / np.tile(v_s**2, (E, 1))).sum(axis=0) # sum over e
                 log_v_s_new = log_v_s - num / den
@@ -535,15 +672,35 @@ class LegacyMaximumLikelihoodEstimationModel(SubjectiveModel):
             x_e_new = num / den
             x_e = x_e * (1.0 - REFRESH_RATE) + x_e_new * REFRESH_RATE
 
-            itr += 1
+            return (x_e, b_s, v_s), None
+
+        def loglikelihood(params):
+            x_e, b_s, v_s = params
+            return np.nansum(np.log(vectorized_gaussian(
+                x_es, np.tile(x_e, (S, 1)).T + np.tile(b_s, (E, 1)), np.tile(np.abs(v_s), (E, 1)))))
+
+        if acceleration == 'squarem':
+            squarem = Squarem(sweep, objective_fcn=loglikelihood, lower_bounds=(None, None, 0.0))
+
+        trace = IterationTrace.from_kwargs(['change', 'x_e', 'b_s', 'v_s'], MAX_ITR, kwargs, title='Belief Propagation')
+
+        itr = 0
+        while True:
+
+            x_e_prev = x_e
+
+            if acceleration == 'squarem':
+                (x_e, b_s, v_s), _, (x_e_prev, _, _), num_sweeps = squarem.step((x_e, b_s, v_s))
+                itr += num_sweeps
+            else:
+                (x_e, b_s, v_s), _ = sweep((x_e, b_s, v_s))
+                itr += 1
 
             delta_x_e = linalg.norm(x_e_prev - x_e)
 
-            msg = 'Iteration {itr:4d}: change {delta_x_e}, mean x_e {x_e}, mean b_s {b_s}, mean v_s {v_s}'.\
-                format(itr=itr, delta_x_e=delta_x_e, x_e=np.mean(x_e), b_s=np.mean(b_s), v_s=np.mean(v_s))
-            sys.stdout.write(msg + '\r')
-            sys.stdout.flush()
-            # time.sleep(0.001)
+            params = (x_e, b_s, v_s)
+            stop = trace.record(itr, change=delta_x_e, x_e=lambda: np.mean(params[0]),
+                                b_s=lambda: np.mean(params[1]), v_s=lambda: np.mean(params[2]))
 
             if delta_x_e < DELTA_THR:
                 break
@@ -551,7 +708,10 @@ class LegacyMaximumLikelihoodEstimationModel(SubjectiveModel):
             if itr >= MAX_ITR:
                 break
 
-        sys.stdout.write("\n")
+            if stop:
+                break
+
+        trace.close()
 
         if force_subjbias_zeromean:
             mean_b_s = np.mean(b_s)
@@ -562,6 +722,8 @@ class LegacyMaximumLikelihoodEstimationModel(SubjectiveModel):
             'quality_scores': list(x_e),
             'observer_bias': list(b_s),
             'observer_inconsistency': list(v_s),
+            'num_iter': itr,
+            'trace': trace.to_dict(),
         }
 
         try:
@@ -596,6 +758,7 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
     DEFAULT_NUMERICAL_PDF = 'gaussian'
     DEFAULT_DELTA_THR = 1e-8
     DEFAULT_FORCE_SUBJBIAS_ZEROMEAN = True
+    DEFAULT_ENGINE = 'dense'
 
     @staticmethod
     def loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c, content_id_of_dis_videos, axis, numerical_pdf):
@@ -615,7 +778,7 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
             s1 = np.sqrt(np.tile((v_s / (np.pi / np.sqrt(3.0)))**2, (E, 1)))
             s2 = np.sqrt(np.tile((a_c_e / (np.pi / np.sqrt(3.0)))**2, (S, 1)).T)
             # ret = np.log(vectorized_logistic(x_es, mu1 + mu2, np.sqrt(s1**2 + s2**2)))
-            ret = np.log(vectorized_convolution_of_two_logistics(x_es, mu1, s1, mu2, s2))
+            ret = vectorized_log_convolution_of_two_logistics(x_es, mu1, s1, mu2, s2)
 
         elif numerical_pdf == 'uniform':
             # gradient descent won't work due to zero density
@@ -624,7 +787,7 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
             mu2 = np.tile(x_e, (S, 1)).T
             s1 = np.sqrt(np.tile(v_s**2, (E, 1)) * 12.)
             s2 = np.sqrt(np.tile(a_c_e**2, (S, 1)).T * 12.)
-            ret = np.log(vectorized_convolution_of_two_uniforms(x_es, mu1, s1, mu2, s2))
+            ret = vectorized_log_convolution_of_two_uniforms(x_es, mu1, s1, mu2, s2)
         else:
             assert False, 'Unknown numerical_pdf: {}'.format(numerical_pdf)
 
@@ -643,10 +806,15 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
         if 'subject_rejection' in kwargs and kwargs['subject_rejection'] is True:
             assert False, '{} must not and need not apply subject rejection.'.format(cls.__name__)
 
+        # gradient_method: simplified, original, numerical - coordinate-wise damped Newton updates
+        #                  lbfgs - joint L-BFGS-B over all parameters, with analytic gradient (gaussian only)
         gradient_method = kwargs['gradient_method'] if 'gradient_method' in kwargs else cls.DEFAULT_GRADIENT_METHOD
-        assert gradient_method == 'simplified' or gradient_method == 'original' or gradient_method == 'numerical'
+        assert gradient_method == 'simplified' or gradient_method == 'original' or gradient_method == 'numerical' \
+            or gradient_method == 'lbfgs'
 
         numerical_pdf = kwargs['numerical_pdf'] if 'numerical_pdf' in kwargs else cls.DEFAULT_NUMERICAL_PDF
+        if gradient_method == 'lbfgs':
+            assert numerical_pdf == 'gaussian', 'lbfgs only supports gaussian numerical_pdf'
 
         delta_thr = kwargs['delta_thr'] if 'delta_thr' in kwargs else cls.DEFAULT_DELTA_THR
 
@@ -654,55 +822,53 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
             if 'force_subjbias_zeromean' in kwargs and kwargs['force_subjbias_zeromean'] is not None \
             else cls.DEFAULT_FORCE_SUBJBIAS_ZEROMEAN
         assert isinstance(force_subjbias_zeromean, bool)
+        if gradient_method == 'lbfgs':
+            assert force_subjbias_zeromean, 'lbfgs always solves for a zero-mean observer_bias'
+
+        # engine: dense - iterate over the NaN-padded E x S opinion score matrix
+        #         inplace - iterate over the E x S opinion score matrix, updating preallocated buffers in place
+        #         sparse - iterate over the (dis_video, subject, score) triplets of observed scores only
+        engine_type = kwargs['engine'] if 'engine' in kwargs and kwargs['engine'] is not None else cls.DEFAULT_ENGINE
+        assert engine_type in ['dense', 'inplace', 'sparse']
+
+        # profile: if True, time each iteration and trace the memory it allocates, reported under result['profile']
+        profile = kwargs['profile'] if 'profile' in kwargs and kwargs['profile'] is not None else False
+        assert isinstance(profile, bool)
+
+        # acceleration: None - plain damped iterations
+        #               squarem - SQUAREM extrapolation, falling back to plain iterations if the likelihood drops
+        acceleration = kwargs['acceleration'] if 'acceleration' in kwargs else None
+        assert acceleration in [None, 'squarem']
+        if gradient_method == 'lbfgs':
+            assert acceleration is None, 'acceleration does not apply to lbfgs'
+
+        # initial_params: None - start from MOS, zero bias and residual stds
+        #                 dict - warm start, e.g. from a previous result, see _get_warm_start_params()
+        initial_params = kwargs['initial_params'] if 'initial_params' in kwargs else None
+        assert initial_params is None or isinstance(initial_params, dict)
 
-        def sum_over_content_id(xs, cids, num_c):
-            assert len(xs) == len(cids)
-            for cid in set(cids):
-                assert cid in range(num_c), \
-                    'content id must be in [0, {num_c}), but is {cid}'.format(num_c=num_c, cid=cid)
-            sums = np.zeros(num_c)
-            for x, cid in zip(xs, cids):
-                sums[cid] += x
-            return sums
-
-        def std_over_subject_and_content_id(x_es, cids, num_c):
-            assert x_es.shape[0] == len(cids)
-            for cid in set(cids):
-                assert cid in range(num_c), \
-                    'content id must be in [0, {num_c}), but is {cid}'.format(num_c=num_c, cid=cid)
-            ls = [[] for _ in range(num_c)]
-            for idx_cid, cid in enumerate(cids):
-                ls[cid] = ls[cid] + list(x_es[idx_cid, :])
-            stds = []
-            for l in ls:
-                stds.append(pd.Series(l).std(ddof=0))
-            return np.array(stds)
-
-        def one_or_nan(x):
-            y = np.ones(x.shape)
-            y[np.isnan(x)] = float('nan')
-            return y
+        C = dataset_reader.max_content_id_of_ref_videos + 1
 
-        ret = cls._get_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs)
-        x_es = ret['opinion_score_2darray']
-        x_es_original = ret['original_opinion_score_2darray']
+        # with lbfgs, the engine still runs a 'simplified' sweep to derive the stds
+        engine, mos, original_E, original_S, original_num_os = \
+            cls._get_engine(engine_type, dataset_reader, C,
+                            'simplified' if gradient_method == 'lbfgs' else gradient_method,
+                            numerical_pdf, kwargs)
 
-        E, S = x_es.shape
-        C = dataset_reader.max_content_id_of_ref_videos + 1
+        E, S = engine.E, engine.S
 
         # === initialization ===
 
-        mos = np.array(MosModel(dataset_reader).run_modeling()['quality_scores'])
-        r_es = x_es - np.tile(mos, (S, 1)).T # r_es: residual at e, s
-        sigma_r_s = pd.DataFrame(r_es).std(axis=0, ddof=0) # along e
-        assert len(sigma_r_s) == S
-        sigma_r_c = std_over_subject_and_content_id(r_es, dataset_reader.content_id_of_dis_videos, C)
-        assert len(sigma_r_c) == C
-
-        x_e = mos # use MOS as initial value for x_e
-        b_s = np.zeros(S)
-        v_s = np.zeros(S) if cls.mode == 'SUBJECT_OBLIVIOUS' else sigma_r_s
-        a_c = np.zeros(C) if cls.mode == 'CONTENT_OBLIVIOUS' else sigma_r_c
+        x_e, b_s, v_s, a_c = engine.get_initial_params(mos) # use MOS as initial value for x_e
+        if initial_params is not None:
+            params = cls._get_warm_start_params(dataset_reader, initial_params, {
+                'quality_scores': x_e, 'observer_bias': b_s, 'observer_inconsistency': v_s, 'content_ambiguity': a_c})
+            x_e, b_s, v_s, a_c = params['quality_scores'], params['observer_bias'], \
+                params['observer_inconsistency'], params['content_ambiguity']
+        if cls.mode == 'SUBJECT_OBLIVIOUS':
+            v_s = np.zeros(S)
+        if cls.mode == 'CONTENT_OBLIVIOUS':
+            a_c = np.zeros(C)
 
         x_e_std = None
         b_s_std = None
@@ -711,262 +877,335 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
 
         # === iterations ===
 
+        if gradient_method == 'lbfgs':
+
+            trace = IterationTrace.from_kwargs(['change', 'loglikelihood', 'x_e', 'b_s', 'v_s', 'a_c'],
+                                               engine.LBFGS_MAX_ITR, kwargs, title='L-BFGS-B')
+
+            x_e_prev = {'x_e': x_e}
+
+            def record(itr, params):
+                delta_x_e = linalg.norm(x_e_prev['x_e'] - params[0])
+                x_e_prev['x_e'] = params[0]
+                # only evaluated on the iterations sampled by the trace
+                return trace.record(itr, change=delta_x_e,
+                                    loglikelihood=lambda: engine.loglikelihood(*params),
+                                    x_e=lambda: np.nanmean(params[0]), b_s=lambda: np.nanmean(params[1]),
+                                    v_s=lambda: np.nanmean(params[2]), a_c=lambda: np.nanmean(params[3]))
+
+            (x_e, b_s, v_s, a_c), itr = engine.solve_lbfgs(x_e, b_s, v_s, a_c, callback=record)
+
+            # stds from the curvature used by a coordinate-wise sweep at the optimum
+            _, (x_e_std, b_s_std, v_s_std, a_c_std) = engine.sweep(x_e, b_s, v_s, a_c)
+
+        else:
+
+            MAX_ITR = 10000
+
+            trace = IterationTrace.from_kwargs(['change', 'loglikelihood', 'x_e', 'b_s', 'v_s', 'a_c'], MAX_ITR,
+                                               kwargs, title='Belief Propagation')
+
+            sweep = engine.profiled_sweep if profile else engine.sweep
+
+            if acceleration == 'squarem':
+                squarem = Squarem(lambda params: sweep(*params),
+                                  objective_fcn=lambda params: engine.loglikelihood(*params),
+                                  lower_bounds=(None, None, 0.0, 0.0))
+
+            itr = 0
+            while True:
+
+                x_e_prev = x_e
+
+                if acceleration == 'squarem':
+                    (x_e, b_s, v_s, a_c), (x_e_std, b_s_std, v_s_std, a_c_std), (x_e_prev, _, _, _), num_sweeps = \
+                        squarem.step((x_e, b_s, v_s, a_c))
+                    itr += num_sweeps
+                else:
+                    (x_e, b_s, v_s, a_c), (x_e_std, b_s_std, v_s_std, a_c_std) = sweep(x_e, b_s, v_s, a_c)
+                    itr += 1
+
+                delta_x_e = linalg.norm(x_e_prev - x_e)
+
+                # only evaluated on the iterations sampled by the trace
+                params = (x_e, b_s, v_s, a_c)
+                stop = trace.record(itr, change=delta_x_e,
+                                    loglikelihood=lambda: engine.loglikelihood(*params),
+                                    x_e=lambda: np.nanmean(params[0]), b_s=lambda: np.nanmean(params[1]),
+                                    v_s=lambda: np.nanmean(params[2]), a_c=lambda: np.nanmean(params[3]))
+
+                if delta_x_e < delta_thr:
+                    break
+
+                if itr >= MAX_ITR:
+                    break
+
+                if stop:
+                    break
+
+        trace.close()
+
+        result = cls._get_result(dataset_reader, engine, engine_type, (x_e, b_s, v_s, a_c),
+                                 (x_e_std, b_s_std, v_s_std, a_c_std), itr, force_subjbias_zeromean,
+                                 original_E, original_S, original_num_os)
+        result['trace'] = trace.to_dict()
+
+        if profile:
+            sec_per_iter = [stats['sec'] for stats in engine.sweep_stats]
+            alloc_bytes_per_iter = [stats['alloc_bytes'] for stats in engine.sweep_stats]
+            result['profile'] = {
+                'engine': engine_type,
+                'workspace_nbytes': engine.workspace_nbytes,
+                'sec_per_iter': sec_per_iter,
+                'alloc_bytes_per_iter': alloc_bytes_per_iter,
+                'mean_sec_per_iter': np.mean(sec_per_iter) if sec_per_iter else None,
+                'mean_alloc_bytes_per_iter': np.mean(alloc_bytes_per_iter)
+                if alloc_bytes_per_iter and None not in alloc_bytes_per_iter else None,
+            }
+
+        return result
+
+    @classmethod
+    def run_modeling_batch(cls, dataset_readers, **kwargs):
+        """
+        Solve the MLE problems of several datasets together, e.g. the draws of
+        a synthetic validation, and return the list of their results, as
+        run_modeling() would for each dataset reader.
+
+        The dataset readers must share their distorted videos (and so their
+        content ids), but may differ in number of subjects: the opinion score
+        matrices are padded with NaN columns to the largest number of subjects
+        and stacked into a K x E x S tensor, which the inplace engine sweeps in
+        one go. Each problem stops on its own convergence check, and is left
+        out of the sweeps once half of the stacked problems are done.
+
+        Only the analytic gradient methods ('simplified' and 'original') with
+        the 'gaussian' numerical_pdf are supported.
+        """
+
+        assert cls.mode in ['DEFAULT', 'SUBJECT_OBLIVIOUS', 'CONTENT_OBLIVIOUS']
+
+        if 'subject_rejection' in kwargs and kwargs['subject_rejection'] is True:
+            assert False, '{} must not and need not apply subject rejection.'.format(cls.__name__)
+
+        gradient_method = kwargs['gradient_method'] if 'gradient_method' in kwargs else cls.DEFAULT_GRADIENT_METHOD
+        assert gradient_method in ['simplified', 'original']
+
+        numerical_pdf = kwargs['numerical_pdf'] if 'numerical_pdf' in kwargs else cls.DEFAULT_NUMERICAL_PDF
+        assert numerical_pdf == 'gaussian'
+
+        delta_thr = kwargs['delta_thr'] if 'delta_thr' in kwargs else cls.DEFAULT_DELTA_THR
+
+        force_subjbias_zeromean = kwargs['force_subjbias_zeromean'] \
+            if 'force_subjbias_zeromean' in kwargs and kwargs['force_subjbias_zeromean'] is not None \
+            else cls.DEFAULT_FORCE_SUBJBIAS_ZEROMEAN
+        assert isinstance(force_subjbias_zeromean, bool)
+
+        dataset_readers = list(dataset_readers)
+        assert len(dataset_readers) > 0
+
+        # initial_params: None, or a list with a warm start dict (or None) per dataset reader
+        initial_params = kwargs['initial_params'] if 'initial_params' in kwargs else None
+        assert initial_params is None or len(initial_params) == len(dataset_readers)
+        content_id_of_dis_videos = dataset_readers[0].content_id_of_dis_videos
+        for dataset_reader in dataset_readers:
+            assert dataset_reader.content_id_of_dis_videos == content_id_of_dis_videos, \
+                'dataset readers must share the same distorted videos'
+        C = max(dataset_reader.max_content_id_of_ref_videos for dataset_reader in dataset_readers) + 1
+
+        x_ess = []
+        x_ess_original = []
+        moss = []
+        for dataset_reader in dataset_readers:
+            ret = cls._get_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs)
+            x_ess.append(ret['opinion_score_2darray'])
+            x_ess_original.append(ret['original_opinion_score_2darray'])
+            moss.append(MosModel(dataset_reader).run_modeling()['quality_scores'])
+
+        K = len(x_ess)
+        E = len(content_id_of_dis_videos)
+        S = max(x_es.shape[1] for x_es in x_ess)
+        x_kes = np.full([K, E, S], float('NaN'))
+        for k, x_es in enumerate(x_ess):
+            x_kes[k, :, :x_es.shape[1]] = x_es
+
+        engine = InplaceMleEngine(x_kes, content_id_of_dis_videos, C, cls.mode, gradient_method, numerical_pdf)
+
+        # === initialization ===
+
+        params = engine.get_initial_params(np.array(moss))
+        if initial_params is not None:
+            for k, dataset_reader in enumerate(dataset_readers):
+                if initial_params[k] is None:
+                    continue
+                S_k = x_ess[k].shape[1]
+                params_k = cls._get_warm_start_params(dataset_reader, initial_params[k], {
+                    'quality_scores': params[0][k], 'observer_bias': params[1][k, :S_k],
+                    'observer_inconsistency': params[2][k, :S_k], 'content_ambiguity': params[3][k]})
+                params[0][k] = params_k['quality_scores']
+                params[1][k, :S_k] = params_k['observer_bias']
+                params[2][k, :S_k] = params_k['observer_inconsistency']
+                params[3][k] = params_k['content_ambiguity']
+        if cls.mode == 'SUBJECT_OBLIVIOUS':
+            params = (params[0], params[1], np.zeros([K, S]), params[3])
+        if cls.mode == 'CONTENT_OBLIVIOUS':
+            params = (params[0], params[1], params[2], np.zeros([K, C]))
+
+        # === iterations ===
+
         MAX_ITR = 10000
-        REFRESH_RATE = 0.1
-        EPSILON = 1e-3
 
-        print('=== Belief Propagation ===')
+        trace = IterationTrace.from_kwargs(['num_converged'], MAX_ITR, kwargs,
+                                           title='Belief Propagation (batch of {K})'.format(K=K))
+
+        solved_params, solved_stds, num_iters = cls._solve_batch(engine, params, delta_thr, MAX_ITR, trace)
+
+        trace.close()
+
+        results = []
+        for k, dataset_reader in enumerate(dataset_readers):
+            x_es, x_es_original = x_ess[k], x_ess_original[k]
+            S_k = x_es.shape[1]
+            x_e, b_s, v_s, a_c = solved_params[k]
+            x_e_std, b_s_std, v_s_std, a_c_std = solved_stds[k]
+            # drop the padded subjects
+            params_k = (x_e, b_s[:S_k], v_s[:S_k], a_c)
+            stds_k = (x_e_std, b_s_std[:S_k], v_s_std[:S_k], a_c_std)
+            engine_k = InplaceMleEngine(x_es, content_id_of_dis_videos, C, cls.mode, gradient_method, numerical_pdf)
+            original_E, original_S = x_es_original.shape
+            original_num_os = np.sum(~np.isnan(x_es_original))
+            result = cls._get_result(dataset_reader, engine_k, 'inplace', params_k, stds_k, num_iters[k],
+                                     force_subjbias_zeromean, original_E, original_S, original_num_os)
+            result['trace'] = trace.to_dict()
+            cls._postprocess_model_result(result, **kwargs)
+            results.append(result)
+
+        return results
+
+    @classmethod
+    def _solve_batch(cls, engine, params, delta_thr, max_itr, trace):
+        """
+        Sweep the problems stacked along the leading batch axis of engine,
+        from params, each until its own convergence check. Return the
+        per-problem parameters, stds and numbers of iterations.
+        """
+
+        K = len(params[0])
+
+        problems = np.arange(K) # problems stacked in the engine
+        pending = np.ones(K, dtype=bool) # of those, the ones not converged yet
+        solved_params = [None] * K
+        solved_stds = [None] * K
+        num_iters = [None] * K
 
-        then = time.time()
         itr = 0
-        while True:
+        while len(problems) > 0:
 
-            x_e_prev = x_e
+            x_e_prev = params[0]
 
-            # ==== (12) b_s ====
-
-            if gradient_method == 'simplified':
-                a_c_e = np.array([a_c[i] for i in dataset_reader.content_id_of_dis_videos])
-                num_num = x_es - np.tile(x_e, (S, 1)).T
-                num_den = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
-                num = pd.DataFrame(num_num / num_den).sum(axis=0) # sum over e
-                den_num = one_or_nan(x_es) # 1 and nan
-                den_den = num_den
-                den = pd.DataFrame(den_num / den_den).sum(axis=0) # sum over e
-                b_s_new = num / den
-                b_s = b_s * (1.0 - REFRESH_RATE) + b_s_new * REFRESH_RATE
-                b_s_std = 1.0 / np.sqrt(np.maximum(0., den))  # calculate std of x_e
-
-            elif gradient_method == 'original':
-                a_c_e = np.array([a_c[i] for i in dataset_reader.content_id_of_dis_videos])
-                vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
-                order1 = (x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))) / vs2_add_ace2
-                order1 = pd.DataFrame(order1).sum(axis=0) # sum over e
-                order2 = - one_or_nan(x_es) / vs2_add_ace2
-                order2 = pd.DataFrame(order2).sum(axis=0) # sum over e
-                b_s_new = b_s - order1 / order2
-                b_s = b_s * (1.0 - REFRESH_RATE) + b_s_new * REFRESH_RATE
-                b_s_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of x_e
-
-            elif gradient_method == 'numerical':
-                axis = 0 # sum over e
-                order1 = (cls.loglikelihood_fcn(x_es, x_e, b_s + EPSILON / 2.0, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf) -
-                         cls.loglikelihood_fcn(x_es, x_e, b_s - EPSILON / 2.0, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON
-                order2 = (cls.loglikelihood_fcn(x_es, x_e, b_s + EPSILON, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)
-                                  - 2 * cls.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)
-                                  + cls.loglikelihood_fcn(x_es, x_e, b_s - EPSILON, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON**2
-                b_s_new = b_s - order1 / order2
-                b_s = b_s * (1.0 - REFRESH_RATE) + b_s_new * REFRESH_RATE
-                b_s_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of x_e
+            params, stds = engine.sweep(*params)
+            itr += 1
 
-            else:
-                assert False
-
-            if cls.mode == 'SUBJECT_OBLIVIOUS':
-                b_s = np.zeros(S) # forcing zero, hence disabling
-                b_s_std = np.zeros(S)
-
-            # ==== (14) v_s ====
-
-            if gradient_method == 'simplified':
-                a_c_e = np.array([a_c[i] for i in dataset_reader.content_id_of_dis_videos])
-                a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
-                vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
-                vs2_minus_ace2 = np.tile(v_s**2, (E, 1)) - np.tile(a_c_e**2, (S, 1)).T
-                num = - np.tile(v_s, (E, 1)) / vs2_add_ace2 + np.tile(v_s, (E, 1)) * a_es**2 / vs2_add_ace2**2
-                num = pd.DataFrame(num).sum(axis=0) # sum over e
-                poly_term = np.tile(a_c_e**4, (S, 1)).T \
-                      - 3 * np.tile(v_s**4, (E, 1)) \
-                      - 2 * np.tile(v_s**2, (E, 1)) * np.tile(a_c_e**2, (S, 1)).T
-                den = vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
-                den = pd.DataFrame(den).sum(axis=0) # sum over e
-                v_s_new = v_s - num / den
-                v_s = v_s * (1.0 - REFRESH_RATE) + v_s_new * REFRESH_RATE
-                # calculate std of v_s
-                lpp = pd.DataFrame(
-                    vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
-                ).sum(axis=0) # sum over e
-                v_s_std = 1.0 / np.sqrt(np.maximum(0., -lpp))
-
-            elif gradient_method == 'original':
-                a_c_e = np.array([a_c[i] for i in dataset_reader.content_id_of_dis_videos])
-                a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
-                vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
-                vs2_minus_ace2 = np.tile(v_s**2, (E, 1)) - np.tile(a_c_e**2, (S, 1)).T
-                poly_term = np.tile(a_c_e**4, (S, 1)).T \
-                      - 3 * np.tile(v_s**4, (E, 1)) \
-                      - 2 * np.tile(v_s**2, (E, 1)) * np.tile(a_c_e**2, (S, 1)).T
-                order1 = - np.tile(v_s, (E, 1)) / vs2_add_ace2 + np.tile(v_s, (E, 1)) * a_es**2 / vs2_add_ace2**2
-                order1 = pd.DataFrame(order1).sum(axis=0) # sum over e
-                order2 = vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
-                order2 = pd.DataFrame(order2).sum(axis=0) # sum over e
-                v_s_new = v_s - order1 / order2
-                v_s = v_s * (1.0 - REFRESH_RATE) + v_s_new * REFRESH_RATE
-                v_s_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of v_s
-
-            elif gradient_method == 'numerical':
-                axis = 0 # sum over e
-                order1 = (cls.loglikelihood_fcn(x_es, x_e, b_s, v_s + EPSILON / 2.0, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf) -
-                         cls.loglikelihood_fcn(x_es, x_e, b_s, v_s - EPSILON / 2.0, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON
-                order2 = (cls.loglikelihood_fcn(x_es, x_e, b_s, v_s + EPSILON, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)
-                                  - 2 * cls.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)
-                                  + cls.loglikelihood_fcn(x_es, x_e, b_s, v_s - EPSILON, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON**2
-                v_s_new = v_s - order1 / order2
-                v_s = v_s * (1.0 - REFRESH_RATE) + v_s_new * REFRESH_RATE
-                v_s_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of v_s
+            # NaN-tolerant, unlike linalg.norm
+            delta_x_e = np.sqrt(np.sum((x_e_prev - params[0]) ** 2, axis=-1))
 
-            else:
-                assert False
-
-            # force non-negative
-            v_s = np.maximum(v_s, 0.0 * np.ones(v_s.shape))
-
-            if cls.mode == 'SUBJECT_OBLIVIOUS':
-                v_s = np.zeros(S) # forcing zero, hence disabling
-                v_s_std = np.zeros(S)
-
-            # ==== (15) a_c ====
-
-            if gradient_method == 'simplified':
-                a_c_e = np.array([a_c[i] for i in dataset_reader.content_id_of_dis_videos])
-                a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
-                vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
-                vs2_minus_ace2 = np.tile(v_s**2, (E, 1)) - np.tile(a_c_e**2, (S, 1)).T
-                num = - np.tile(a_c_e, (S, 1)).T / vs2_add_ace2 + np.tile(a_c_e, (S, 1)).T * a_es**2 / vs2_add_ace2**2
-                num = pd.DataFrame(num).sum(axis=1) # sum over s
-                num = sum_over_content_id(num, dataset_reader.content_id_of_dis_videos, C)  # sum over e:c(e)=c
-                poly_term = np.tile(v_s**4, (E, 1)) \
-                      - 3 * np.tile(a_c_e**4, (S, 1)).T \
-                      - 2 * np.tile(v_s**2, (E, 1)) * np.tile(a_c_e**2, (S, 1)).T
-                den = - vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
-                den = pd.DataFrame(den).sum(axis=1) # sum over s
-                den = sum_over_content_id(den, dataset_reader.content_id_of_dis_videos, C)  # sum over e:c(e)=c
-                # check: 'den' is 0 in test/subjective_model_test.py::SubjectiveModelPartialTest::test_observer_content_aware_subjective_model_nocontent
-                a_c_new = a_c - num / den
-                a_c = a_c * (1.0 - REFRESH_RATE) + a_c_new * REFRESH_RATE
-                # calculate std of a_c
-                lpp = sum_over_content_id(
-                    pd.DataFrame(
-                        -vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
-                    ).sum(axis=1),
-                    dataset_reader.content_id_of_dis_videos,
-                    C
-                )  # sum over e:c(e)=c
-                # check: max(0, ...) leads to division by zero
-                a_c_std = 1.0 /np.sqrt(np.maximum(0., -lpp))
-
-            elif gradient_method == 'original':
-                a_c_e = np.array([a_c[i] for i in dataset_reader.content_id_of_dis_videos])
-                a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
-                vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
-                vs2_minus_ace2 = np.tile(v_s**2, (E, 1)) - np.tile(a_c_e**2, (S, 1)).T
-                poly_term = np.tile(v_s**4, (E, 1)) \
-                      - 3 * np.tile(a_c_e**4, (S, 1)).T \
-                      - 2 * np.tile(v_s**2, (E, 1)) * np.tile(a_c_e**2, (S, 1)).T
-                order1 = - np.tile(a_c_e, (S, 1)).T / vs2_add_ace2 + np.tile(a_c_e, (S, 1)).T * a_es**2 / vs2_add_ace2**2
-                order1 = pd.DataFrame(order1).sum(axis=1) # sum over s
-                order1 = sum_over_content_id(order1, dataset_reader.content_id_of_dis_videos, C) # sum over e:c(e)=c
-                order2 = - vs2_minus_ace2 / vs2_add_ace2**2 + a_es**2 * poly_term / vs2_add_ace2**4
-                order2 = pd.DataFrame(order2).sum(axis=1) # sum over s
-                order2 = sum_over_content_id(order2, dataset_reader.content_id_of_dis_videos, C) # sum over e:c(e)=c
-                a_c_new = a_c - order1 / order2
-                a_c = a_c * (1.0 - REFRESH_RATE) + a_c_new * REFRESH_RATE
-                a_c_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of a_c
-
-            elif gradient_method == 'numerical':
-                axis = 1 # sum over s
-                order1 = (cls.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c + EPSILON / 2.0, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf) -
-                         cls.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c - EPSILON / 2.0, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON
-                order2 = (cls.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c + EPSILON, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)
-                                  - 2 * cls.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)
-                                  + cls.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c - EPSILON, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON**2
-                order1 = sum_over_content_id(order1, dataset_reader.content_id_of_dis_videos, C) # sum over e:c(e)=c
-                order2 = sum_over_content_id(order2, dataset_reader.content_id_of_dis_videos, C) # sum over e:c(e)=c
-                a_c_new = a_c - order1 / order2
-                a_c = a_c * (1.0 - REFRESH_RATE) + a_c_new * REFRESH_RATE
-                a_c_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of a_c
+            # on a stop requested by the callback, the pending problems are
+            # returned as they are, and so are the diverged ones
+            stop = trace.record(itr, num_converged=K - len(problems) + np.sum(~pending | (delta_x_e < delta_thr)))
 
-            else:
-                assert False
-
-            # force non-negative
-            a_c = np.maximum(a_c, 0.0 * np.ones(a_c.shape))
-
-            if cls.mode == 'CONTENT_OBLIVIOUS':
-                a_c = np.zeros(C) # forcing zero, hence disabling
-                a_c_std = np.zeros(C)
-
-            # (11) ==== x_e ====
-
-            if gradient_method == 'simplified':
-                a_c_e = np.array([a_c[i] for i in dataset_reader.content_id_of_dis_videos])
-                num_num = x_es - np.tile(b_s, (E, 1))
-                num_den = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
-                num = pd.DataFrame(num_num / num_den).sum(axis=1) # sum over s
-                den_num = one_or_nan(x_es) # 1 and nan
-                den_den = num_den
-                den = pd.DataFrame(den_num / den_den).sum(axis=1) # sum over s
-                x_e_new = num / den
-                x_e = x_e * (1.0 - REFRESH_RATE) + x_e_new * REFRESH_RATE
-                x_e_std = 1.0 / np.sqrt(np.maximum(0., den))  # calculate std of x_e
-
-            elif gradient_method == 'original':
-                a_c_e = np.array([a_c[i] for i in dataset_reader.content_id_of_dis_videos])
-                a_es = x_es - np.tile(x_e, (S, 1)).T - np.tile(b_s, (E, 1))
-                vs2_add_ace2 = np.tile(v_s**2, (E, 1)) + np.tile(a_c_e**2, (S, 1)).T
-                order1 = a_es / vs2_add_ace2
-                order1 = pd.DataFrame(order1).sum(axis=1) # sum over s
-                order2 = - one_or_nan(x_es) / vs2_add_ace2
-                order2 = pd.DataFrame(order2).sum(axis=1) # sum over s
-                x_e_new = x_e - order1 / order2
-                x_e = x_e * (1.0 - REFRESH_RATE) + x_e_new * REFRESH_RATE
-                x_e_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of x_e
-
-            elif gradient_method == 'numerical':
-                axis = 1 # sum over s
-                order1 = (cls.loglikelihood_fcn(x_es, x_e + EPSILON / 2.0, b_s, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf) -
-                         cls.loglikelihood_fcn(x_es, x_e - EPSILON / 2.0, b_s, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON
-                order2 = (cls.loglikelihood_fcn(x_es, x_e + EPSILON, b_s, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)
-                                  - 2 * cls.loglikelihood_fcn(x_es, x_e, b_s, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)
-                                  + cls.loglikelihood_fcn(x_es, x_e - EPSILON, b_s, v_s, a_c, dataset_reader.content_id_of_dis_videos, axis, numerical_pdf)) / EPSILON**2
-                x_e_new = x_e - order1 / order2
-                x_e = x_e * (1.0 - REFRESH_RATE) + x_e_new * REFRESH_RATE
-                x_e_std = 1.0 / np.sqrt(np.maximum(0., -order2))  # calculate std of x_e
+            done = pending & ((delta_x_e < delta_thr) | ~np.isfinite(delta_x_e) | (itr >= max_itr) | stop)
+            for idx in np.flatnonzero(done):
+                solved_params[problems[idx]] = tuple(p[idx] for p in params)
+                solved_stds[problems[idx]] = tuple(std[idx] for std in stds)
+                num_iters[problems[idx]] = itr
+            pending &= ~done
 
-            else:
-                assert False
+            if np.sum(pending) <= len(problems) // 2:
+                # unstack the converged problems, once they make up half of the sweep
+                problems = problems[pending]
+                params = tuple(p[pending] for p in params)
+                if len(problems) > 0:
+                    engine = engine.subset(pending)
+                pending = pending[pending]
 
-            itr += 1
+        return solved_params, solved_stds, num_iters
 
-            delta_x_e = linalg.norm(x_e_prev - x_e)
+    @classmethod
+    def _run_modeling_weighted_batch(cls, dataset_reader, weights_e, weights_s, initial_params, **kwargs):
+        """
+        Solve the MLE problem of the dataset under each of a batch of
+        weightings of its distorted videos (weights_e, K x E) and of its
+        subjects (weights_s, K x S), either of which may be None for unit
+        weights. The weights are multiplicities, as in InplaceMleEngine, which
+        sweeps all K problems at once on the one opinion score matrix. Each
+        problem is warm started from initial_params, a result of run_modeling()
+        on the dataset.
+
+        Return the quality_scores, observer_bias, observer_inconsistency and
+        content_ambiguity as K x E, K x S, K x S and K x C arrays, and the
+        num_iter of each problem.
+        """
 
-            loglikelihood = np.sum(cls.loglikelihood_fcn(
-                x_es, x_e, b_s, v_s, a_c, dataset_reader.content_id_of_dis_videos, 1, numerical_pdf))
+        gradient_method = kwargs['gradient_method'] if 'gradient_method' in kwargs else cls.DEFAULT_GRADIENT_METHOD
+        assert gradient_method in ['simplified', 'original']
 
-            now = time.time()
-            elapsed = now - then
-            then = now
+        numerical_pdf = kwargs['numerical_pdf'] if 'numerical_pdf' in kwargs else cls.DEFAULT_NUMERICAL_PDF
+        assert numerical_pdf == 'gaussian'
 
-            msg = 'Iteration {itr:4d}: sec {sec:.1f}, change {delta_x_e}, loglikelihood {loglikelihood}, x_e {x_e}, b_s {b_s}, v_s {v_s}, a_c {a_c}'.\
-                format(sec=elapsed, itr=itr, delta_x_e=delta_x_e, loglikelihood=loglikelihood, x_e=np.nanmean(x_e), b_s=np.nanmean(b_s), v_s=np.nanmean(v_s), a_c=np.nanmean(a_c))
-            # msg = 'Iteration {itr:4d}: sec {sec:.1f}, change {delta_x_e}, likelihood {likelihood}, x_e {x_e}, b_s {b_s}, v_s {v_s}, a_c {a_c}'.\
-            #     format(sec=elapsed, itr=itr, delta_x_e=delta_x_e, likelihood=likelihood, x_e=(np.min(x_e), np.mean(x_e), np.max(x_e)), b_s=(np.min(b_s), np.mean(b_s), np.max(b_s)), v_s=(np.min(v_s), np.mean(v_s), np.max(v_s)), a_c=(np.min(a_c), np.mean(a_c), np.max(a_c)))
-            # msg = 'Iteration {itr:4d}: sec {sec:.1f}, change {delta_x_e}, likelihood {likelihood}, x_e {x_e}, b_s {b_s}, v_s (min) {v_s} ({v_s_min}), a_c (min) {a_c} ({a_c_min})'.\
-            #     format(sec=elapsed, itr=itr, delta_x_e=delta_x_e, likelihood=likelihood, x_e=np.mean(x_e), b_s=np.mean(b_s), v_s=np.mean(v_s), v_s_min=np.min(v_s), a_c=np.mean(a_c), a_c_min=np.min(a_c))
+        delta_thr = kwargs['delta_thr'] if 'delta_thr' in kwargs else cls.DEFAULT_DELTA_THR
 
-            sys.stdout.write(msg + '\r')
-            sys.stdout.flush()
-            # print(msg)
+        assert weights_e is not None or weights_s is not None
+        K = len(weights_e) if weights_e is not None else len(weights_s)
+        assert weights_e is None or np.ndim(weights_e) == 2
+        assert weights_s is None or (np.ndim(weights_s) == 2 and len(weights_s) == K)
 
-            # time.sleep(0.001)
+        x_es = cls._get_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs)['opinion_score_2darray']
+        E, S = x_es.shape
+        C = dataset_reader.max_content_id_of_ref_videos + 1
 
-            if delta_x_e < delta_thr:
-                break
+        engine = InplaceMleEngine(x_es, dataset_reader.content_id_of_dis_videos, C, cls.mode,
+                                  gradient_method, numerical_pdf, weights_e, weights_s)
 
-            if itr >= MAX_ITR:
-                break
+        # === initialization ===
+
+        def tile(key, n):
+            xs = initial_params[key] if key in initial_params else np.zeros(n)
+            return np.tile(np.asarray(xs, dtype=float), (K, 1))
+
+        params = (tile('quality_scores', E), tile('observer_bias', S),
+                  tile('observer_inconsistency', S), tile('content_ambiguity', C))
+
+        # === iterations ===
+
+        MAX_ITR = 10000
+
+        trace = IterationTrace.from_kwargs(['num_converged'], MAX_ITR, kwargs,
+                                           title='Belief Propagation (batch of {K} weightings)'.format(K=K))
+
+        # a content without any weighted video has a NaN ambiguity, as in an
+        # unweighted solve without any of its videos
+        with np.errstate(divide='ignore', invalid='ignore'):
+            solved_params, _, num_iters = cls._solve_batch(engine, params, delta_thr, MAX_ITR, trace)
+
+        trace.close()
 
-        sys.stdout.write("\n")
+        return {
+            'quality_scores': np.array([p[0] for p in solved_params]),
+            'observer_bias': np.array([p[1] for p in solved_params]),
+            'observer_inconsistency': np.array([p[2] for p in solved_params]),
+            'content_ambiguity': np.array([p[3] for p in solved_params]),
+            'num_iter': num_iters,
+        }
+
+    @classmethod
+    def _get_result(cls, dataset_reader, engine, engine_type, params, stds, itr, force_subjbias_zeromean,
+                    original_E, original_S, original_num_os):
+        """
+        Assemble the result dict from the solved parameters and their stds.
+        """
+
+        x_e, b_s, v_s, a_c = params
+        x_e_std, b_s_std, v_s_std, a_c_std = stds
 
         assert x_e_std is not None
         assert b_s_std is not None
@@ -977,8 +1216,6 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
             x_e += mean_b_s
 
         result = {
-            'raw_scores': x_es,
-
             'quality_scores': list(x_e),
             'quality_scores_std': list(x_e_std),
             'quality_scores_ci95': [list(1.95996 * x_e_std),
@@ -986,9 +1223,8 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
             'num_iter': itr,
         }
 
-
         if cls.mode != 'SUBJECT_OBLIVIOUS':
-            cnt_s = np.sum(~np.isnan(x_es), axis=0)  # number of samples along i
+            cnt_s = engine.num_os_per_subject()  # number of samples along i
             result['observer_bias'] = list(b_s)
             result['observer_bias_std'] = list(b_s_std)
             result['observer_bias_ci95'] = [list(1.95996 * b_s_std),
@@ -1014,20 +1250,19 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
         except AssertionError:
             pass
 
-        result['reconstructions'] = cls._get_reconstructions(x_es, x_e, b_s)
+        if engine_type != 'sparse':
+            # the sparse engine never materializes the E x S matrices
+            result['raw_scores'] = engine.x_es
+            result['reconstructions'] = cls._get_reconstructions(engine.x_es, x_e, b_s)
 
-        original_E, original_S = x_es_original.shape
-        original_num_os = np.sum(~np.isnan(x_es_original))
         original_C = dataset_reader.max_content_id_of_ref_videos + 1
 
-        num_os = np.sum(~np.isnan(x_es))
+        num_os = engine.num_os
 
         dof = cls._get_dof(original_E, original_S, original_C) / original_num_os  # dof per observation
         result['dof'] = dof
 
-        loglikelihood = np.sum(cls.loglikelihood_fcn(
-            x_es, x_e, b_s, v_s, a_c,
-            dataset_reader.content_id_of_dis_videos, 1, numerical_pdf)) / num_os  # log-likelihood per observation
+        loglikelihood = engine.loglikelihood(x_e, b_s, v_s, a_c) / num_os  # log-likelihood per observation
         result['loglikelihood'] = loglikelihood
 
         aic = 2 * dof - 2 * loglikelihood  # aic per observation
@@ -1038,6 +1273,48 @@ class MaximumLikelihoodEstimationModel(SubjectiveModel):
 
         return result
 
+    @classmethod
+    def _get_engine(cls, engine_type, dataset_reader, C, gradient_method, numerical_pdf, kwargs):
+        """
+        Build the iteration engine on the (preprocessed) opinion scores. Also
+        return the MOS used for initialization, and the shape and number of
+        observations of the original opinion scores.
+        """
+
+        preprocessing = any(kwargs[key] is True for key in ['dscore_mode', 'zscore_mode', 'bias_offset']
+                            if key in kwargs)
+
+        if engine_type == 'sparse' and not preprocessing:
+            # go straight from the reader to the triplets, without the E x S matrix
+            rows, cols, vals = dataset_reader.opinion_score_triplets
+            engine = SparseMleEngine(rows, cols, vals, (dataset_reader.num_dis_videos, dataset_reader.num_observers),
+                                     dataset_reader.content_id_of_dis_videos, C, cls.mode,
+                                     gradient_method, numerical_pdf)
+            mos = engine.mos()
+            return engine, mos, engine.E, engine.S, engine.num_os
+
+        ret = cls._get_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs)
+        x_es = ret['opinion_score_2darray']
+        x_es_original = ret['original_opinion_score_2darray']
+
+        mos = np.array(MosModel(dataset_reader).run_modeling()['quality_scores'])
+
+        if engine_type == 'dense':
+            engine = DenseMleEngine(x_es, dataset_reader.content_id_of_dis_videos, C, cls.mode,
+                                    gradient_method, numerical_pdf, cls.loglikelihood_fcn)
+        elif engine_type == 'inplace':
+            engine = InplaceMleEngine(x_es, dataset_reader.content_id_of_dis_videos, C, cls.mode,
+                                      gradient_method, numerical_pdf)
+        elif engine_type == 'sparse':
+            engine = SparseMleEngine.from_opinion_score_2darray(
+                x_es, dataset_reader.content_id_of_dis_videos, C, cls.mode, gradient_method, numerical_pdf)
+        else:
+            assert False
+
+        original_E, original_S = x_es_original.shape
+        original_num_os = np.sum(~np.isnan(x_es_original))
+        return engine, mos, original_E, original_S, original_num_os
+
     @classmethod
     def _get_reconstructions(cls, x_es, x_e, b_s):
         E, S = x_es.shape
@@ -1219,10 +1496,7 @@ class BiasremvMosModel(MosModel):
 
     @classmethod
     def _run_modeling(cls, dataset_reader, **kwargs):
-        ret = cls._get_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs)
-        os_2darray = ret['opinion_score_2darray']
-        original_os_2darray = ret['original_opinion_score_2darray']
-        result = cls._get_mos_and_stats(os_2darray, original_os_2darray)
+        ret, result = cls._get_preprocessed_mos_and_stats(dataset_reader, **kwargs)
         result['observer_bias'] = list(ret['bias_offset_estimate'])
         if 'observer_rejected' in ret:
             result['observer_rejected'] = ret['observer_rejected']
@@ -1271,6 +1545,9 @@ class SubjectMLEModelProjectionSolver(SubjectiveModel):
     @classmethod
     def _run_modeling(cls, dataset_reader, **kwargs):
 
+        if isinstance(dataset_reader, MemmapRawDatasetReader):
+            return cls._run_modeling_blocked(dataset_reader, **kwargs)
+
         force_subjbias_zeromean = kwargs['force_subjbias_zeromean'] if \
             'force_subjbias_zeromean' in kwargs and kwargs['force_subjbias_zeromean'] is not None else True
         assert isinstance(force_subjbias_zeromean, bool)
@@ -1289,19 +1566,36 @@ class SubjectMLEModelProjectionSolver(SubjectiveModel):
         b_ji = x_ji - np.tile(s_j, (I, 1)).T
         b_i = np.nanmean(b_ji, axis=0)  # mean marginalized over j
 
+        # initial_params: None - start from MOS and the mean deviation from it
+        #                 dict - warm start, e.g. from a previous result, see _get_warm_start_params()
+        initial_params = kwargs['initial_params'] if 'initial_params' in kwargs else None
+        assert initial_params is None or isinstance(initial_params, dict)
+        if initial_params is not None:
+            params = cls._get_warm_start_params(dataset_reader, initial_params, {
+                'quality_scores': s_j, 'observer_bias': b_i})
+            s_j, b_i = params['quality_scores'], params['observer_bias']
+
+        # acceleration: None - plain iterations
+        #               squarem - SQUAREM extrapolation, falling back to plain iterations if the likelihood drops
+        acceleration = kwargs['acceleration'] if 'acceleration' in kwargs else None
+        assert acceleration in [None, 'squarem']
+
         MAX_ITR = 1000
         DELTA_THR = 1e-8
         EPSILON = 1e-8
 
-        itr = 0
-        while True:
-
-            s_j_prev = s_j
-
-            # subject by subject, estimate subject inconsistency by averaging the residue over stimuli
+        def get_residual_stds(s_j, b_i):
             r_ji = x_ji - np.tile(s_j, (I, 1)).T - np.tile(b_i, (J, 1))
             v_i = np.nanstd(r_ji, axis=0)
             v_j = np.nanstd(r_ji, axis=1)
+            return v_i, v_j
+
+        def iterate(params):
+
+            s_j, b_i = params
+
+            # subject by subject, estimate subject inconsistency by averaging the residue over stimuli
+            v_i, v_j = get_residual_stds(s_j, b_i)
 
             # video by video, estimate MOS by averaging over subjects, inversely weighted by residue variance
             s_ji = x_ji - np.tile(b_i, (J, 1))
@@ -1312,21 +1606,47 @@ class SubjectMLEModelProjectionSolver(SubjectiveModel):
             b_ji = x_ji - np.tile(s_j, (I, 1)).T
             b_i = np.nanmean(b_ji, axis=0)  # mean marginalized over j
 
-            itr += 1
+            return (s_j, b_i), (v_i, v_j)
 
-            delta_s_j = linalg.norm(s_j_prev - s_j)
+        def loglikelihood(params):
+            s_j, b_i = params
+            v_i, _ = get_residual_stds(s_j, b_i)
+            return cls.loglikelihood_function(np.hstack([s_j, b_i, v_i]), x_ji)
+
+        if acceleration == 'squarem':
+            squarem = Squarem(iterate, objective_fcn=loglikelihood)
+
+        trace = IterationTrace.from_kwargs(['change', 's_j', 'b_i', 'v_i'], MAX_ITR, kwargs)
+
+        itr = 0
+        while True:
 
-            msg = 'Iteration {itr:4d}: change {delta_s_j}, s_j {s_j}, b_i {b_i}, v_i {v_i}'.format(
-                itr=itr, delta_s_j=delta_s_j, s_j=np.mean(s_j), b_i=np.mean(b_i), v_i=np.mean(v_i))
+            s_j_prev = s_j
+
+            if acceleration == 'squarem':
+                (s_j, b_i), (v_i, v_j), (s_j_prev, _), num_iters = squarem.step((s_j, b_i))
+                itr += num_iters
+            else:
+                (s_j, b_i), (v_i, v_j) = iterate((s_j, b_i))
+                itr += 1
 
-            sys.stdout.write(msg + '\r')
-            sys.stdout.flush()
+            delta_s_j = linalg.norm(s_j_prev - s_j)
+
+            params = (s_j, b_i, v_i)
+            stop = trace.record(itr, change=delta_s_j, s_j=lambda: np.mean(params[0]),
+                                b_i=lambda: np.mean(params[1]), v_i=lambda: np.mean(params[2]))
 
             if delta_s_j < DELTA_THR:
                 break
 
             if itr >= MAX_ITR:
                 break
+
+            if stop:
+                break
+
+        trace.close()
+
         s_j_std = cls._get_s_j_std(v_i, v_j, x_ji)
 
         den = np.nansum(cls._one_or_nan(x_ji) / np.tile(v_i ** 2, (x_ji.shape[0], 1)), axis=0)  # sum over e
@@ -1338,8 +1658,6 @@ class SubjectMLEModelProjectionSolver(SubjectiveModel):
         lpp = np.nansum(1.0 / v_i2 + r_ji ** 2 * poly_term / v_i2 ** 4, axis=0)  # sum over e
         v_i_std = 1.0 / np.sqrt(np.maximum(0., -lpp))
 
-        sys.stdout.write("\n")
-
         if force_subjbias_zeromean:
             mean_b_i = np.mean(b_i)
             b_i -= mean_b_i
@@ -1363,6 +1681,7 @@ class SubjectMLEModelProjectionSolver(SubjectiveModel):
                   ],
                   'reconstructions': cls._get_reconstructions(x_ji, s_j, b_i),
                   'num_iter': itr,
+                  'trace': trace.to_dict(),
                   }
 
         original_J, original_I = x_ji_original.shape
@@ -1384,6 +1703,264 @@ class SubjectMLEModelProjectionSolver(SubjectiveModel):
 
         return result
 
+    @classmethod
+    def _run_modeling_blocked(cls, dataset_reader, **kwargs):
+        """
+        _run_modeling() out of core, for a MemmapRawDatasetReader: each pass
+        over the opinion scores reads a block of rows at a time, keeping only
+        the arrays per video and per subject. The result has the 'raw_scores'
+        (the memmap) if not preprocessed, and no 'reconstructions'.
+        """
+
+        force_subjbias_zeromean = kwargs['force_subjbias_zeromean'] if \
+            'force_subjbias_zeromean' in kwargs and kwargs['force_subjbias_zeromean'] is not None else True
+        assert isinstance(force_subjbias_zeromean, bool)
+
+        ret = cls._get_opinion_score_blocks_with_preprocessing(dataset_reader, **kwargs)
+        x_ji = ret['opinion_score_blocks']
+        x_ji_original = ret['original_opinion_score_blocks']
+        J, I = x_ji.shape
+        cnt_i = x_ji.count(axis=0)  # number of samples along i
+
+        # video by video, estimate MOS by averaging over subjects
+        s_j = x_ji.nanmean(axis=1)  # mean marginalized over i
+
+        # subject by subject, estimate subject bias by comparing with MOS
+        b_i = x_ji.transformed(row_offsets=-s_j).nanmean(axis=0)  # mean marginalized over j
+
+        initial_params = kwargs['initial_params'] if 'initial_params' in kwargs else None
+        assert initial_params is None or isinstance(initial_params, dict)
+        if initial_params is not None:
+            params = cls._get_warm_start_params(dataset_reader, initial_params, {
+                'quality_scores': s_j, 'observer_bias': b_i})
+            s_j, b_i = params['quality_scores'], params['observer_bias']
+
+        acceleration = kwargs['acceleration'] if 'acceleration' in kwargs else None
+        assert acceleration in [None, 'squarem']
+
+        MAX_ITR = 1000
+        DELTA_THR = 1e-8
+        EPSILON = 1e-8
+
+        def get_residual_stds(s_j, b_i):
+            r_ji = x_ji.transformed(row_offsets=-s_j, col_offsets=b_i)
+            v_i = r_ji.nanstd(axis=0)
+            v_j = r_ji.nanstd(axis=1)
+            return v_i, v_j
+
+        def iterate(params):
+
+            s_j, b_i = params
+
+            # subject by subject, estimate subject inconsistency by averaging the residue over stimuli
+            v_i, v_j = get_residual_stds(s_j, b_i)
+
+            # video by video, estimate MOS by averaging over subjects, inversely weighted by residue variance
+            w_i = 1.0 / (v_i ** 2 + EPSILON)
+            s_j = x_ji.transformed(col_offsets=b_i).map_rows(
+                lambda start, stop, s_ji: weighed_nanmean_2d(s_ji, weights=w_i, axis=1))  # mean marginalized over i
+
+            # subject by subject, estimate subject bias by comparing with MOS, inversely weighted by residue variance
+            b_i = x_ji.transformed(row_offsets=-s_j).nanmean(axis=0)  # mean marginalized over j
+
+            return (s_j, b_i), (v_i, v_j)
+
+        def loglikelihood(params):
+            s_j, b_i = params
+            v_i, _ = get_residual_stds(s_j, b_i)
+            return cls._loglikelihood_blocked(s_j, b_i, v_i, x_ji)
+
+        if acceleration == 'squarem':
+            squarem = Squarem(iterate, objective_fcn=loglikelihood)
+
+        trace = IterationTrace.from_kwargs(['change', 's_j', 'b_i', 'v_i'], MAX_ITR, kwargs)
+
+        itr = 0
+        while True:
+
+            s_j_prev = s_j
+
+            if acceleration == 'squarem':
+                (s_j, b_i), (v_i, v_j), (s_j_prev, _), num_iters = squarem.step((s_j, b_i))
+                itr += num_iters
+            else:
+                (s_j, b_i), (v_i, v_j) = iterate((s_j, b_i))
+                itr += 1
+
+            delta_s_j = linalg.norm(s_j_prev - s_j)
+
+            params = (s_j, b_i, v_i)
+            stop = trace.record(itr, change=delta_s_j, s_j=lambda: np.mean(params[0]),
+                                b_i=lambda: np.mean(params[1]), v_i=lambda: np.mean(params[2]))
+
+            if delta_s_j < DELTA_THR:
+                break
+
+            if itr >= MAX_ITR:
+                break
+
+            if stop:
+                break
+
+        trace.close()
+
+        s_j_std = x_ji.map_rows(lambda start, stop, block: cls._get_s_j_std(v_i, v_j[start:stop], block))
+
+        den = x_ji.sum_rows(lambda start, stop, block: np.nansum(
+            cls._one_or_nan(block) / np.tile(v_i ** 2, (block.shape[0], 1)), axis=0))  # sum over e
+        b_i_std = 1.0 / np.sqrt(np.maximum(0., den))  # calculate std of b_i
+
+        v_i2 = v_i ** 2
+        poly_term = - 3 * v_i ** 4
+        lpp = x_ji.transformed(row_offsets=-s_j, col_offsets=b_i).sum_rows(
+            lambda start, stop, r_ji: np.nansum(1.0 / v_i2 + r_ji ** 2 * poly_term / v_i2 ** 4, axis=0))  # sum over e
+        v_i_std = 1.0 / np.sqrt(np.maximum(0., -lpp))
+
+        if force_subjbias_zeromean:
+            mean_b_i = np.mean(b_i)
+            b_i -= mean_b_i
+            s_j += mean_b_i
+
+        result = {'quality_scores': list(s_j),
+                  'quality_scores_std': list(s_j_std),
+                  'quality_scores_ci95': [list(1.95996 * s_j_std),
+                                          list(1.95996 * s_j_std)],
+                  'observer_bias': list(b_i), 'observer_bias_std': list(b_i_std),
+                  'observer_bias_ci95': [list(1.95996 * b_i_std),
+                                         list(1.95996 * b_i_std)],
+                  'observer_inconsistency': list(v_i),
+                  'observer_inconsistency_std': list(v_i_std),
+                  'observer_inconsistency_ci95': [
+                      list((1 - np.sqrt(cnt_i / chi2.ppf(1-0.025, df=cnt_i))) * v_i),
+                      list((np.sqrt(cnt_i / chi2.ppf(0.025, df=cnt_i)) - 1) * v_i),
+                  ],
+                  'num_iter': itr,
+                  'trace': trace.to_dict(),
+                  }
+        if not x_ji.is_transformed:
+            result['raw_scores'] = x_ji.array
+
+        original_J, original_I = x_ji_original.shape
+        original_num_os = np.sum(x_ji_original.count(axis=1))
+
+        num_os = np.sum(cnt_i)
+
+        dof = (original_J + original_I * 2) / original_num_os
+        result['dof'] = dof
+
+        loglikelihood = cls._loglikelihood_blocked(s_j, b_i, v_i, x_ji) / num_os
+        result['loglikelihood'] = loglikelihood
+
+        aic = 2 * dof - 2 * loglikelihood  # aic per observation
+        result['aic'] = aic
+
+        bic = np.log(original_num_os) * dof - 2 * loglikelihood  # bic per observation
+        result['bic'] = bic
+
+        return result
+
+    @classmethod
+    def _loglikelihood_blocked(cls, s_j, b_i, v_i, x_ji):
+        return np.sum(x_ji.reduce(lambda start, stop, block: cls.loglikelihood_function(
+            np.hstack([s_j[start:stop], b_i, v_i]), block)))
+
+    @classmethod
+    def _run_modeling_weighted_batch(cls, dataset_reader, weights_j, weights_i, initial_params, **kwargs):
+        """
+        Run the projection iterations of _run_modeling() under each of a batch
+        of weightings of the distorted videos (weights_j, K x J) and of the
+        subjects (weights_i, K x I), either of which may be None for unit
+        weights. The weights are multiplicities, i.e. the iterations are those
+        on the opinion score matrix with its rows and columns repeated as many
+        times, but run on the one matrix for all K problems at once. Each
+        problem is warm started from initial_params, a result of run_modeling()
+        on the dataset.
+
+        Return the quality_scores, observer_bias and observer_inconsistency as
+        K x J, K x I and K x I arrays, and the num_iter of each problem.
+        """
+
+        assert weights_j is not None or weights_i is not None
+        K = len(weights_j) if weights_j is not None else len(weights_i)
+        assert weights_j is None or np.ndim(weights_j) == 2
+        assert weights_i is None or (np.ndim(weights_i) == 2 and len(weights_i) == K)
+
+        x_ji = cls._get_opinion_score_2darray_with_preprocessing(dataset_reader, **kwargs)['opinion_score_2darray']
+        J, I = x_ji.shape
+        mask = (~np.isnan(x_ji)).astype(float)
+        x = np.where(np.isnan(x_ji), 0.0, x_ji) # zero-filled
+
+        def sum_over_j(a_ji):
+            if weights_j is None:
+                return np.sum(a_ji, axis=-2)
+            return np.matmul(np.asarray(weights_j, dtype=float)[:, np.newaxis, :], a_ji)[:, 0, :]
+
+        def sum_over_i(a_ji):
+            if weights_i is None:
+                return np.sum(a_ji, axis=-1)
+            return np.matmul(a_ji, np.asarray(weights_i, dtype=float)[:, :, np.newaxis])[..., 0]
+
+        MAX_ITR = 1000
+        DELTA_THR = 1e-8
+        EPSILON = 1e-8
+
+        cnt_i = sum_over_j(mask)
+
+        def iterate(s_j, b_i):
+
+            # as iterate() of _run_modeling(), with the nanmean and nanstd
+            # over j, and the weighted nanmean over i, weighted
+            r_ji = (x - s_j[:, :, np.newaxis] - b_i[:, np.newaxis, :]) * mask
+            mean_i = sum_over_j(r_ji) / cnt_i
+            v_i = np.sqrt(sum_over_j(((r_ji - mean_i[:, np.newaxis, :]) * mask) ** 2) / cnt_i)
+
+            # a subject without any weighted score has a NaN bias and
+            # inconsistency, and is left out, as would be its NaN column
+            w_ji = mask / (np.where(np.isnan(v_i), np.inf, v_i)[:, np.newaxis, :] ** 2 + EPSILON)
+            s_j = sum_over_i((x - np.where(np.isnan(b_i), 0.0, b_i)[:, np.newaxis, :]) * w_ji) / sum_over_i(w_ji)
+
+            b_i = sum_over_j((x - s_j[:, :, np.newaxis]) * mask) / cnt_i
+
+            return s_j, b_i, v_i
+
+        s_j = np.tile(np.asarray(initial_params['quality_scores'], dtype=float), (K, 1))
+        b_i = np.tile(np.asarray(initial_params['observer_bias'], dtype=float), (K, 1))
+        v_i = np.tile(np.asarray(initial_params['observer_inconsistency'], dtype=float), (K, 1))
+
+        trace = IterationTrace.from_kwargs(['num_converged'], MAX_ITR, kwargs)
+
+        # converged problems are held as they are
+        pending = np.ones(K, dtype=bool)
+        num_iters = [MAX_ITR] * K
+
+        itr = 0
+        while np.any(pending) and itr < MAX_ITR:
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                s_j_new, b_i_new, v_i_new = iterate(s_j, b_i)
+            itr += 1
+
+            delta_s_j = linalg.norm(s_j - s_j_new, axis=-1)
+            s_j = np.where(pending[:, np.newaxis], s_j_new, s_j)
+            b_i = np.where(pending[:, np.newaxis], b_i_new, b_i)
+            v_i = np.where(pending[:, np.newaxis], v_i_new, v_i)
+
+            stop = trace.record(itr, num_converged=np.sum(~pending | (delta_s_j < DELTA_THR)))
+
+            done = pending & ((delta_s_j < DELTA_THR) | stop)
+            for idx in np.flatnonzero(done):
+                num_iters[idx] = itr
+            pending &= ~done
+
+        trace.close()
+
+        return {
+            'quality_scores': s_j,
+            'observer_bias': b_i,
+            'observer_inconsistency': v_i,
+            'num_iter': num_iters,
+        }
+
     @classmethod
     def _get_s_j_std(cls, v_i, v_j, x_ji):
         den = np.nansum(cls._one_or_nan(x_ji) / np.tile(v_i ** 2, (x_ji.shape[0], 1)), axis=1)  # sum over s
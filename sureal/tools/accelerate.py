@@ -0,0 +1,119 @@
+import numpy as np
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+def _nan_norm(xs):
+    return np.sqrt(sum(np.nansum(x ** 2) for x in xs))
+
+
+def _extrapolate(params, r, v, alpha):
+    return tuple(p0 - 2.0 * alpha * r_ + alpha ** 2 * v_ for p0, r_, v_ in zip(params, r, v))
+
+
+def _within_bounds(params_new, params, lower_bounds):
+    # entries strictly above their bound must stay so; the others (e.g. a
+    # parameter forced to zero, or NaN) are left alone
+    if lower_bounds is None:
+        return True
+    for p, p0, bound in zip(params_new, params, lower_bounds):
+        if bound is not None and not np.all((p > bound) | ~(p0 > bound)):
+            return False
+    return True
+
+
+class Squarem(object):
+    """
+    SQUAREM acceleration (Varadhan and Roland, 2008, scheme S3) of the
+    fixed-point iteration params <- fixed_point_fcn(params).
+
+    params is a tuple of arrays, and fixed_point_fcn(params) returns the
+    updated tuple, along with any auxiliary output (e.g. the stds), which is
+    passed through. Each step() evaluates the map twice, extrapolates along the
+    squared polynomial and evaluates the map once more on the extrapolation to
+    stabilize it.
+
+    Safeguards:
+    - the steplength is capped by step_max, which starts at 1 (no
+      extrapolation beyond a plain double step) and grows by mstep each time
+      the cap is hit, so that the first steps follow the plain iteration;
+    - if the extrapolation leaves lower_bounds (a tuple with a bound or None for
+      each array), the steplength is halved towards the plain step. Parameters
+      are not clipped to their bound, as a boundary value may be absorbing for
+      the map (e.g. a zero std);
+    - if objective_fcn (to be maximized, e.g. the log-likelihood) is given and
+      the accelerated estimate scores lower than the plain double step, or is
+      not finite, the plain double step is taken instead and step_max shrinks
+      by mstep.
+
+    >>> fcn = lambda params: ((0.9 * params[0] + 0.1 * np.array([1., 2.]),), None)
+    >>> squarem = Squarem(fcn)
+    >>> params = (np.zeros(2),)
+    >>> for _ in range(3):
+    ...     params, _, params_prev, num_evals = squarem.step(params)
+    >>> params[0]
+    array([1., 2.])
+    >>> num_evals
+    3
+    >>> fcn = lambda params: ((0.5 * params[0],), None)
+    >>> Squarem(fcn, step_max=10.0).step((np.ones(1),))[0][0]
+    array([0.])
+    >>> Squarem(fcn, lower_bounds=(0.0,), step_max=10.0).step((np.ones(1),))[0][0]
+    array([0.03125])
+    """
+
+    DEFAULT_STEP_MAX = 1.0
+    DEFAULT_MSTEP = 4.0
+    MAX_BACKTRACKS = 10
+
+    def __init__(self, fixed_point_fcn, objective_fcn=None, lower_bounds=None,
+                 step_max=DEFAULT_STEP_MAX, mstep=DEFAULT_MSTEP):
+        self.fixed_point_fcn = fixed_point_fcn
+        self.objective_fcn = objective_fcn
+        self.lower_bounds = lower_bounds
+        self.step_max0 = step_max
+        self.step_max = step_max
+        self.mstep = mstep
+
+    def step(self, params):
+        """
+        Return (params_new, aux_new, params_prev, num_evals), where params_prev
+        is the input to the last map evaluation that produced params_new, so
+        that convergence can be checked on the change of one plain evaluation.
+        """
+
+        params1, aux1 = self.fixed_point_fcn(params)
+        params2, aux2 = self.fixed_point_fcn(params1)
+
+        r = [p1 - p0 for p0, p1 in zip(params, params1)]
+        v = [p2 - p1 - r_ for p1, p2, r_ in zip(params1, params2, r)]
+        norm_r = _nan_norm(r)
+        norm_v = _nan_norm(v)
+        if not norm_v > 0.0:
+            return params2, aux2, params1, 2
+
+        # steplength; alpha = -1 gives back params2
+        alpha = max(min(-norm_r / norm_v, -1.0), -self.step_max)
+        if alpha == -self.step_max:
+            self.step_max *= self.mstep
+
+        params_acc = _extrapolate(params, r, v, alpha)
+        num_backtracks = 0
+        while not _within_bounds(params_acc, params, self.lower_bounds):
+            if num_backtracks >= self.MAX_BACKTRACKS:
+                return params2, aux2, params1, 2
+            alpha = (alpha - 1.0) / 2.0
+            params_acc = _extrapolate(params, r, v, alpha)
+            num_backtracks += 1
+
+        params3, aux3 = self.fixed_point_fcn(params_acc)
+
+        if self.objective_fcn is not None:
+            objective2 = self.objective_fcn(params2)
+            objective3 = self.objective_fcn(params3)
+            if not (np.isfinite(objective3) and objective3 >= objective2):
+                self.step_max = max(self.step_max0, self.step_max / self.mstep)
+                return params2, aux2, params1, 3
+
+        return params3, aux3, params_acc, 3
@@ -0,0 +1,157 @@
+import numpy as np
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+class RowBlocks(object):
+    """
+    A 2darray, e.g. a read-only np.memmap of opinion scores, read in blocks
+    of block_size rows, so that a pass along either axis holds one block in
+    memory at a time. Transforms by row or by column, e.g. the offsets and
+    scales of the preprocessing, are applied to each block as it is read,
+    in the order added by transformed().
+
+    >>> blocks = RowBlocks(np.array([[1., 2.], [3., np.nan], [5., 6.]]), block_size=2)
+    >>> blocks.shape
+    (3, 2)
+    >>> blocks.nanmean(axis=0)
+    array([3., 4.])
+    >>> blocks.nanmean(axis=1)
+    array([1.5, 3. , 5.5])
+    >>> blocks.count(axis=0)
+    array([3, 2])
+    >>> blocks2 = blocks.transformed(row_offsets=[0., 1., 2.]).transformed(col_offsets=[1., 2.], col_scales=[2., 2.])
+    >>> blocks2.to_array()
+    array([[0. , 0. ],
+           [1.5, nan],
+           [3. , 3. ]])
+    >>> blocks2.nanstd(axis=0, ddof=1)
+    array([1.5       , 2.12132034])
+    >>> blocks2.transformed(cols=[False, True]).to_array()
+    array([[ 0.],
+           [nan],
+           [ 3.]])
+    >>> blocks.reduce(lambda start, stop, block: np.nansum(block) * (stop - start))
+    [12.0, 11.0]
+    """
+
+    def __init__(self, array, block_size, steps=()):
+        assert len(array.shape) == 2
+        assert block_size > 0
+        self.array = array
+        self.block_size = int(block_size)
+        self.steps = tuple(steps)
+
+    @property
+    def shape(self):
+        R, C = self.array.shape
+        for kind, values in self.steps:
+            if kind == 'cols':
+                C = len(values)
+        return R, C
+
+    @property
+    def is_transformed(self):
+        return len(self.steps) > 0
+
+    def transformed(self, row_offsets=None, col_offsets=None, col_scales=None, cols=None):
+        """
+        New RowBlocks that, after the transforms of this one, adds
+        row_offsets by row, subtracts col_offsets by column, divides by
+        col_scales by column, then selects the columns cols (each applied if
+        specified).
+        """
+        R, C = self.shape
+        steps = list(self.steps)
+        if row_offsets is not None:
+            row_offsets = np.asarray(row_offsets, dtype=float)
+            assert row_offsets.shape == (R,)
+            steps.append(('row_offsets', row_offsets))
+        if col_offsets is not None:
+            col_offsets = np.asarray(col_offsets, dtype=float)
+            assert col_offsets.shape == (C,)
+            steps.append(('col_offsets', col_offsets))
+        if col_scales is not None:
+            col_scales = np.asarray(col_scales, dtype=float)
+            assert col_scales.shape == (C,)
+            steps.append(('col_scales', col_scales))
+        if cols is not None:
+            cols = np.arange(C)[cols]
+            steps.append(('cols', cols))
+        return RowBlocks(self.array, self.block_size, steps)
+
+    def __iter__(self):
+        """
+        Yield (start, stop, block) of each block of rows start to stop, as a
+        float array of its own, transformed.
+        """
+        R, _ = self.shape
+        for start in range(0, R, self.block_size):
+            stop = min(start + self.block_size, R)
+            block = np.array(self.array[start:stop], dtype=float)
+            for kind, values in self.steps:
+                if kind == 'row_offsets':
+                    block += values[start:stop, np.newaxis]
+                elif kind == 'col_offsets':
+                    block -= values
+                elif kind == 'col_scales':
+                    block /= values
+                elif kind == 'cols':
+                    block = block[:, values]
+                else:
+                    assert False
+            yield start, stop, block
+
+    def reduce(self, fcn):
+        """
+        List of fcn(start, stop, block) of each block.
+        """
+        return [fcn(start, stop, block) for start, stop, block in self]
+
+    def map_rows(self, fcn):
+        """
+        fcn(start, stop, block), an array of a value per row of the block,
+        concatenated over the blocks.
+        """
+        return np.concatenate(self.reduce(fcn))
+
+    def sum_rows(self, fcn):
+        """
+        fcn(start, stop, block), e.g. an array of a value per column, summed
+        over the blocks.
+        """
+        total = 0
+        for value in self.reduce(fcn):
+            total = total + value
+        return total
+
+    def to_array(self):
+        return np.vstack([block for _, _, block in self])
+
+    def count(self, axis):
+        if axis == 0:
+            return self.sum_rows(lambda start, stop, block: np.sum(~np.isnan(block), axis=0))
+        elif axis == 1:
+            return self.map_rows(lambda start, stop, block: np.sum(~np.isnan(block), axis=1))
+        else:
+            assert False
+
+    def nanmean(self, axis):
+        if axis == 0:
+            return self.sum_rows(lambda start, stop, block: np.nansum(block, axis=0)) / self.count(axis=0)
+        elif axis == 1:
+            return self.map_rows(lambda start, stop, block: np.nanmean(block, axis=1))
+        else:
+            assert False
+
+    def nanstd(self, axis, ddof=0):
+        if axis == 0:
+            # in two passes, as np.nanstd
+            mean = self.nanmean(axis=0)
+            sum_sq = self.sum_rows(lambda start, stop, block: np.nansum((block - mean) ** 2, axis=0))
+            return np.sqrt(sum_sq / (self.count(axis=0) - ddof))
+        elif axis == 1:
+            return self.map_rows(lambda start, stop, block: np.nanstd(block, axis=1, ddof=ddof))
+        else:
+            assert False
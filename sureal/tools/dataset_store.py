@@ -0,0 +1,324 @@
+import json
+import sqlite3
+from argparse import Namespace
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+"""
+A store of datasets in a SQLite file: the ref videos, dis videos and raw
+ratings of each dataset, under its dataset_name, in indexed tables, so that
+the dis videos of some contents or assets, and their ratings, can be queried
+without loading the rest.
+"""
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# as the SQLite user_version of the file
+STORE_VERSION = 1
+
+# the columns without a type keep the python type of the values, e.g. the
+# int scores or the str asset_ids; the other fields of the videos are in JSON
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset_id INTEGER PRIMARY KEY,
+    dataset_name TEXT NOT NULL UNIQUE,
+    os_type TEXT,
+    num_observers INTEGER,
+    attributes TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ref_videos (
+    dataset_id INTEGER NOT NULL,
+    ref_video_idx INTEGER NOT NULL,
+    content_id INTEGER NOT NULL,
+    fields TEXT NOT NULL,
+    PRIMARY KEY (dataset_id, ref_video_idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS dis_videos (
+    dataset_id INTEGER NOT NULL,
+    dis_video_idx INTEGER NOT NULL,
+    content_id INTEGER NOT NULL,
+    asset_id NOT NULL,
+    groundtruth,
+    groundtruth_std,
+    fields TEXT NOT NULL,
+    PRIMARY KEY (dataset_id, dis_video_idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS dis_videos_content_id ON dis_videos (dataset_id, content_id);
+CREATE INDEX IF NOT EXISTS dis_videos_asset_id ON dis_videos (dataset_id, asset_id);
+CREATE TABLE IF NOT EXISTS ratings (
+    dataset_id INTEGER NOT NULL,
+    dis_video_idx INTEGER NOT NULL,
+    subject NOT NULL,
+    score NOT NULL,
+    PRIMARY KEY (dataset_id, dis_video_idx, subject)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ratings_subject ON ratings (dataset_id, subject);
+"""
+
+# the fields of the dis videos in columns of their own
+_DIS_VIDEO_COLUMNS = ['content_id', 'asset_id', 'groundtruth', 'groundtruth_std']
+
+
+def is_sqlite_file(filepath):
+    return filepath.endswith(SQLITE_EXTENSIONS)
+
+
+def _connect(filepath):
+    conn = sqlite3.connect(filepath)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version == 0:
+        conn.executescript(_SCHEMA)
+        conn.execute('PRAGMA user_version = {}'.format(STORE_VERSION))
+    else:
+        assert version <= STORE_VERSION, \
+            '{} is a dataset store of version {}, expect up to {}'.format(filepath, version, STORE_VERSION)
+    return conn
+
+
+def _to_sql(value):
+    # numpy scalars, e.g. of the model results, as python ones
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _json_default(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError('{} is not JSON serializable'.format(repr(o)))
+
+
+def _to_json(value):
+    try:
+        return json.dumps(value, default=_json_default)
+    except (TypeError, ValueError) as e:
+        raise AssertionError('cannot be stored as JSON: {}'.format(e))
+
+
+def _get_dataset_id(conn, dataset_name):
+    if dataset_name is None:
+        rows = conn.execute('SELECT dataset_id, dataset_name FROM datasets').fetchall()
+        assert len(rows) == 1, \
+            'dataset_name must be specified if the store has other than one dataset, but has {}'.format(
+                [row[1] for row in rows])
+    else:
+        rows = conn.execute('SELECT dataset_id, dataset_name FROM datasets WHERE dataset_name = ?',
+                            (dataset_name,)).fetchall()
+        assert len(rows) == 1, 'dataset {} is not in the store'.format(dataset_name)
+    return rows[0]
+
+
+def get_dataset_names(filepath):
+    with closing(_connect(filepath)) as conn:
+        return [row[0] for row in conn.execute('SELECT dataset_name FROM datasets ORDER BY dataset_id')]
+
+
+def export_sqlite_file(dataset, filepath, dataset_name=None):
+    """
+    Write a dataset (with ref_videos and dis_videos, e.g. as imported by
+    import_python_file()) into the store in the SQLite file, created if
+    needed, under dataset_name (by default, the dataset's), replacing the
+    dataset of the same name if any. The dis videos have either raw
+    opinion scores 'os' (as a list or a dict), stored as ratings, or none,
+    e.g. an aggregated dataset; NaN scores are not stored.
+
+    >>> import os, tempfile
+    >>> dataset = Namespace(dataset_name='example', ref_score=5.0,
+    ...     ref_videos=[{'content_id': 0, 'path': 'ref.yuv'}],
+    ...     dis_videos=[{'content_id': 0, 'asset_id': 0, 'path': 'ref.yuv', 'os': {'Tom': 5, 'Jerry': 4}},
+    ...                 {'content_id': 0, 'asset_id': 1, 'path': 'dis.yuv', 'os': {'Tom': 2}}])
+    >>> filepath = os.path.join(tempfile.mkdtemp(), 'example.db')
+    >>> export_sqlite_file(dataset, filepath)
+    >>> get_dataset_names(filepath)
+    ['example']
+    >>> dataset2 = import_sqlite_file(filepath)
+    >>> dataset2.dis_videos[1]
+    {'content_id': 0, 'asset_id': 1, 'path': 'dis.yuv', 'os': {'Tom': 2}}
+    >>> dataset2 == dataset
+    True
+    >>> import_sqlite_file(filepath, asset_ids=[1]).dis_videos
+    [{'content_id': 0, 'asset_id': 1, 'path': 'dis.yuv', 'os': {'Tom': 2}}]
+    """
+    assert hasattr(dataset, 'ref_videos')
+    assert hasattr(dataset, 'dis_videos')
+    if dataset_name is None:
+        assert hasattr(dataset, 'dataset_name'), 'dataset_name must be specified if the dataset has none'
+        dataset_name = dataset.dataset_name
+
+    attributes = {}
+    for key, value in dataset.__dict__.items():
+        if key in ['dataset_name', 'ref_videos', 'dis_videos'] or key.startswith('_') \
+                or callable(value) or type(value).__name__ == 'module':
+            continue
+        attributes[key] = value
+
+    has_os = [('os' in dis_video) for dis_video in dataset.dis_videos]
+    assert all(has_os) or not any(has_os), "'os' must be in all of the dis_videos, or in none"
+    num_observers = None
+    if not any(has_os):
+        os_type = None
+    elif isinstance(dataset.dis_videos[0]['os'], dict):
+        os_type = 'dict'
+    else:
+        os_type = 'list'
+        num_observers = len(dataset.dis_videos[0]['os'])
+        assert all(len(dis_video['os']) == num_observers for dis_video in dataset.dis_videos), \
+            'os must be lists of the same number of observers'
+
+    def ratings(dataset_id):
+        for dis_video_idx, dis_video in enumerate(dataset.dis_videos):
+            if os_type == 'dict':
+                items = dis_video['os'].items()
+            else:
+                items = enumerate(dis_video['os'])
+            for subject, score in items:
+                assert isinstance(subject, (int, str)), \
+                    'observers must be int or str to be stored, but got {}'.format(subject)
+                if score == score:  # not NaN
+                    yield dataset_id, dis_video_idx, subject, _to_sql(score)
+
+    with closing(_connect(filepath)) as conn:
+        with conn:
+            row = conn.execute('SELECT dataset_id FROM datasets WHERE dataset_name = ?', (dataset_name,)).fetchone()
+            if row is not None:
+                for table in ['ratings', 'dis_videos', 'ref_videos', 'datasets']:
+                    conn.execute('DELETE FROM {} WHERE dataset_id = ?'.format(table), row)
+            dataset_id = conn.execute(
+                'INSERT INTO datasets (dataset_name, os_type, num_observers, attributes) VALUES (?, ?, ?, ?)',
+                (dataset_name, os_type, num_observers, _to_json(attributes))).lastrowid
+            conn.executemany(
+                'INSERT INTO ref_videos VALUES (?, ?, ?, ?)',
+                ((dataset_id, ref_video_idx, _to_sql(ref_video['content_id']),
+                  _to_json({key: value for key, value in ref_video.items() if key != 'content_id'}))
+                 for ref_video_idx, ref_video in enumerate(dataset.ref_videos)))
+            conn.executemany(
+                'INSERT INTO dis_videos VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((dataset_id, dis_video_idx, _to_sql(dis_video['content_id']), _to_sql(dis_video['asset_id']),
+                  _to_sql(dis_video.get('groundtruth')), _to_sql(dis_video.get('groundtruth_std')),
+                  _to_json({key: value for key, value in dis_video.items()
+                            if key not in _DIS_VIDEO_COLUMNS and key != 'os'}))
+                 for dis_video_idx, dis_video in enumerate(dataset.dis_videos)))
+            if os_type is not None:
+                conn.executemany('INSERT INTO ratings VALUES (?, ?, ?, ?)', ratings(dataset_id))
+
+
+def _select_into(conn, name, values):
+    conn.execute('CREATE TEMP TABLE {} (value PRIMARY KEY)'.format(name))
+    conn.executemany('INSERT OR IGNORE INTO temp.{} VALUES (?)'.format(name),
+                     ((_to_sql(value),) for value in values))
+    return '(SELECT value FROM temp.{})'.format(name)
+
+
+def query_sqlite_file(filepath, dataset_name=None, content_ids=None, asset_ids=None, subjects=None):
+    """
+    Query a dataset of the store in the SQLite file (dataset_name may be
+    omitted if it is the only one), selecting the dis videos of content_ids
+    and of asset_ids, and the ratings of subjects, if specified, by the
+    indexes of the tables. Return a namespace of:
+
+    dataset: the dataset, with all of the ref videos, but only the selected
+    dis videos, in order, without 'os';
+    dis_video_idxs: the indexes in the store of the selected dis videos;
+    os_type and num_observers: the type of 'os' of the stored dataset ('list',
+    'dict' or None), and for a list, its length;
+    rows, subjects and scores: the ratings, as arrays of the position in
+    dataset.dis_videos, the subject and the score.
+    """
+    with closing(_connect(filepath)) as conn:
+        dataset_id, dataset_name = _get_dataset_id(conn, dataset_name)
+        os_type, num_observers, attributes = conn.execute(
+            'SELECT os_type, num_observers, attributes FROM datasets WHERE dataset_id = ?',
+            (dataset_id,)).fetchone()
+
+        ref_videos = []
+        for content_id, fields in conn.execute(
+                'SELECT content_id, fields FROM ref_videos WHERE dataset_id = ? ORDER BY ref_video_idx',
+                (dataset_id,)):
+            ref_video = {'content_id': content_id}
+            ref_video.update(json.loads(fields))
+            ref_videos.append(ref_video)
+
+        sql = 'SELECT dis_video_idx, content_id, asset_id, groundtruth, groundtruth_std, fields ' \
+              'FROM dis_videos WHERE dataset_id = ?'
+        if content_ids is not None:
+            sql += ' AND content_id IN ' + _select_into(conn, 'selected_content_ids', content_ids)
+        if asset_ids is not None:
+            sql += ' AND asset_id IN ' + _select_into(conn, 'selected_asset_ids', asset_ids)
+        dis_video_idxs = []
+        dis_videos = []
+        for dis_video_idx, content_id, asset_id, groundtruth, groundtruth_std, fields in conn.execute(
+                sql + ' ORDER BY dis_video_idx', (dataset_id,)):
+            dis_video = {'content_id': content_id, 'asset_id': asset_id}
+            if groundtruth is not None:
+                dis_video['groundtruth'] = groundtruth
+            if groundtruth_std is not None:
+                dis_video['groundtruth_std'] = groundtruth_std
+            dis_video.update(json.loads(fields))
+            dis_video_idxs.append(dis_video_idx)
+            dis_videos.append(dis_video)
+        dis_video_idxs = np.array(dis_video_idxs, dtype=np.int64)
+
+        sql = 'SELECT dis_video_idx, subject, score FROM ratings WHERE dataset_id = ?'
+        if content_ids is not None or asset_ids is not None:
+            sql += ' AND dis_video_idx IN ' + _select_into(conn, 'selected_dis_video_idxs', dis_video_idxs)
+        if subjects is not None:
+            sql += ' AND subject IN ' + _select_into(conn, 'selected_subjects', subjects)
+        ratings = pd.read_sql_query(sql + ' ORDER BY dis_video_idx, subject', conn, params=(dataset_id,))
+
+    dataset = Namespace(dataset_name=dataset_name, ref_videos=ref_videos, dis_videos=dis_videos,
+                        **json.loads(attributes))
+    return Namespace(
+        dataset=dataset,
+        dis_video_idxs=dis_video_idxs,
+        os_type=os_type,
+        num_observers=num_observers,
+        rows=np.searchsorted(dis_video_idxs, ratings['dis_video_idx'].to_numpy()),
+        subjects=ratings['subject'].to_numpy(),
+        scores=ratings['score'].to_numpy(),
+    )
+
+
+def import_sqlite_file(filepath, dataset_name=None, content_ids=None, asset_ids=None, subjects=None):
+    """
+    Import a dataset of the store in the SQLite file as a namespace, as
+    import_json_file() does, with the dis videos of content_ids and
+    asset_ids, and the ratings of subjects only, if specified; see
+    query_sqlite_file().
+    """
+    query = query_sqlite_file(filepath, dataset_name, content_ids, asset_ids, subjects)
+    dis_videos = query.dataset.dis_videos
+    if query.os_type == 'dict':
+        for dis_video in dis_videos:
+            dis_video['os'] = dict()
+        for row, subject, score in zip(query.rows.tolist(), query.subjects.tolist(), query.scores.tolist()):
+            dis_videos[row]['os'][subject] = score
+    elif query.os_type == 'list':
+        for dis_video in dis_videos:
+            dis_video['os'] = [float('NaN')] * query.num_observers
+        for row, subject, score in zip(query.rows.tolist(), query.subjects.tolist(), query.scores.tolist()):
+            dis_videos[row]['os'][subject] = score
+    return query.dataset
+
+
+def update_groundtruth(filepath, dis_video_idxs, scores, scores_std=None, dataset_name=None):
+    """
+    Write scores, e.g. the aggregate scores of a subjective model, and their
+    std if specified, as the groundtruth of the dis videos of the given
+    indexes in the store, of a dataset in the SQLite file.
+    """
+    assert len(dis_video_idxs) == len(scores)
+    if scores_std is not None:
+        assert len(dis_video_idxs) == len(scores_std)
+    else:
+        scores_std = [None] * len(scores)
+    with closing(_connect(filepath)) as conn:
+        with conn:
+            dataset_id, _ = _get_dataset_id(conn, dataset_name)
+            conn.executemany(
+                'UPDATE dis_videos SET groundtruth = ?, groundtruth_std = ? '
+                'WHERE dataset_id = ? AND dis_video_idx = ?',
+                ((_to_sql(score), _to_sql(score_std), dataset_id, _to_sql(dis_video_idx))
+                 for dis_video_idx, score, score_std in zip(dis_video_idxs, scores, scores_std)))
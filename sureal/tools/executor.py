@@ -0,0 +1,186 @@
+import multiprocessing
+import pickle
+
+import numpy as np
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # python < 3.8: ProcessExecutor pickles the arrays with the arguments
+    resource_tracker = None
+    shared_memory = None
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+class SharedArray(object):
+    """
+    NumPy array in a multiprocessing.shared_memory block (python 3.8 and
+    later). It pickles as the name, shape and dtype of the block only, and
+    is unpickled (e.g. in a worker process) as a view on the same memory,
+    instead of a copy.
+    """
+
+    def __init__(self, array):
+        assert shared_memory is not None, 'SharedArray needs multiprocessing.shared_memory, of python 3.8 or later'
+        array = np.asarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        self.array[...] = array
+
+    def __getstate__(self):
+        return {'name': self.shm.name, 'shape': self.shape, 'dtype': self.dtype}
+
+    def __setstate__(self, state):
+        self.shape = state['shape']
+        self.dtype = state['dtype']
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def unlink(self):
+        # the array must not be used past this point
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+# functions run by the workers, keyed by the executor that registered them;
+# workers are forked, and so see the functions registered before the fork,
+# closures included, without pickling them
+_registered_funcs = dict()
+
+
+def _share_arrays(obj, min_nbytes, shared_arrays):
+    if isinstance(obj, np.ndarray) and obj.nbytes >= min_nbytes:
+        if id(obj) not in shared_arrays:
+            shared_arrays[id(obj)] = (obj, SharedArray(obj))
+        return shared_arrays[id(obj)][1]
+    if isinstance(obj, tuple):
+        return tuple(_share_arrays(o, min_nbytes, shared_arrays) for o in obj)
+    if isinstance(obj, list):
+        return [_share_arrays(o, min_nbytes, shared_arrays) for o in obj]
+    return obj
+
+
+def _unshare_arrays(obj):
+    if isinstance(obj, SharedArray):
+        return obj.array
+    if isinstance(obj, tuple):
+        return tuple(_unshare_arrays(o) for o in obj)
+    if isinstance(obj, list):
+        return [_unshare_arrays(o) for o in obj]
+    return obj
+
+
+def _run_task(task):
+    func, args = task
+    if not callable(func):
+        func = _registered_funcs[func]
+    return func(_unshare_arrays(args))
+
+
+class ProcessExecutor(object):
+    """
+    Persistent pool of worker processes, to map functions over lists of
+    arguments, as the builtin map() would, but in parallel.
+
+    - The pool is forked on the first map() and reused by the following ones,
+      until close(). The function mapped first is registered before the fork,
+      so it may be a closure, or otherwise not picklable; a later function is
+      sent to the workers pickled if it can be, or else the pool is forked
+      anew.
+    - The arguments are dispatched in chunks of chunksize (by default, about
+      four chunks per process), and the results returned through the pool's
+      pipes, in order.
+    - NumPy arrays in the arguments (or in their tuples and lists) of at least
+      min_nbytes are passed through shared memory, once per map() for an array
+      appearing in several arguments, instead of being pickled; without
+      multiprocessing.shared_memory (before python 3.8), they are pickled.
+
+    With processes=1, or if processes cannot be forked, map() runs in the
+    calling process.
+
+    >>> offset = 10.0
+    >>> with ProcessExecutor(processes=2) as executor:
+    ...     executor.map(lambda x: x + offset, [1.0, 2.0, 3.0])
+    ...     executor.map(lambda args: float(args[0][args[1]]), [(np.arange(200000.0), i) for i in range(3)])
+    [11.0, 12.0, 13.0]
+    [0.0, 1.0, 2.0]
+    """
+
+    DEFAULT_MIN_NBYTES = 1024 * 1024
+    CHUNKS_PER_PROCESS = 4
+
+    def __init__(self, processes=None, min_nbytes=DEFAULT_MIN_NBYTES):
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        assert self.processes >= 1
+        self.min_nbytes = min_nbytes
+        self.pool = None
+        self.key = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _is_picklable(func):
+        try:
+            pickle.dumps(func)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def can_fork():
+        return 'fork' in multiprocessing.get_all_start_methods()
+
+    def _start(self, func):
+        self._terminate()
+        self.key = id(self)
+        _registered_funcs[self.key] = func
+        # forked workers attaching to shared memory must report to the
+        # resource tracker of this process, not start their own
+        if resource_tracker is not None:
+            resource_tracker.ensure_running()
+        self.pool = multiprocessing.get_context('fork').Pool(self.processes)
+
+    def _terminate(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        if self.key is not None:
+            del _registered_funcs[self.key]
+            self.key = None
+
+    def close(self):
+        self._terminate()
+
+    def map(self, func, list_args, chunksize=None):
+        list_args = list(list_args)
+
+        if self.processes == 1 or len(list_args) <= 1 or not self.can_fork():
+            return [func(args) for args in list_args]
+
+        if self.pool is None or (_registered_funcs[self.key] is not func and not self._is_picklable(func)):
+            self._start(func)
+        func_or_key = self.key if _registered_funcs[self.key] is func else func
+
+        if chunksize is None:
+            chunksize = max(1, -(-len(list_args) // (self.processes * self.CHUNKS_PER_PROCESS)))
+
+        shared_arrays = dict()
+        try:
+            if shared_memory is None:
+                tasks = [(func_or_key, args) for args in list_args]
+            else:
+                tasks = [(func_or_key, _share_arrays(args, self.min_nbytes, shared_arrays)) for args in list_args]
+            return self.pool.map(_run_task, tasks, chunksize)
+        finally:
+            for _, shared in shared_arrays.values():
+                shared.unlink()
@@ -1,10 +1,11 @@
 import os
+import sys
 import time
-from time import sleep
-import multiprocessing
 
 import numpy as np
 
+from sureal.tools.executor import ProcessExecutor
+
 __copyright__ = "Copyright 2016-2018, Netflix, Inc."
 __license__ = "Apache, Version 2.0"
 
@@ -112,6 +113,314 @@ def import_python_file(filepath):
     return ret
 
 
+# parsed .py dataset files, keyed by path: (mtime, size, sha1 of the file,
+# pickled attributes), for import_python_file_literals()
+_literals_cache = dict()
+
+
+def _is_constant(node):
+    import ast
+    if sys.version_info < (3, 8):
+        # parsed as ast.Num, ast.Str, ast.Bytes and ast.NameConstant instead
+        return isinstance(node, (ast.Constant, ast.Num, ast.Str, ast.Bytes, ast.NameConstant))
+    return isinstance(node, ast.Constant)
+
+
+def _constant_value(node):
+    import ast
+    if sys.version_info < (3, 8):
+        if isinstance(node, ast.Num):
+            return node.n
+        if isinstance(node, (ast.Str, ast.Bytes)):
+            return node.s
+    return node.value
+
+
+def _eval_literal(node, names, filepath):
+    """
+    Value of the expression node, if made of literals, names assigned before
+    (in names), string concatenations and arithmetics, and float('nan') or
+    float('inf'); raise AssertionError otherwise.
+    """
+    import ast
+
+    def eval_(node):
+        return _eval_literal(node, names, filepath)
+
+    if _is_constant(node):
+        return _constant_value(node)
+    elif isinstance(node, ast.List):
+        return [eval_(elt) for elt in node.elts]
+    elif isinstance(node, ast.Tuple):
+        return tuple(eval_(elt) for elt in node.elts)
+    elif isinstance(node, ast.Set):
+        return set(eval_(elt) for elt in node.elts)
+    elif isinstance(node, ast.Dict) and None not in node.keys:
+        return {eval_(key): eval_(value) for key, value in zip(node.keys, node.values)}
+    elif isinstance(node, ast.Name) and node.id in names:
+        return names[node.id]
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        operand = eval_(node.operand)
+        if isinstance(operand, (int, float)):
+            return +operand if isinstance(node.op, ast.UAdd) else -operand
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Div)):
+        left, right = eval_(node.left), eval_(node.right)
+        if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+            if isinstance(node.op, ast.Add):
+                return left + right
+            elif isinstance(node.op, ast.Sub):
+                return left - right
+            elif isinstance(node.op, ast.Mult):
+                return left * right
+            else:
+                return left / right
+        if isinstance(node.op, ast.Add) and type(left) == type(right) and isinstance(left, (str, list, tuple)):
+            return left + right
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'float' \
+            and len(node.args) == 1 and not node.keywords and _is_constant(node.args[0]) \
+            and str(_constant_value(node.args[0])).strip().lower() in ['nan', 'inf', '-inf', '+inf']:
+        return float(_constant_value(node.args[0]))
+    raise AssertionError('{filepath}, line {lineno}: not a literal expression: {expr}'.format(
+        filepath=filepath, lineno=getattr(node, 'lineno', '?'), expr=ast.dump(node)[:100]))
+
+
+def import_python_file_literals(filepath):
+    """
+    Import a python file of a dataset as a namespace of its top-level
+    assignments (ref_videos, dis_videos, ref_score, dataset_name, ...), as
+    import_python_file() would, but parsing it instead of executing it: the
+    assigned values may only be literals, possibly referring to the names
+    assigned before, as in ref_dir + '/foo.yuv' (see _eval_literal()); any
+    other statement raises AssertionError. So it is safe to use on datasets
+    of unknown origin.
+
+    The parsed file is cached in memory, and later imports of it return a
+    copy from the cache, unless its content changed: if its mtime and size
+    are unchanged, the file is not even read.
+
+    >>> import os, tempfile
+    >>> filepath = os.path.join(tempfile.mkdtemp(), 'example_dataset.py')
+    >>> with open(filepath, 'wt') as f:
+    ...     _ = f.write("ref_dir = 'ref'\\nref_videos = [{'content_id': 0, 'path': ref_dir + '/foo.yuv'}]\\n")
+    >>> import_python_file_literals(filepath).ref_videos
+    [{'content_id': 0, 'path': 'ref/foo.yuv'}]
+    >>> with open(filepath, 'at') as f:
+    ...     _ = f.write("import os\\n")
+    >>> import_python_file_literals(filepath)  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    AssertionError: ...example_dataset.py, line 3: only assignments of literals are allowed
+    """
+    import ast
+    import hashlib
+    import pickle
+    from argparse import Namespace
+
+    key = os.path.realpath(filepath)
+    stat = os.stat(key)
+    cached = _literals_cache.get(key)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return Namespace(**pickle.loads(cached[3]))
+
+    with open(key, 'rb') as f:
+        source = f.read()
+    sha1 = hashlib.sha1(source).hexdigest()
+    if cached is not None and cached[2] == sha1:
+        _literals_cache[key] = (stat.st_mtime_ns, stat.st_size) + cached[2:]
+        return Namespace(**pickle.loads(cached[3]))
+
+    names = dict()
+    for node in ast.parse(source, filename=filepath).body:
+        if isinstance(node, ast.Expr) and _is_constant(node.value):
+            continue  # e.g. a docstring
+        if isinstance(node, ast.Assign) and all(isinstance(target, ast.Name) for target in node.targets):
+            value = _eval_literal(node.value, names, filepath)
+            for target in node.targets:
+                names[target.id] = value
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name) and node.value is not None:
+            names[node.target.id] = _eval_literal(node.value, names, filepath)
+        else:
+            raise AssertionError('{filepath}, line {lineno}: only assignments of literals are allowed'.format(
+                filepath=filepath, lineno=node.lineno))
+
+    pickled = pickle.dumps(names, protocol=pickle.HIGHEST_PROTOCOL)
+    _literals_cache[key] = (stat.st_mtime_ns, stat.st_size, sha1, pickled)
+    return Namespace(**pickle.loads(pickled))
+
+
+# the format written by export_npz_file(), in its __meta__ header
+NPZ_FORMAT = 'sureal_dataset_npz'
+NPZ_FORMAT_VERSION = 1
+
+
+def _pack_videos(videos, prefix, arrays, exclude=()):
+    """
+    Store each field of videos (a list of dicts) as a column array under
+    prefix + field, if all of them have it and it is a scalar; else into the
+    returned dict, keyed by field, then by the video position as a str.
+    """
+    others = {}
+    for key in get_unique_sorted_list([key for video in videos for key in video.keys() if key not in exclude]):
+        values = [video[key] for video in videos if key in video]
+        if len(values) == len(videos) and len(values) > 0 and \
+                all(isinstance(value, (bool, int, float, str)) for value in values) and \
+                len(set(type(value) for value in values)) == 1:
+            arrays[prefix + key] = np.array(values)
+        else:
+            others[key] = {str(i): video[key] for i, video in enumerate(videos) if key in video}
+    return others
+
+
+def _unpack_videos(num_videos, prefix, arrays, others):
+    videos = [dict() for _ in range(num_videos)]
+    for name in arrays.files:
+        if name.startswith(prefix):
+            for video, value in zip(videos, arrays[name].tolist()):
+                video[name[len(prefix):]] = value
+    for key, values in others.items():
+        for i, value in values.items():
+            videos[int(i)][key] = value
+    return videos
+
+
+def export_npz_file(dataset, filepath):
+    """
+    Write a dataset (with ref_videos and dis_videos, e.g. as imported by
+    import_python_file()) in a binary, columnar .npz format, read back by
+    import_npz_file(). The scalar fields of the videos are stored as arrays,
+    one per field, and the opinion scores as a 2darray of dis videos by
+    observers, with a mask of the scores present if 'os' are dicts; the rest
+    (the dataset's other attributes, and non-scalar fields) in a JSON header.
+
+    >>> import os, tempfile
+    >>> from argparse import Namespace
+    >>> dataset = Namespace(dataset_name='example', ref_score=5.0,
+    ...     ref_videos=[{'content_id': 0, 'path': 'ref.yuv'}],
+    ...     dis_videos=[{'content_id': 0, 'asset_id': 0, 'path': 'ref.yuv', 'os': {'Tom': 5, 'Jerry': 4}},
+    ...                 {'content_id': 0, 'asset_id': 1, 'path': 'dis.yuv', 'os': {'Tom': 2}}])
+    >>> filepath = os.path.join(tempfile.mkdtemp(), 'example.npz')
+    >>> export_npz_file(dataset, filepath)
+    >>> dataset2 = import_npz_file(filepath)
+    >>> dataset2.dis_videos[1]
+    {'asset_id': 1, 'content_id': 0, 'path': 'dis.yuv', 'os': {'Tom': 2}}
+    >>> dataset2 == dataset
+    True
+    """
+    import json
+
+    assert hasattr(dataset, 'ref_videos')
+    assert hasattr(dataset, 'dis_videos')
+
+    attributes = {}
+    for key, value in dataset.__dict__.items():
+        if key in ['ref_videos', 'dis_videos'] or key.startswith('_') \
+                or callable(value) or type(value).__name__ == 'module':
+            continue
+        attributes[key] = value
+
+    arrays = {}
+    ref_videos_others = _pack_videos(dataset.ref_videos, 'ref_videos/', arrays)
+    dis_videos_others = _pack_videos(dataset.dis_videos, 'dis_videos/', arrays, exclude=['os'])
+
+    # e.g. aggregated datasets have 'groundtruth' instead
+    has_os = [('os' in dis_video) for dis_video in dataset.dis_videos]
+    assert all(has_os) or not any(has_os), "'os' must be in all of the dis_videos, or in none"
+    observers = None
+    if not any(has_os):
+        os_type = None
+    elif isinstance(dataset.dis_videos[0]['os'], dict):
+        observers = get_unique_sorted_list([observer for dis_video in dataset.dis_videos
+                                            for observer in dis_video['os'].keys()])
+        for observer in observers:
+            assert isinstance(observer, (int, str)), \
+                'observers must be int or str to be stored, but got {}'.format(observer)
+        observer_index = {observer: i_observer for i_observer, observer in enumerate(observers)}
+        values = np.array([score for dis_video in dataset.dis_videos for score in dis_video['os'].values()])
+        os_2darray = np.zeros([len(dataset.dis_videos), len(observers)], dtype=values.dtype)
+        os_mask = np.zeros(os_2darray.shape, dtype=bool)
+        for i_dis_video, dis_video in enumerate(dataset.dis_videos):
+            for observer, score in dis_video['os'].items():
+                os_2darray[i_dis_video, observer_index[observer]] = score
+                os_mask[i_dis_video, observer_index[observer]] = True
+        arrays['os'] = os_2darray
+        arrays['os_mask'] = os_mask
+        os_type = 'dict'
+    else:
+        arrays['os'] = np.array([list(dis_video['os']) for dis_video in dataset.dis_videos])
+        assert arrays['os'].dtype.kind in 'biuf', 'os must be numbers, of the same number of observers'
+        os_type = 'list'
+
+    meta = {
+        'format': NPZ_FORMAT,
+        'version': NPZ_FORMAT_VERSION,
+        'attributes': attributes,
+        'num_ref_videos': len(dataset.ref_videos),
+        'num_dis_videos': len(dataset.dis_videos),
+        'ref_videos': ref_videos_others,
+        'dis_videos': dis_videos_others,
+        'os_type': os_type,
+        'observers': observers,
+    }
+    try:
+        arrays['__meta__'] = np.array(json.dumps(meta))
+    except TypeError as e:
+        raise AssertionError('dataset cannot be stored as .npz: {}'.format(e))
+
+    with open(filepath, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def import_npz_file(filepath):
+    """
+    Import a dataset file written by export_npz_file() as a namespace, as
+    import_json_file() does. No code is executed, nor object unpickled.
+    """
+    import json
+    from argparse import Namespace
+
+    with np.load(filepath, allow_pickle=False) as arrays:
+        meta = json.loads(arrays['__meta__'].item())
+        assert meta['format'] == NPZ_FORMAT and meta['version'] <= NPZ_FORMAT_VERSION, \
+            '{} is not a dataset .npz file of version up to {}'.format(filepath, NPZ_FORMAT_VERSION)
+
+        ref_videos = _unpack_videos(meta['num_ref_videos'], 'ref_videos/', arrays, meta['ref_videos'])
+        dis_videos = _unpack_videos(meta['num_dis_videos'], 'dis_videos/', arrays, meta['dis_videos'])
+
+        if meta['os_type'] == 'dict':
+            os_2darray = arrays['os'].tolist()
+            observers = meta['observers']
+            for dis_video, scores, mask in zip(dis_videos, os_2darray, arrays['os_mask'].tolist()):
+                dis_video['os'] = {observer: score for observer, score, present
+                                   in zip(observers, scores, mask) if present}
+        elif meta['os_type'] == 'list':
+            for dis_video, scores in zip(dis_videos, arrays['os'].tolist()):
+                dis_video['os'] = scores
+
+    return Namespace(ref_videos=ref_videos, dis_videos=dis_videos, **meta['attributes'])
+
+
+def import_dataset_file(filepath, literal_only=False):
+    """
+    Import a dataset file, as a python module (.py), a JSON file (.json), a
+    binary .npz file (.npz) or a SQLite dataset store (.db, .sqlite or
+    .sqlite3) of a single dataset, by its extension. With literal_only, a
+    python file is parsed by import_python_file_literals() instead of
+    executed.
+    """
+    from sureal.tools.dataset_store import is_sqlite_file, import_sqlite_file
+
+    if filepath.endswith('.py'):
+        return import_python_file_literals(filepath) if literal_only else import_python_file(filepath)
+    elif filepath.endswith('.json'):
+        return import_json_file(filepath)
+    elif filepath.endswith('.npz'):
+        return import_npz_file(filepath)
+    elif is_sqlite_file(filepath):
+        return import_sqlite_file(filepath)
+    else:
+        raise AssertionError("Unknown input type, must be .py, .json, .npz, .db, .sqlite or .sqlite3")
+
+
 def get_cmd_option(argv, begin, end, option):
     '''
 
@@ -166,59 +475,15 @@ def parallel_map(func, list_args, processes=None, pause_sec=0.01):
     or Pool.map() cannot meet my both needs:
     1) be able to control the maximum number of processes in parallel
     2) be able to take in non-picklable objects as arguments
-    """
 
-    # get maximum number of active processes that can be used
-    max_active_procs = processes if processes is not None else multiprocessing.cpu_count()
+    Runs on a ProcessExecutor, whose forked pool is closed on return; to map
+    repeatedly, use a ProcessExecutor directly. pause_sec is no longer used.
 
-    # create shared dictionary
-    return_dict = multiprocessing.Manager().dict()
-
-    # define runner function
-    def func_wrapper(idx_args):
-        idx, args = idx_args
-        executor = func(args)
-        return_dict[idx] = executor
-
-    # add idx to args
-    list_idx_args = []
-    for idx, args in enumerate(list_args):
-        list_idx_args.append((idx, args))
-
-    procs = []
-    for idx_args in list_idx_args:
-        proc = multiprocessing.Process(target=func_wrapper, args=(idx_args,))
-        procs.append(proc)
-
-    waiting_procs = set(procs)
-    active_procs = set([])
-
-    # processing
-    while True:
-
-        # check if any procs in active_procs is done; if yes, remove them
-        for p in active_procs.copy():
-            if not p.is_alive():
-                active_procs.remove(p)
-
-        # check if can add a proc to active_procs (add gradually one per loop)
-        if len(active_procs) < max_active_procs and len(waiting_procs) > 0:
-            # move one proc from waiting_procs to active_procs
-            p = waiting_procs.pop()
-            active_procs.add(p)
-            p.start()
-
-        # if both waiting_procs and active_procs are empty, can terminate
-        if len(waiting_procs) == 0 and len(active_procs) == 0:
-            break
-
-        if pause_sec is not None:
-            sleep(pause_sec) # check every x sec
-
-    # finally, collect results
-    rets = map(lambda idx: return_dict[idx], range(len(list_args)))
-
-    return rets
+    >>> list(parallel_map(lambda x: x * 2, zip([1, 2, 3]), processes=2))
+    [(1, 1), (2, 2), (3, 3)]
+    """
+    with ProcessExecutor(processes=processes) as executor:
+        return executor.map(func, list_args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,88 @@
+import numpy as np
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+def dense_to_triplets(mtx):
+    """
+    Convert a 2darray, with NaN marking the missing entries, into the
+    (rows, cols, vals) triplets of its observed entries, in row-major order.
+
+    >>> rows, cols, vals = dense_to_triplets(np.array([[1., np.nan], [np.nan, 4.], [5., 6.]]))
+    >>> rows
+    array([0, 1, 2, 2])
+    >>> cols
+    array([0, 1, 0, 1])
+    >>> vals
+    array([1., 4., 5., 6.])
+    """
+    mtx = np.asarray(mtx)
+    assert mtx.ndim == 2
+    rows, cols = np.nonzero(~np.isnan(mtx))
+    return rows, cols, mtx[rows, cols]
+
+
+def triplets_to_dense(rows, cols, vals, shape):
+    """
+    Inverse of dense_to_triplets: scatter the triplets into a NaN-padded
+    2darray of the given shape.
+
+    >>> triplets_to_dense(np.array([0, 1]), np.array([1, 0]), np.array([2., 3.]), (2, 3))
+    array([[nan,  2., nan],
+           [ 3., nan, nan]])
+    """
+    mtx = float('NaN') * np.ones(shape)
+    mtx[rows, cols] = vals
+    return mtx
+
+
+def segment_sum(idx, vals, num_segments):
+    """
+    Sum vals over the segments given by idx. Empty segments sum to 0, in line
+    with pandas' NaN-skipping sum.
+
+    >>> segment_sum(np.array([0, 2, 2]), np.array([1., 2., 3.]), 4)
+    array([1., 0., 5., 0.])
+    """
+    return np.bincount(idx, weights=vals, minlength=num_segments)
+
+
+def segment_count(idx, num_segments):
+    """
+    >>> segment_count(np.array([0, 2, 2]), 4)
+    array([1, 0, 2, 0])
+    """
+    return np.bincount(idx, minlength=num_segments)
+
+
+def segment_mean(idx, vals, num_segments):
+    """
+    Mean of vals over the segments given by idx. Empty segments are NaN.
+
+    >>> segment_mean(np.array([0, 2, 2]), np.array([1., 2., 3.]), 4)
+    array([1. , nan, 2.5, nan])
+    """
+    cnt = segment_count(idx, num_segments)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return segment_sum(idx, vals, num_segments) / cnt
+
+
+def segment_std(idx, vals, num_segments, ddof=0):
+    """
+    Standard deviation of vals over the segments given by idx, using the
+    two-pass formula for numerical stability. Segments with no more than ddof
+    entries are NaN.
+
+    >>> segment_std(np.array([0, 2, 2, 2]), np.array([1., 2., 3., 4.]), 4)
+    array([0.        ,        nan, 0.81649658,        nan])
+    >>> segment_std(np.array([0, 2, 2, 2]), np.array([1., 2., 3., 4.]), 4, ddof=1)
+    array([nan, nan,  1., nan])
+    """
+    cnt = segment_count(idx, num_segments)
+    mean = segment_mean(idx, vals, num_segments)
+    sq = segment_sum(idx, (vals - mean[idx]) ** 2, num_segments)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = sq / (cnt - ddof)
+    var[cnt <= ddof] = float('NaN')
+    return np.sqrt(var)
@@ -4,11 +4,6 @@ import scipy.signal
 from .inverse import inversefunc
 import warnings
 
-# import multiprocessing
-# pool = multiprocessing.Pool()
-
-from .misc import parallel_map
-
 __copyright__ = "Copyright 2016-2018, Netflix, Inc."
 __license__ = "Apache, Version 2.0"
 
@@ -33,46 +28,98 @@ def sech(x):
     return 2. / ( np.exp(x) + np.exp(-x) )
 
 
-def vectorized_convolution_of_two_logistics(xs, locs1, scales1, locs2, scales2):
-
-    f = lambda x, loc1, scale1, loc2, scale2: \
-        ConvolveTwoPdf(
-            lambda x: 1.0 / 4.0 / scale1 * sech(x / 2.0 / scale1)**2,
-            lambda x: 1.0 / 4.0 / scale2 * sech(x / 2.0 / scale2)**2,
-
-            # lambda x: 1.0 / 4.0 / scale1 / np.cosh(x / 2.0 / scale1)**2,
-            # lambda x: 1.0 / 4.0 / scale2 / np.cosh(x / 2.0 / scale2)**2,
-
-            # lambda x: 1.0 / np.sqrt(2 * np.pi * (scale1**2) * (np.pi**2 / 3.)) * np.exp(- x**2 / (2* (scale1**2) * (np.pi**2 / 3.))), # test gaussian
-            # lambda x: 1.0 / np.sqrt(2 * np.pi * (scale2**2) * (np.pi**2 / 3.)) * np.exp(- x**2 / (2* (scale2**2) * (np.pi**2 / 3.))), # test gaussian
+# table of the log density of the sum of two standard logistic variables,
+# weighted so that it is of unit scale, see _get_logistic_convolution_table()
+LOGISTIC_CONVOLUTION_TABLE_NUM_RATIOS = 65
+LOGISTIC_CONVOLUTION_TABLE_Z_STEP = 1e-2
+LOGISTIC_CONVOLUTION_TABLE_Z_MAX = 24.0
+LOGISTIC_CONVOLUTION_TABLE_DELTA = 1e-3
 
-            f_truncation=1e-12,
-            g_truncation=1e-12,
-            delta=3.0e-3,
-        ).pdf(x - loc1 - loc2)
+_logistic_convolution_table = None
 
-    # # === way 1: parallel_map (each job too small, bottlenecked by passing context) ===
-    # f2 = lambda x: f(*x)
-    # xshape = xs.shape
-    # assert xshape == locs1.shape == scales1.shape == locs2.shape == scales2.shape
-    # res = parallel_map(f2, zip(xs.ravel(), locs1.ravel(), scales1.ravel(), locs2.ravel(), scales2.ravel()), pause_sec=None)
-    # return np.reshape(res, xshape)
 
-    # # === way 2: vectorize (sequential execution) ===
-    # ff = np.vectorize(f)
-    # return ff(xs, locs1, scales1, locs2, scales2)
+def _get_logistic_convolution_table():
+    """
+    Log density of (L1 + r * L2) / sqrt(1 + r^2), where L1 and L2 are standard
+    logistic variables, on a grid of scale ratios r in [0, 1] and of
+    standardized offsets z in [0, LOGISTIC_CONVOLUTION_TABLE_Z_MAX] (the
+    density is even in z). Each row is the FFT convolution of the two
+    component densities on a fine grid, normalized to integrate to one. Built
+    on first use, and cached.
+    """
+    global _logistic_convolution_table
+    if _logistic_convolution_table is not None:
+        return _logistic_convolution_table
+
+    delta = LOGISTIC_CONVOLUTION_TABLE_DELTA
+    step = int(round(LOGISTIC_CONVOLUTION_TABLE_Z_STEP / delta))
+    num_zs = int(round(LOGISTIC_CONVOLUTION_TABLE_Z_MAX / LOGISTIC_CONVOLUTION_TABLE_Z_STEP)) + 1
+    # the fine grid reaches far enough for the convolution tails to vanish
+    reach = int(round(2.5 * LOGISTIC_CONVOLUTION_TABLE_Z_MAX / delta))
+    grid = np.arange(-reach, reach + 1) * delta
+
+    ratios = np.linspace(0.0, 1.0, LOGISTIC_CONVOLUTION_TABLE_NUM_RATIOS)
+    log_pdfs = np.zeros([len(ratios), num_zs])
+    for i, ratio in enumerate(ratios):
+        scale1 = 1.0 / np.sqrt(1.0 + ratio ** 2)
+        scale2 = ratio * scale1
+        with np.errstate(over='ignore'):
+            pdf = 1.0 / 4.0 / scale1 * sech(grid / 2.0 / scale1) ** 2
+            if scale2 > 0:
+                pdf2 = 1.0 / 4.0 / scale2 * sech(grid / 2.0 / scale2) ** 2
+                pdf = scipy.signal.fftconvolve(pdf, pdf2 * delta, 'same')
+        pdf = pdf / (np.sum(pdf) * delta)
+        log_pdfs[i] = np.log(np.maximum(pdf[reach::step][:num_zs], np.finfo(float).tiny))
+
+    _logistic_convolution_table = {'ratios': ratios, 'log_pdfs': log_pdfs}
+    return _logistic_convolution_table
+
+
+def vectorized_log_convolution_of_two_logistics(xs, locs1, scales1, locs2, scales2):
+    """
+    Log density at xs of the sum of two logistic variables of locations locs1,
+    locs2 and scales scales1, scales2, bilinearly interpolated from a table
+    indexed by the ratio of the smaller to the larger scale and the offset
+    standardized by sqrt(scales1^2 + scales2^2). Beyond the table (some 13
+    standard deviations out), the log density is extrapolated linearly in the
+    offset, as the tails are exponential.
+
+    >>> vectorized_log_convolution_of_two_logistics(np.array([0.0, 1.0]), 0.0, 1.0, 0.0, 0.0)
+    array([-1.38629436, -1.62652338])
+    >>> np.log(vectorized_logistic(np.array([0.0, 1.0]), 0.0, 1.0))
+    array([-1.38629436, -1.62652338])
+    >>> np.round(np.exp(vectorized_log_convolution_of_two_logistics(np.array([0.5]), 0.5, 1.0, 0.0, 1.0)), 6)
+    array([0.166667])
+    """
+    table = _get_logistic_convolution_table()
+    ratios, log_pdfs = table['ratios'], table['log_pdfs']
+    num_ratios, num_zs = log_pdfs.shape
+
+    xs, locs1, scales1, locs2, scales2 = np.broadcast_arrays(
+        *[np.asarray(a, dtype=float) for a in [xs, locs1, scales1, locs2, scales2]])
+    scales1, scales2 = np.abs(scales1), np.abs(scales2)
+    scales = np.sqrt(scales1 ** 2 + scales2 ** 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = np.minimum(scales1, scales2) / np.maximum(scales1, scales2) * (num_ratios - 1)
+        zs = np.abs(xs - locs1 - locs2) / scales / LOGISTIC_CONVOLUTION_TABLE_Z_STEP
+
+    # cells of the table, with the offsets past its end extrapolated from the last one
+    i = np.clip(np.floor(np.nan_to_num(rs)).astype(int), 0, num_ratios - 2)
+    j = np.clip(np.floor(np.nan_to_num(zs, posinf=num_zs)).astype(int), 0, num_zs - 2)
+    u = rs - i
+    v = zs - j
+    log_pdf = (1.0 - u) * ((1.0 - v) * log_pdfs[i, j] + v * log_pdfs[i, j + 1]) + \
+        u * ((1.0 - v) * log_pdfs[i + 1, j] + v * log_pdfs[i + 1, j + 1])
+    with np.errstate(divide='ignore'):
+        return log_pdf - np.log(scales)
 
-    # === way 3: parallel map combined with vectorize (best speed) ===
-    ff = np.vectorize(f)
-    ff2 = lambda x: ff(*x)
-    xshape = xs.shape
-    assert xshape == locs1.shape == scales1.shape == locs2.shape == scales2.shape
-    with np.errstate(over='ignore'):
-        res = parallel_map(ff2, zip(xs, locs1, scales1, locs2, scales2), pause_sec=None)
-    return np.array(res)
 
-    # === test: test one gaussian ===
-    # return 1.0 / np.sqrt(2 * np.pi * (scales1**2 + scales2**2) * (np.pi**2 / 3.)) * np.exp(- (xs - locs1 - locs2)**2 / (2* (scales1**2 + scales2**2) * (np.pi**2 / 3.)))
+def vectorized_convolution_of_two_logistics(xs, locs1, scales1, locs2, scales2):
+    """
+    Density at xs of the sum of two logistic variables, see
+    vectorized_log_convolution_of_two_logistics().
+    """
+    return np.exp(vectorized_log_convolution_of_two_logistics(xs, locs1, scales1, locs2, scales2))
 
 
 def convolution_of_two_uniforms(x, loc1, s1, loc2, s2):
@@ -108,19 +155,54 @@ def convolution_of_two_uniforms(x, loc1, s1, loc2, s2):
     if - s/2. <= z < - d/2.:
         x0, y0 = - s / 2., 0
         x1, y1 = -d / 2., h
-        return (y1 - y0) / (x1 - x0) * (x - x0) + y0
+        return (y1 - y0) / (x1 - x0) * (z - x0) + y0
     elif -d/2. <= z < d/2.:
         return h
     elif d/2. <= z < s/2.:
         x0, y0 = s / 2., 0
         x1, y1 = d / 2., h
-        return (y1 - y0) / (x1 - x0) * (x - x0) + y0
+        return (y1 - y0) / (x1 - x0) * (z - x0) + y0
     else:
         return 0.
 
 
+def vectorized_log_convolution_of_two_uniforms(xs, locs1, scales1, locs2, scales2):
+    """
+    Log density at xs of the sum of two uniform variables of centers locs1,
+    locs2 and widths scales1, scales2: a trapezoid of support
+    (scales1 + scales2) and plateau |scales1 - scales2|, of height
+    1 / max(scales1, scales2); -inf outside the support.
+
+    >>> zs = np.array([-2, -1.5, -1.49, -0.51, -0.49, 0, 0.49, 0.51, 1.49, 1.5, 2])
+    >>> np.exp(vectorized_log_convolution_of_two_uniforms(zs + 1.0, 0.5, 1, 0.5, 2))
+    array([0.   , 0.   , 0.005, 0.495, 0.5  , 0.5  , 0.5  , 0.495, 0.005,
+           0.   , 0.   ])
+    >>> vectorized_log_convolution_of_two_uniforms(np.array([0.0, 0.6]), 0, 1, 0, 0)
+    array([  0., -inf])
+    """
+    xs, locs1, scales1, locs2, scales2 = np.broadcast_arrays(
+        *[np.asarray(a, dtype=float) for a in [xs, locs1, scales1, locs2, scales2]])
+    zs = np.abs(xs - locs1 - locs2)
+    half_ds = np.abs(scales1 - scales2) / 2.
+    half_ss = (scales1 + scales2) / 2.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # fraction of the plateau height, linear on the ramps; with a zero
+        # width, there is no ramp (and NaN scores stay NaN either way)
+        ramps = np.where(half_ss > half_ds, (half_ss - zs) / (half_ss - half_ds), np.sign(half_ss - zs))
+        return np.log(np.clip(ramps, 0., 1.)) - np.log(np.maximum(scales1, scales2))
+
+
 def vectorized_convolution_of_two_uniforms(xs, locs1, scales1, locs2, scales2):
-    return np.vectorize(convolution_of_two_uniforms)(xs, locs1, scales1, locs2, scales2)
+    """
+    Density at xs of the sum of two uniform variables, see
+    vectorized_log_convolution_of_two_uniforms().
+
+    >>> zs = np.array([-2, -1.5, -1.49, -0.51, -0.49, 0, 0.49, 0.51, 1.49, 1.5, 2])
+    >>> ys = vectorized_convolution_of_two_uniforms(zs, 0, 1, 0, 2)
+    >>> np.allclose(ys, [convolution_of_two_uniforms(z, 0, 1, 0, 2) for z in zs], rtol=0, atol=1e-12)
+    True
+    """
+    return np.exp(vectorized_log_convolution_of_two_uniforms(xs, locs1, scales1, locs2, scales2))
 
 
 class ConvolveTwoPdf(object):
@@ -0,0 +1,123 @@
+import sys
+import time
+
+import numpy as np
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+class IterationTrace(object):
+    """
+    Per-iteration metrics of an iterative solver (e.g. the change of the
+    estimates, the log-likelihood), recorded into arrays preallocated for
+    max_itr iterations, in place of writing them to stdout.
+
+    The solver calls record(itr, name=value, ...) at each iteration; only
+    every trace_every-th iteration is sampled. A value may be a callable, which
+    is then only evaluated on sampled iterations, so that a metric costly to
+    evaluate (the log-likelihood) is not computed just to be discarded; it is
+    not evaluated at all, and recorded as NaN, unless trace_every, callback
+    or display is given. The elapsed seconds are recorded under 'sec'.
+
+    On each sampled iteration, callback(itr, metrics), if given, is called
+    with the dict of the sampled metrics; if it returns True, record() returns
+    True, and the solver is expected to stop. The metrics are only written to
+    stdout if display is True.
+
+    >>> trace = IterationTrace(['change'], max_itr=10, trace_every=2)
+    >>> [trace.record(itr, change=1.0 / itr) for itr in range(1, 6)]
+    [False, False, False, False, False]
+    >>> trace.to_dict()['itr']
+    [2, 4]
+    >>> trace.to_dict()['change']
+    [0.5, 0.25]
+    >>> trace = IterationTrace(['change'], max_itr=10, callback=lambda itr, metrics: metrics['change'] < 0.3)
+    >>> [trace.record(itr, change=1.0 / itr) for itr in range(1, 5)]
+    [False, False, False, True]
+    >>> trace.stopped_early
+    True
+    >>> trace = IterationTrace(['change', 'loglikelihood'], max_itr=10)
+    >>> trace.record(1, change=1.0, loglikelihood=lambda: -1.0)
+    False
+    >>> trace.to_dict()['loglikelihood']
+    [nan]
+    """
+
+    DEFAULT_TRACE_EVERY = 1
+
+    def __init__(self, names, max_itr, trace_every=None, callback=None, display=False, title=None):
+        assert trace_every is None or trace_every >= 1
+        assert callback is None or callable(callback)
+        assert isinstance(display, bool)
+        self.names = ['sec'] + list(names)
+        # the callable metrics are only evaluated if the trace is asked for
+        self.evaluate_callables = trace_every is not None or callback is not None or display
+        trace_every = self.DEFAULT_TRACE_EVERY if trace_every is None else trace_every
+        self.trace_every = trace_every
+        self.callback = callback
+        self.display = display
+        # with an accelerated solver, itr may overshoot max_itr by a few
+        self.itrs = np.zeros(max_itr // trace_every + 2, dtype=int)
+        self.metrics = {name: np.zeros(len(self.itrs)) for name in self.names}
+        self.num_samples = 0
+        self.next_itr = trace_every
+        self.stopped_early = False
+        self.then = time.time()
+        if display and title is not None:
+            print('=== {title} ==='.format(title=title))
+
+    @classmethod
+    def from_kwargs(cls, names, max_itr, kwargs, title=None):
+        """
+        Trace set up from the trace_every, callback and display keyword
+        arguments of run_modeling().
+        """
+        trace_every = kwargs['trace_every'] if 'trace_every' in kwargs else None
+        callback = kwargs['callback'] if 'callback' in kwargs else None
+        display = kwargs['display'] if 'display' in kwargs and kwargs['display'] is not None else False
+        return cls(names, max_itr, trace_every, callback, display, title)
+
+    def record(self, itr, **metrics):
+        """
+        Sample the metrics of iteration itr, if due. Return True if the
+        callback requested to stop.
+        """
+
+        if itr < self.next_itr:
+            return False
+        self.next_itr = itr + self.trace_every
+
+        metrics = {name: value() if callable(value) else value for name, value in metrics.items()
+                   if self.evaluate_callables or not callable(value)}
+        metrics['sec'] = time.time() - self.then
+
+        if self.num_samples == len(self.itrs):
+            self.itrs = np.append(self.itrs, np.zeros_like(self.itrs))
+            for name in self.names:
+                self.metrics[name] = np.append(self.metrics[name], np.zeros_like(self.metrics[name]))
+        self.itrs[self.num_samples] = itr
+        for name in self.names:
+            self.metrics[name][self.num_samples] = metrics[name] if name in metrics else float('NaN')
+        self.num_samples += 1
+
+        if self.display:
+            msg = 'Iteration {itr:4d}: '.format(itr=itr) + ', '.join(
+                '{name} {value}'.format(name=name, value=metrics[name]) for name in self.names if name in metrics)
+            sys.stdout.write(msg + '\r')
+            sys.stdout.flush()
+
+        if self.callback is not None and self.callback(itr, metrics):
+            self.stopped_early = True
+        return self.stopped_early
+
+    def close(self):
+        if self.display:
+            sys.stdout.write("\n")
+
+    def to_dict(self):
+        d = {'itr': self.itrs[:self.num_samples].tolist()}
+        for name in self.names:
+            d[name] = self.metrics[name][:self.num_samples].tolist()
+        d['stopped_early'] = self.stopped_early
+        return d
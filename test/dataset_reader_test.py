@@ -1,16 +1,21 @@
 __copyright__ = "Copyright 2016-2018, Netflix, Inc."
 __license__ = "Apache, Version 2.0"
 
+import os
 import unittest
 import six
 
 import numpy as np
 
 from sureal.config import SurealConfig
-from sureal.tools.misc import import_python_file, indices
+from sureal.tools.misc import import_python_file, indices, import_npz_file, import_dataset_file, \
+    import_python_file_literals
 from sureal.dataset_reader import RawDatasetReader, SyntheticRawDatasetReader, \
     MissingDataRawDatasetReader, SelectSubjectRawDatasetReader, \
-    CorruptSubjectRawDatasetReader, CorruptDataRawDatasetReader, PairedCompDatasetReader, SelectDisVideoRawDatasetReader
+    CorruptSubjectRawDatasetReader, CorruptDataRawDatasetReader, PairedCompDatasetReader, SelectDisVideoRawDatasetReader, \
+    TidyRatingsDatasetReader, SqliteDatasetReader, MemmapRawDatasetReader
+from sureal.tools.dataset_store import get_dataset_names, import_sqlite_file
+from sureal.subjective_model import SubjectiveModel
 
 
 class RawDatasetReaderTest(unittest.TestCase):
@@ -39,6 +44,20 @@ class RawDatasetReaderTest(unittest.TestCase):
         l = self.dataset_reader.disvideo_is_refvideo
         self.assertTrue(all(l[0:9]))
 
+    def test_ref_dis_video_of_dis_videos(self):
+        ref_dis_videos = self.dataset_reader.ref_dis_video_of_dis_videos
+        self.assertEqual(len(ref_dis_videos), 79)
+        self.assertEqual(ref_dis_videos[:9], list(range(9)))
+        content_ids = self.dataset_reader.content_id_of_dis_videos
+        for e, ref in enumerate(ref_dis_videos):
+            self.assertTrue(self.dataset_reader.disvideo_is_refvideo[ref])
+            self.assertEqual(content_ids[ref], content_ids[e])
+
+        # only and one ref video per content_id of the dis videos
+        self.dataset.dis_videos = self.dataset.dis_videos[1:]
+        with self.assertRaises(AssertionError):
+            self.dataset_reader.ref_dis_video_of_dis_videos
+
     def test_ref_score(self):
         self.assertEqual(self.dataset_reader.ref_score, 5.0)
 
@@ -51,6 +70,293 @@ class RawDatasetReaderTest(unittest.TestCase):
         dataset = self.dataset_reader.to_persubject_dataset(np.zeros([79, 26]))
         self.assertEqual(len(dataset.dis_videos), 2054)
 
+    def test_opinion_score_triplets(self):
+        rows, cols, vals = self.dataset_reader.opinion_score_triplets
+        self.assertEqual(len(vals), 2054)
+        os_2darray = self.dataset_reader.opinion_score_2darray
+        np.testing.assert_array_equal(os_2darray[rows, cols], vals)
+
+
+    def test_cached_arrays(self):
+        self.assertEqual(self.dataset_reader._get_video_array('content_id_of_dis_videos').dtype, np.int32)
+        self.assertEqual(self.dataset_reader._get_video_array('asset_id_of_dis_videos').dtype, np.int32)
+        self.assertEqual(self.dataset_reader._get_video_array('ref_video_of_content_id').tolist(), list(range(9)))
+        os_2darray = self.dataset_reader.opinion_score_2darray
+        os_2darray[0, 0] = -1.0
+        self.assertEqual(self.dataset_reader.opinion_score_2darray[0, 0], 5.0)
+        self.assertIs(self.dataset_reader._get_video_array('content_id_of_dis_videos'),
+                      self.dataset_reader._get_video_array('content_id_of_dis_videos'))
+        self.assertFalse(self.dataset_reader._get_video_array('content_id_of_dis_videos').flags.writeable)
+
+    def test_cache_invalidation(self):
+        self.dataset.dis_videos = self.dataset.dis_videos[:10]
+        self.assertEqual(self.dataset_reader.num_dis_videos, 10)
+        self.assertEqual(self.dataset_reader.opinion_score_2darray.shape, (10, 26))
+        self.assertEqual(len(self.dataset_reader.content_id_of_dis_videos), 10)
+
+        self.dataset.dis_videos.append(self.dataset.dis_videos[0])
+        self.assertEqual(self.dataset_reader.opinion_score_2darray.shape, (11, 26))
+        self.assertEqual(self.dataset_reader.disvideo_is_refvideo[-1], True)
+
+        # in-place edits of the dicts need an explicit invalidation
+        content_id = self.dataset.dis_videos[1]['content_id']
+        self.dataset.dis_videos[1] = dict(self.dataset.dis_videos[1], content_id=7)
+        self.assertEqual(self.dataset_reader.content_id_of_dis_videos[1], content_id)
+        self.dataset_reader.invalidate_cache()
+        self.assertEqual(self.dataset_reader.content_id_of_dis_videos[1], 7)
+
+
+class DatasetNpzTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dataset_filepath = SurealConfig.workdir_path('NFLX_dataset_public_test.npz')
+
+    def tearDown(self):
+        if os.path.exists(self.output_dataset_filepath):
+            os.remove(self.output_dataset_filepath)
+
+    def test_write_out_dataset_npz(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw.py'))
+        RawDatasetReader.write_out_dataset(dataset, self.output_dataset_filepath)
+        dataset2 = import_dataset_file(self.output_dataset_filepath)
+        self.assertEqual(dataset2.ref_videos, dataset.ref_videos)
+        self.assertEqual(dataset2.dis_videos, dataset.dis_videos)
+        self.assertEqual(dataset2.dataset_name, 'NFLX_public')
+        self.assertEqual(dataset2.ref_score, 5.0)
+        np.testing.assert_array_equal(RawDatasetReader(dataset2).opinion_score_2darray,
+                                      RawDatasetReader(dataset).opinion_score_2darray)
+
+    def test_write_out_dataset_npz_os_as_dict(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('quality_variation_2017_agh_tv_dataset.py'))
+        dataset_reader = RawDatasetReader(dataset)
+        dataset_reader.write_out_dataset(dataset, self.output_dataset_filepath)
+        dataset2 = import_npz_file(self.output_dataset_filepath)
+        self.assertEqual(dataset2.dis_videos, dataset.dis_videos)
+        dataset_reader2 = RawDatasetReader(dataset2)
+        self.assertEqual(dataset_reader2._get_list_observers(), dataset_reader._get_list_observers())
+        np.testing.assert_array_equal(dataset_reader2.opinion_score_2darray, dataset_reader.opinion_score_2darray)
+
+    def test_write_out_aggregated_dataset_npz(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw.py'))
+        dataset_reader = RawDatasetReader(dataset)
+        dataset_reader.to_persubject_dataset_file(self.output_dataset_filepath, dataset_reader.opinion_score_2darray)
+        dataset2 = import_npz_file(self.output_dataset_filepath)
+        self.assertEqual(len(dataset2.dis_videos), 2054)
+        self.assertEqual(dataset2.dis_videos[0]['groundtruth'], 5.0)
+        self.assertNotIn('os', dataset2.dis_videos[0])
+
+
+class ImportPythonFileLiteralsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dataset_filepath = SurealConfig.workdir_path('NFLX_dataset_public_test_literals.py')
+
+    def tearDown(self):
+        if os.path.exists(self.output_dataset_filepath):
+            os.remove(self.output_dataset_filepath)
+
+    def test_import_python_file_literals(self):
+        for dataset_filename in ['NFLX_dataset_public_raw.py', 'quality_variation_2017_agh_tv_dataset.py',
+                                 'lukas_pc_dataset.py']:
+            dataset_filepath = SurealConfig.test_resource_path(dataset_filename)
+            dataset = import_python_file_literals(dataset_filepath)
+            module = import_python_file(dataset_filepath)
+            self.assertEqual(dataset.ref_videos, module.ref_videos)
+            self.assertEqual(dataset.dis_videos, module.dis_videos)
+            self.assertEqual(dataset.dataset_name, module.dataset_name)
+        self.assertEqual(import_dataset_file(dataset_filepath, literal_only=True).dis_videos, module.dis_videos)
+
+    def test_import_python_file_literals_cached(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw.py'))
+        RawDatasetReader.write_out_dataset(dataset, self.output_dataset_filepath)
+        dataset2 = import_python_file_literals(self.output_dataset_filepath)
+        dataset2.dis_videos[0]['os'][0] = 0
+        # a copy from the cache, unaffected by the change of the previous one
+        dataset3 = import_python_file_literals(self.output_dataset_filepath)
+        self.assertEqual(dataset3.dis_videos, dataset.dis_videos)
+
+        # a changed file is parsed anew
+        dataset.ref_score = 100.0
+        RawDatasetReader.write_out_dataset(dataset, self.output_dataset_filepath)
+        os.utime(self.output_dataset_filepath, ns=(0, 0))
+        self.assertEqual(import_python_file_literals(self.output_dataset_filepath).ref_score, 100.0)
+
+    def test_import_python_file_literals_not_literal(self):
+        with open(self.output_dataset_filepath, 'wt') as output_file:
+            output_file.write("dataset_name = 'foo'\nref_videos = [open('/etc/passwd').read()]\n")
+        with self.assertRaises(AssertionError):
+            import_python_file_literals(self.output_dataset_filepath)
+
+
+class TidyRatingsDatasetReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw.py'))
+        self.dataset_reader = RawDatasetReader(self.dataset)
+        self.output_ratings_filepath = SurealConfig.workdir_path('NFLX_dataset_public_test_ratings.csv')
+
+    def tearDown(self):
+        if os.path.exists(self.output_ratings_filepath):
+            os.remove(self.output_ratings_filepath)
+
+    def _write_ratings(self, lines, sep=','):
+        with open(self.output_ratings_filepath, 'wt') as output_file:
+            output_file.write(sep.join(['score', 'subject', 'content', 'asset']) + '\n')
+            for line in lines:
+                output_file.write(sep.join(str(x) for x in line) + '\n')
+
+    def _get_lines(self):
+        rows, cols, vals = self.dataset_reader.opinion_score_triplets
+        return [(val, 'subject{:02d}'.format(col), self.dataset.dis_videos[row]['content_id'],
+                 self.dataset.dis_videos[row]['asset_id']) for row, col, val in zip(rows, cols, vals)]
+
+    def test_read_ratings(self):
+        # in reverse, so that the assets come in reverse order
+        self._write_ratings(reversed(self._get_lines()))
+        dataset_reader = TidyRatingsDatasetReader(self.output_ratings_filepath, chunksize=100, ref_score=5.0)
+        self.assertEqual(dataset_reader.num_ref_videos, 9)
+        self.assertEqual(dataset_reader.num_dis_videos, 79)
+        self.assertEqual(dataset_reader.num_observers, 26)
+        self.assertEqual(dataset_reader._get_list_observers()[:2], ['subject00', 'subject01'])
+        self.assertEqual(dataset_reader.dataset.dataset_name, 'NFLX_dataset_public_test_ratings')
+        self.assertEqual(dataset_reader.ref_score, 5.0)
+        np.testing.assert_array_equal(dataset_reader.opinion_score_2darray,
+                                      self.dataset_reader.opinion_score_2darray[::-1])
+        self.assertEqual(dataset_reader.content_id_of_dis_videos, self.dataset_reader.content_id_of_dis_videos[::-1])
+        self.assertEqual([dis_video['path'] for dis_video in dataset_reader.dataset.dis_videos[:2]], ['78', '77'])
+        rows, cols, vals = dataset_reader.opinion_score_triplets
+        self.assertEqual(len(vals), 2054)
+
+        dataset = dataset_reader.to_dataset()
+        self.assertEqual(dataset.dis_videos[-1]['os']['subject00'], 5.0)
+        np.testing.assert_array_equal(RawDatasetReader(dataset).opinion_score_2darray,
+                                      dataset_reader.opinion_score_2darray)
+
+    def test_read_ratings_tsv_duplicated_and_missing(self):
+        lines = [(3, 'Tom', 'foo', 'a'), (4, 'Jerry', 'foo', 'a'), (2, 'Tom', 'bar', 'b'), (5, 'Tom', 'foo', 'a'),
+                 ('', 'Jerry', 'bar', 'b')]
+        self._write_ratings(lines, sep='\t')
+        dataset_reader = TidyRatingsDatasetReader(self.output_ratings_filepath, sep='\t', chunksize=2)
+        self.assertEqual(dataset_reader._get_list_observers(), ['Jerry', 'Tom'])
+        self.assertEqual(dataset_reader.content_id_of_dis_videos, [1, 0])
+        np.testing.assert_array_equal(dataset_reader.opinion_score_2darray, [[4.0, 5.0], [float('NaN'), 2.0]])
+
+    def test_read_ratings_content_mismatch(self):
+        self._write_ratings([(3, 'Tom', 'foo', 'a'), (4, 'Jerry', 'bar', 'a')])
+        with self.assertRaises(AssertionError):
+            TidyRatingsDatasetReader(self.output_ratings_filepath)
+
+
+class SqliteDatasetReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_store_filepath = SurealConfig.workdir_path('sureal_test_store.db')
+        self.dataset = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw.py'))
+        self.dataset2 = import_python_file(SurealConfig.test_resource_path('quality_variation_2017_agh_tv_dataset.py'))
+        RawDatasetReader.write_out_dataset(self.dataset, self.output_store_filepath)
+        RawDatasetReader.write_out_dataset(self.dataset2, self.output_store_filepath)
+
+    def tearDown(self):
+        if os.path.exists(self.output_store_filepath):
+            os.remove(self.output_store_filepath)
+
+    def test_store(self):
+        self.assertEqual(get_dataset_names(self.output_store_filepath),
+                         ['NFLX_public', 'quality_variation_2017_agh_tv'])
+        # replaced, not added
+        RawDatasetReader.write_out_dataset(self.dataset, self.output_store_filepath)
+        self.assertEqual(get_dataset_names(self.output_store_filepath),
+                         ['quality_variation_2017_agh_tv', 'NFLX_public'])
+        with self.assertRaises(AssertionError):
+            import_dataset_file(self.output_store_filepath)
+        dataset = import_sqlite_file(self.output_store_filepath, 'NFLX_public')
+        self.assertEqual(dataset.ref_videos, self.dataset.ref_videos)
+        self.assertEqual(dataset.dis_videos, self.dataset.dis_videos)
+        self.assertEqual(dataset.ref_score, 5.0)
+
+    def test_read_dataset(self):
+        dataset_reader = SqliteDatasetReader(self.output_store_filepath, 'NFLX_public')
+        dataset_reader0 = RawDatasetReader(self.dataset)
+        self.assertEqual(dataset_reader.num_observers, 26)
+        self.assertEqual(dataset_reader.content_id_of_dis_videos, dataset_reader0.content_id_of_dis_videos)
+        np.testing.assert_array_equal(dataset_reader.opinion_score_2darray, dataset_reader0.opinion_score_2darray)
+        self.assertEqual(dataset_reader.to_dataset().dis_videos, self.dataset.dis_videos)
+
+        dataset_reader = SqliteDatasetReader(self.output_store_filepath, 'quality_variation_2017_agh_tv')
+        dataset_reader0 = RawDatasetReader(self.dataset2)
+        self.assertEqual(dataset_reader._get_list_observers(), dataset_reader0._get_list_observers())
+        np.testing.assert_array_equal(dataset_reader.opinion_score_2darray, dataset_reader0.opinion_score_2darray)
+        self.assertEqual(dataset_reader.to_dataset().dis_videos, self.dataset2.dis_videos)
+
+    def test_read_dataset_filtered(self):
+        dataset_reader = SqliteDatasetReader(self.output_store_filepath, 'NFLX_public', content_ids=[0, 1],
+                                             asset_ids=list(range(12)) + [26, 35])
+        self.assertEqual(dataset_reader.num_dis_videos, 6)
+        self.assertEqual(dataset_reader.num_ref_videos, 9)
+        self.assertEqual(dataset_reader.dis_video_idxs.tolist(), [0, 1, 9, 10, 11, 26])
+        dis_videos = [dis_video for dis_video in self.dataset.dis_videos if dis_video['content_id'] in [0, 1]
+                      and dis_video['asset_id'] in list(range(12)) + [26, 35]]
+        self.assertEqual(dataset_reader.to_dataset().dis_videos, dis_videos)
+
+        subjects = [12081, 103, 12073]
+        dataset_reader = SqliteDatasetReader(self.output_store_filepath, 'quality_variation_2017_agh_tv',
+                                             content_ids=[2], subjects=subjects)
+        dataset_reader0 = RawDatasetReader(self.dataset2)
+        self.assertEqual(dataset_reader._get_list_observers(), sorted(subjects))
+        rows = [i for i, dis_video in enumerate(self.dataset2.dis_videos) if dis_video['content_id'] == 2]
+        cols = [dataset_reader0._get_list_observers().index(subject) for subject in sorted(subjects)]
+        np.testing.assert_array_equal(dataset_reader.opinion_score_2darray,
+                                      dataset_reader0.opinion_score_2darray[np.ix_(rows, cols)])
+
+    def test_write_aggregated_scores(self):
+        dataset_reader = SqliteDatasetReader(self.output_store_filepath, 'NFLX_public', content_ids=[1])
+        scores = np.nanmean(dataset_reader.opinion_score_2darray, axis=1)
+        dataset_reader.write_aggregated_scores(scores, scores_std=np.ones(len(scores)))
+        dataset = import_sqlite_file(self.output_store_filepath, 'NFLX_public')
+        dis_videos = [dis_video for dis_video in dataset.dis_videos if 'groundtruth' in dis_video]
+        self.assertEqual(len(dis_videos), 9)
+        self.assertAlmostEqual(dis_videos[0]['groundtruth'], 4.884615384615385, places=6)
+        self.assertEqual(dis_videos[0]['groundtruth_std'], 1.0)
+        self.assertEqual(dis_videos[0]['os'], self.dataset.dis_videos[1]['os'])
+
+
+class MemmapRawDatasetReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_npy_filepath = SurealConfig.workdir_path('sureal_test_scores.npy')
+
+    def tearDown(self):
+        if os.path.exists(self.output_npy_filepath):
+            os.remove(self.output_npy_filepath)
+
+    def test_from_dataset_reader(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('quality_variation_2017_agh_tv_dataset.py'))
+        dataset_reader0 = RawDatasetReader(dataset)
+        dataset_reader = MemmapRawDatasetReader.from_dataset_reader(
+            dataset_reader0, self.output_npy_filepath, block_size=50)
+        self.assertIsInstance(dataset_reader.opinion_score_2darray, np.memmap)
+        self.assertFalse(dataset_reader.opinion_score_2darray.flags.writeable)
+        np.testing.assert_array_equal(dataset_reader.opinion_score_2darray, dataset_reader0.opinion_score_2darray)
+        self.assertEqual(dataset_reader.num_observers, 99)
+        self.assertEqual(dataset_reader._get_list_observers(), dataset_reader0._get_list_observers())
+        self.assertNotIn('os', dataset_reader.dataset.dis_videos[0])
+        self.assertEqual(dataset_reader.content_id_of_dis_videos, dataset_reader0.content_id_of_dis_videos)
+        for array, array0 in zip(dataset_reader.opinion_score_triplets, dataset_reader0.opinion_score_triplets):
+            np.testing.assert_array_equal(array, array0)
+        self.assertEqual(dataset_reader.to_dataset().dis_videos, dataset.dis_videos)
+
+    def test_blocks(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw.py'))
+        dataset_reader0 = RawDatasetReader(dataset)
+        MemmapRawDatasetReader.from_dataset_reader(dataset_reader0, self.output_npy_filepath)
+        dataset_reader = MemmapRawDatasetReader(dataset_reader0.to_dataset(), self.output_npy_filepath, block_size=10)
+        blocks = dataset_reader.opinion_score_blocks
+        self.assertEqual(blocks.shape, (79, 26))
+        self.assertEqual(len(blocks.reduce(lambda start, stop, block: block.shape)), 8)
+        np.testing.assert_allclose(blocks.nanmean(axis=0), np.nanmean(dataset_reader0.opinion_score_2darray, axis=0))
+        with self.assertRaises(AssertionError):
+            dataset_reader._get_list_observers()
+
 
 class RawDatasetReaderPartialTest(unittest.TestCase):
 
@@ -236,6 +542,18 @@ class SelectedSubjectDatasetReaderTest2(unittest.TestCase):
 
         self.assertNotEqual(old_scores, new_scores)
 
+    def test_opinion_score_triplets_os_as_dict(self):
+        rows, cols, vals = self.dataset2_reader.opinion_score_triplets
+        np.testing.assert_array_equal(rows, [0, 0, 1, 1, 2, 2])
+        np.testing.assert_array_equal(cols, [0, 1, 0, 1, 0, 1])
+        np.testing.assert_array_equal(vals, [1.0, 3.0, 3.0, 2.0, 3.0, 4.0])
+
+        # unselected reader goes straight from the dis_videos dicts
+        reader = RawDatasetReader(self.dataset2_reader.dataset)
+        rows, cols, vals = reader.opinion_score_triplets
+        np.testing.assert_array_equal(reader.opinion_score_2darray[rows, cols], vals)
+        self.assertEqual(len(vals), 9)
+
 
 class SelectedSubjectDatasetReaderTest3(unittest.TestCase):
 
@@ -300,6 +618,82 @@ class SelectDisVideoDatasetReaderTest(unittest.TestCase):
             self.dataset_reader.to_dataset()
 
 
+class RawDatasetReaderViewTest(unittest.TestCase):
+
+    def setUp(self):
+        dataset_filepath = SurealConfig.test_resource_path('NFLX_dataset_public_raw.py')
+        self.dataset = import_python_file(dataset_filepath)
+        self.dataset_reader = RawDatasetReader(self.dataset)
+
+    def test_view(self):
+        view = self.dataset_reader.view(dis_video_idxs=[9, 9, 20, 0], observer_idxs=[0, 3])
+        self.assertEqual(view.num_ref_videos, 9)
+        self.assertEqual(view.num_dis_videos, 4)
+        self.assertEqual(view.num_observers, 2)
+        np.testing.assert_array_equal(
+            view.opinion_score_2darray, self.dataset_reader.opinion_score_2darray[[9, 9, 20, 0]][:, [0, 3]])
+        self.assertEqual(view.content_id_of_dis_videos, [0, 0, 1, 0])
+        self.assertEqual(view.disvideo_is_refvideo, [False, False, False, True])
+        self.assertEqual(sorted(view.asset_ids), [0, 9, 20])
+        self.assertEqual([dis_video['asset_id'] for dis_video in view.dataset.dis_videos], [9, 9, 20, 0])
+        rows, cols, vals = view.opinion_score_triplets
+        self.assertEqual(len(vals), 8)
+        view = self.dataset_reader.view(dis_video_idxs=[9, 9, 0])
+        self.assertEqual(view.ref_dis_video_of_dis_videos, [2, 2, 2])
+
+    def test_view_dscore(self):
+        # the ref video 0 of content 0 is repeated, and that of content 1 dropped
+        view = self.dataset_reader.view(dis_video_idxs=[9, 0, 0, 20])
+        with self.assertRaises(AssertionError):
+            view.ref_dis_video_of_dis_videos
+        ref_rows, ref_os_2darray = view._get_ref_rows()
+        np.testing.assert_array_equal(ref_os_2darray[ref_rows],
+                                      self.dataset_reader.opinion_score_2darray[[0, 0, 0, 1]])
+        os_2darray = SubjectiveModel._get_opinion_score_2darray_with_preprocessing(
+            view, dscore_mode=True)['opinion_score_2darray']
+        os_2darray2 = SubjectiveModel._get_opinion_score_2darray_with_preprocessing(
+            self.dataset_reader, dscore_mode=True)['opinion_score_2darray']
+        np.testing.assert_allclose(os_2darray, os_2darray2[[9, 0, 0, 20]], rtol=1e-12)
+
+    def test_view_shares_base(self):
+        view = self.dataset_reader.view(dis_video_idxs=[1, 2])
+        view2 = self.dataset_reader.view(observer_idxs=[4])
+        self.assertIs(view._base, view2._base)
+        self.assertFalse(view._base['opinion_score_2darray'].flags.writeable)
+        self.assertEqual(view.num_observers, 26)
+        self.assertEqual(view2.num_dis_videos, 79)
+
+    def test_view_of_view(self):
+        view = self.dataset_reader.view(dis_video_idxs=[9, 20, 0], observer_idxs=[0, 3, 5]).\
+            view(dis_video_idxs=[1, 1], observer_idxs=[2])
+        self.assertIs(view.dataset_reader, self.dataset_reader)
+        np.testing.assert_array_equal(view.dis_video_idxs, [20, 20])
+        np.testing.assert_array_equal(view.observer_idxs, [5])
+        self.assertEqual(view.content_id_of_dis_videos, [1, 1])
+
+    def test_view_out_of_range(self):
+        with self.assertRaises(AssertionError):
+            self.dataset_reader.view(dis_video_idxs=[79])
+        with self.assertRaises(AssertionError):
+            self.dataset_reader.view(observer_idxs=[-1])
+
+    def test_view_to_dataset(self):
+        view = self.dataset_reader.view(dis_video_idxs=[9, 9], observer_idxs=[0, 3])
+        dataset = view.to_dataset()
+        self.assertEqual(len(dataset.dis_videos), 2)
+        self.assertEqual(dataset.dis_videos[0]['os'], [1.0, 2.0])
+        self.assertEqual(len(self.dataset.dis_videos[9]['os']), 26)
+        self.assertEqual(RawDatasetReader(dataset).num_observers, 2)
+
+    def test_view_os_as_dict(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('test_dataset_os_as_dict.py'))
+        dataset_reader = RawDatasetReader(dataset)
+        view = dataset_reader.view(observer_idxs=[2, 0])
+        self.assertEqual(view._get_list_observers(),
+                         [dataset_reader._get_list_observers()[2], dataset_reader._get_list_observers()[0]])
+        np.testing.assert_array_equal(view.opinion_score_2darray, dataset_reader.opinion_score_2darray[:, [2, 0]])
+
+
 class CorruptSubjectDatasetReaderTestWithCorruptionProb(unittest.TestCase):
 
     def setUp(self):
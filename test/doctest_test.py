@@ -7,9 +7,20 @@ Run embedded doctests
 
 import doctest
 
-from sureal.tools import misc
+from sureal import online_estimator, subjective_model, preprocessing
+from sureal.tools import misc, sparse, accelerate, trace, stats, executor, dataset_store, blocks
 
 
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(misc))
+    tests.addTests(doctest.DocTestSuite(sparse))
+    tests.addTests(doctest.DocTestSuite(accelerate))
+    tests.addTests(doctest.DocTestSuite(trace))
+    tests.addTests(doctest.DocTestSuite(stats))
+    tests.addTests(doctest.DocTestSuite(executor))
+    tests.addTests(doctest.DocTestSuite(online_estimator))
+    tests.addTests(doctest.DocTestSuite(dataset_store))
+    tests.addTests(doctest.DocTestSuite(blocks))
+    tests.addTests(doctest.DocTestSuite(subjective_model))
+    tests.addTests(doctest.DocTestSuite(preprocessing))
     return tests
@@ -0,0 +1,39 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from sureal.tools import executor
+from sureal.tools.executor import ProcessExecutor, SharedArray
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+class ProcessExecutorTest(unittest.TestCase):
+
+    @unittest.skipIf(executor.shared_memory is None, 'needs multiprocessing.shared_memory, of python 3.8 or later')
+    def test_shared_array(self):
+        shared = SharedArray(np.arange(6.0).reshape([2, 3]))
+        shared2 = pickle.loads(pickle.dumps(shared))
+        shared2.array[1, 2] = -1.0
+        np.testing.assert_array_equal(shared.array, [[0.0, 1.0, 2.0], [3.0, 4.0, -1.0]])
+        shared.unlink()
+
+    def test_map_without_shared_memory(self):
+        # as before python 3.8, the arrays are pickled with the arguments
+        shared_memory, resource_tracker = executor.shared_memory, executor.resource_tracker
+        executor.shared_memory, executor.resource_tracker = None, None
+        try:
+            with self.assertRaises(AssertionError):
+                SharedArray(np.arange(3.0))
+            array = np.arange(200000.0)
+            with ProcessExecutor(processes=2, min_nbytes=1) as ex:
+                results = ex.map(lambda args: float(np.sum(args[0][:args[1]])), [(array, i) for i in range(4)])
+            self.assertEqual(results, [0.0, 0.0, 1.0, 3.0])
+        finally:
+            executor.shared_memory, executor.resource_tracker = shared_memory, resource_tracker
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -3,7 +3,8 @@ import unittest
 import numpy as np
 
 from sureal.config import SurealConfig
-from sureal.experimental import MaximumLikelihoodEstimationModelContentObliviousWithBootstrapping
+from sureal.experimental import MaximumLikelihoodEstimationModelContentObliviousWithBootstrapping, \
+    SubjectMLEModelProjectionSolverWithBootstrapping
 
 
 class SubjectiveModelTest(unittest.TestCase):
@@ -65,3 +66,84 @@ class SubjectiveModelTest(unittest.TestCase):
         self.assertAlmostEqual(np.float(np.sum(result['observer_inconsistency_ci95'][0])), 1.4129652283023595, places=6)
         self.assertAlmostEqual(np.float(np.sum(result['observer_inconsistency_ci95'][1])), 0.9315979842046503, places=6)
 
+
+    def test_observer_content_aware_subjective_model_bootstrapping_nocontent_processes(self):
+        subjective_model = MaximumLikelihoodEstimationModelContentObliviousWithBootstrapping.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(n_bootstrap=3, bootstrap_processes=2)
+
+        self.assertAlmostEqual(np.float(np.sum(result['quality_scores_ci95'][0])), 16.40231025161599, places=6)
+        self.assertAlmostEqual(np.float(np.sum(result['quality_scores_ci95'][1])), 16.03875029097417, places=6)
+
+        self.assertAlmostEqual(np.float(np.sum(result['observer_bias_ci95'][0])), 1.5802456315996944, places=6)
+        self.assertAlmostEqual(np.float(np.sum(result['observer_bias_ci95'][1])), 1.7042998573080086, places=6)
+
+        self.assertAlmostEqual(np.float(np.sum(result['observer_inconsistency_ci95'][0])), 1.4129652283023595, places=6)
+        self.assertAlmostEqual(np.float(np.sum(result['observer_inconsistency_ci95'][1])), 0.9315979842046503, places=6)
+
+    def test_observer_content_aware_subjective_model_bootstrapping_nocontent_seed(self):
+        subjective_model = MaximumLikelihoodEstimationModelContentObliviousWithBootstrapping.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(n_bootstrap=4, bootstrap_seed=1, bootstrap_processes=1)
+        result2 = subjective_model.run_modeling(n_bootstrap=4, bootstrap_seed=1, bootstrap_processes=3)
+        result3 = subjective_model.run_modeling(n_bootstrap=4, bootstrap_seed=2, bootstrap_processes=3)
+
+        for key in ['quality_scores_ci95', 'observer_bias_ci95', 'observer_inconsistency_ci95']:
+            np.testing.assert_array_equal(result[key], result2[key])
+        self.assertNotEqual(np.sum(result['quality_scores_ci95'][0]), np.sum(result3['quality_scores_ci95'][0]))
+
+    def test_observer_content_aware_subjective_model_bootstrapping_nocontent_dscore(self):
+        subjective_model = MaximumLikelihoodEstimationModelContentObliviousWithBootstrapping.from_dataset_file(
+            self.dataset_filepath)
+        # the resampled dis videos repeat or drop ref videos
+        result = subjective_model.run_modeling(dscore_mode=True, n_bootstrap=3)
+
+        self.assertAlmostEqual(np.float(np.sum(result['observer_bias'])), 0.0, places=4)
+        self.assertAlmostEqual(np.float(np.sum(result['quality_scores'])), 298.0769230769236, places=4)
+
+        self.assertAlmostEqual(np.float(np.sum(result['quality_scores_ci95'][0])), 16.282515194046866, places=6)
+        self.assertAlmostEqual(np.float(np.sum(result['quality_scores_ci95'][1])), 15.676773886711008, places=6)
+
+        # dscore offsets the scores of each dis video, which the quality scores absorb
+        self.assertAlmostEqual(np.float(np.sum(result['observer_bias_ci95'][0])), 1.5802456315996944, places=6)
+        self.assertAlmostEqual(np.float(np.sum(result['observer_bias_ci95'][1])), 1.7042998573080086, places=6)
+
+        self.assertAlmostEqual(np.float(np.sum(result['observer_inconsistency_ci95'][0])), 1.4129652283023595, places=6)
+        self.assertAlmostEqual(np.float(np.sum(result['observer_inconsistency_ci95'][1])), 0.9315979842046503, places=6)
+
+        result2 = subjective_model.run_modeling(dscore_mode=True, n_bootstrap=3, bootstrap_processes=2)
+        for key in ['quality_scores_ci95', 'observer_bias_ci95', 'observer_inconsistency_ci95']:
+            np.testing.assert_array_equal(result[key], result2[key])
+
+    def test_observer_content_aware_subjective_model_bootstrapping_nocontent_weights(self):
+        subjective_model = MaximumLikelihoodEstimationModelContentObliviousWithBootstrapping.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(n_bootstrap=10, bootstrap_method='weights')
+
+        self.assertAlmostEqual(np.float(np.sum(result['observer_bias'])), 0.0, places=4)
+        self.assertAlmostEqual(np.float(np.sum(result['quality_scores'])), 280.0384615384633, places=4)
+
+        self.assertAlmostEqual(np.float(np.sum(result['quality_scores_ci95'][0])), 20.909558251268166, places=4)
+        self.assertAlmostEqual(np.float(np.sum(result['quality_scores_ci95'][1])), 20.80207629361726, places=4)
+
+        self.assertAlmostEqual(np.float(np.sum(result['observer_bias_ci95'][0])), 2.399236220552882, places=4)
+        self.assertAlmostEqual(np.float(np.sum(result['observer_bias_ci95'][1])), 2.614317913908755, places=4)
+
+        self.assertAlmostEqual(np.float(np.sum(result['observer_inconsistency_ci95'][0])), 1.9942353885949493, places=4)
+        self.assertAlmostEqual(np.float(np.sum(result['observer_inconsistency_ci95'][1])), 1.8617838295650677, places=4)
+
+    def test_projection_solver_bootstrapping(self):
+        subjective_model = SubjectMLEModelProjectionSolverWithBootstrapping.from_dataset_file(self.dataset_filepath)
+        # the same intervals as MLE_CO, either way
+        for bootstrap_method, n_bootstrap, expected in [
+            ('resample', 3, [16.40231025161599, 16.03875029097417, 1.5802456315996944, 1.7042998573080086,
+                             1.4129652283023595, 0.9315979842046503]),
+            ('weights', 10, [20.909558251268166, 20.80207629361726, 2.399236220552882, 2.614317913908755,
+                             1.9942353885949493, 1.8617838295650677])]:
+            result = subjective_model.run_modeling(n_bootstrap=n_bootstrap, bootstrap_method=bootstrap_method)
+            self.assertAlmostEqual(np.float(np.sum(result['observer_bias'])), 0.0, places=4)
+            for (key, i), value in zip([('quality_scores_ci95', 0), ('quality_scores_ci95', 1),
+                                        ('observer_bias_ci95', 0), ('observer_bias_ci95', 1),
+                                        ('observer_inconsistency_ci95', 0), ('observer_inconsistency_ci95', 1)],
+                                       expected):
+                self.assertAlmostEqual(np.float(np.sum(result[key][i])), value, places=4)
@@ -0,0 +1,214 @@
+import unittest
+
+import numpy as np
+
+from sureal.mle_engine import DenseMleEngine, InplaceMleEngine, SparseMleEngine
+from sureal.subjective_model import MaximumLikelihoodEstimationModel
+from sureal.tools.stats import convolution_of_two_uniforms
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+class MleEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        self.E, self.S, self.C = 40, 12, 5
+        self.x_es = np.random.normal(3.0, 1.0, [self.E, self.S])
+        self.x_es[np.random.uniform(size=[self.E, self.S]) < 0.2] = float('NaN')
+        self.x_es[:, 3] = float('NaN') # subject without any score
+        self.cids = [e % self.C for e in range(self.E)]
+        self.mos = np.nanmean(self.x_es, axis=1)
+
+    def _get_engines(self, gradient_method='simplified', mode='DEFAULT'):
+        return [
+            DenseMleEngine(self.x_es, self.cids, self.C, mode, gradient_method, 'gaussian',
+                           MaximumLikelihoodEstimationModel.loglikelihood_fcn),
+            InplaceMleEngine(self.x_es, self.cids, self.C, mode, gradient_method, 'gaussian'),
+            SparseMleEngine.from_opinion_score_2darray(self.x_es, self.cids, self.C, mode, gradient_method, 'gaussian'),
+        ]
+
+    def _drop_empty_subject(self, xs):
+        xs = np.asarray(xs, dtype=float)
+        return np.delete(xs, 3) if len(xs) == self.S else xs
+
+    def _run_sweeps(self, engine, num_sweeps):
+        params = engine.get_initial_params(self.mos)
+        stds = None
+        for _ in range(num_sweeps):
+            params, stds = engine.sweep(*params)
+        return params, stds
+
+    def test_initial_params(self):
+        dense, inplace, sparse = self._get_engines()
+        for params, params2, params3 in zip(dense.get_initial_params(self.mos),
+                                            inplace.get_initial_params(self.mos),
+                                            sparse.get_initial_params(self.mos)):
+            np.testing.assert_allclose(np.asarray(params, dtype=float), params2, rtol=1e-12)
+            np.testing.assert_allclose(np.asarray(params, dtype=float), params3, rtol=1e-12)
+
+    def test_sweep(self):
+        for gradient_method in ['simplified', 'original']:
+            for mode in ['DEFAULT', 'CONTENT_OBLIVIOUS']:
+                dense, inplace, sparse = self._get_engines(gradient_method, mode)
+                params, stds = self._run_sweeps(dense, 5)
+                params2, stds2 = self._run_sweeps(inplace, 5)
+                params3, stds3 = self._run_sweeps(sparse, 5)
+                for x, x2, x3 in zip(params + stds, params2 + stds2, params3 + stds3):
+                    np.testing.assert_allclose(self._drop_empty_subject(x), self._drop_empty_subject(x2), rtol=1e-10)
+                    np.testing.assert_allclose(self._drop_empty_subject(x), self._drop_empty_subject(x3), rtol=1e-10)
+                self.assertTrue(np.isnan(params2[1][3]))
+                self.assertTrue(np.isnan(params3[1][3]))
+                self.assertAlmostEqual(float(dense.loglikelihood(*params)),
+                                       float(inplace.loglikelihood(*params2)), places=8)
+                self.assertAlmostEqual(float(dense.loglikelihood(*params)),
+                                       float(sparse.loglikelihood(*params3)), places=8)
+
+    def test_inplace_batch(self):
+        x_es2 = self.x_es + np.random.normal(0.0, 0.5, [self.E, self.S])
+        batch = InplaceMleEngine(np.stack([self.x_es, x_es2]), self.cids, self.C, 'DEFAULT', 'simplified', 'gaussian')
+        self.assertEqual(batch.num_os.shape, (2,))
+        params = batch.get_initial_params(np.stack([self.mos, np.nanmean(x_es2, axis=1)]))
+        for _ in range(5):
+            params, _ = batch.sweep(*params)
+        loglikelihoods = batch.loglikelihood(*params)
+        for idx, x_es in enumerate([self.x_es, x_es2]):
+            engine = InplaceMleEngine(x_es, self.cids, self.C, 'DEFAULT', 'simplified', 'gaussian')
+            params2 = engine.get_initial_params(np.nanmean(x_es, axis=1))
+            for _ in range(5):
+                params2, _ = engine.sweep(*params2)
+            for x, x2 in zip(params, params2):
+                np.testing.assert_allclose(x[idx], x2, rtol=1e-12)
+            self.assertAlmostEqual(float(loglikelihoods[idx]), float(engine.loglikelihood(*params2)), places=8)
+
+    def test_inplace_weights(self):
+        rng = np.random.RandomState(1)
+        weights_e = rng.multinomial(self.E, [1.0 / self.E] * self.E, size=2)
+        weights_s = rng.multinomial(self.S, [1.0 / self.S] * self.S, size=2)
+        params0 = InplaceMleEngine(self.x_es, self.cids, self.C, 'DEFAULT', 'simplified',
+                                   'gaussian').get_initial_params(self.mos)
+        for we, ws in [(weights_e, None), (None, weights_s), (weights_e, weights_s)]:
+            batch = InplaceMleEngine(self.x_es, self.cids, self.C, 'DEFAULT', 'simplified', 'gaussian', we, ws)
+            self.assertEqual(batch.num_os.shape, (2,))
+            params = tuple(np.tile(p, (2, 1)) for p in params0)
+            for _ in range(5):
+                params, _ = batch.sweep(*params)
+            loglikelihoods = batch.loglikelihood(*params)
+            for idx in range(2):
+                # the same as with the rows and columns repeated as many times
+                rows = np.repeat(np.arange(self.E), we[idx]) if we is not None else np.arange(self.E)
+                cols = np.repeat(np.arange(self.S), ws[idx]) if ws is not None else np.arange(self.S)
+                x_es = self.x_es[rows][:, cols]
+                engine = InplaceMleEngine(x_es, [self.cids[e] for e in rows], self.C, 'DEFAULT', 'simplified',
+                                          'gaussian')
+                self.assertEqual(batch.num_os[idx], engine.num_os)
+
+                mos = np.nanmean(self.x_es[:, cols], axis=1)
+                params_batch = batch.get_initial_params(np.tile(mos, (2, 1)))
+                params2 = engine.get_initial_params(mos[rows])
+                for x, x2, index in zip(params_batch, params2, [rows, cols, cols, slice(None)]):
+                    np.testing.assert_allclose(x[idx][index], x2, rtol=1e-12)
+
+                params2 = (params0[0][rows], params0[1][cols], params0[2][cols], params0[3])
+                for _ in range(5):
+                    params2, _ = engine.sweep(*params2)
+                for x, x2, index in zip(params, params2, [rows, cols, cols, slice(None)]):
+                    np.testing.assert_allclose(x[idx][index], x2, rtol=1e-10)
+                self.assertAlmostEqual(float(loglikelihoods[idx]), float(engine.loglikelihood(*params2)), places=8)
+
+        # the subset of a batch keeps its weights
+        batch = InplaceMleEngine(self.x_es, self.cids, self.C, 'DEFAULT', 'simplified', 'gaussian', None, weights_s)
+        np.testing.assert_array_equal(batch.subset([1]).num_os, batch.num_os[1:])
+
+    def test_inplace_profiled_sweep(self):
+        np.random.seed(1)
+        E, S = 400, 100
+        x_es = np.random.normal(3.0, 1.0, [E, S])
+        cids = [e % self.C for e in range(E)]
+        dense = DenseMleEngine(x_es, cids, self.C, 'DEFAULT', 'simplified', 'gaussian',
+                               MaximumLikelihoodEstimationModel.loglikelihood_fcn)
+        inplace = InplaceMleEngine(x_es, cids, self.C, 'DEFAULT', 'simplified', 'gaussian')
+        for engine in [dense, inplace]:
+            params = engine.get_initial_params(np.mean(x_es, axis=1))
+            for _ in range(3):
+                params, _ = engine.profiled_sweep(*params)
+            self.assertEqual(len(engine.sweep_stats), 3)
+        self.assertEqual(inplace.workspace_nbytes, 8 * (7 * E * S + E * self.C))
+        # the dense engine rebuilds E x S temporaries, the inplace engine only parameter vectors
+        self.assertTrue(all(stats['alloc_bytes'] > E * S * 8 for stats in dense.sweep_stats))
+        self.assertTrue(all(stats['alloc_bytes'] < E * S * 8 for stats in inplace.sweep_stats))
+
+    def test_loglikelihood_gradient(self):
+        delta = 1e-6
+        for mode in ['DEFAULT', 'CONTENT_OBLIVIOUS']:
+            for engine in self._get_engines('simplified', mode):
+                params = [np.nan_to_num(p) + 0.5 for p in engine.get_initial_params(self.mos)]
+                grads = engine.loglikelihood_gradient(*params)
+                loglikelihood, grads2 = engine.loglikelihood_and_gradient(*params)
+                self.assertAlmostEqual(float(loglikelihood), float(engine.loglikelihood(*params)), places=8)
+                for idx in range(4):
+                    np.testing.assert_allclose(grads[idx], grads2[idx], rtol=1e-12)
+                    for i in range(len(params[idx])):
+                        params_plus = [p.copy() for p in params]
+                        params_minus = [p.copy() for p in params]
+                        params_plus[idx][i] += delta
+                        params_minus[idx][i] -= delta
+                        grad = (engine.loglikelihood(*params_plus) - engine.loglikelihood(*params_minus)) / (2 * delta)
+                        self.assertAlmostEqual(float(grads[idx][i]), float(grad), places=5)
+
+    def test_solve_lbfgs(self):
+        for mode in ['DEFAULT', 'CONTENT_OBLIVIOUS']:
+            dense, inplace, sparse = self._get_engines('simplified', mode)
+            params, num_iter = dense.solve_lbfgs(*dense.get_initial_params(self.mos))
+            self.assertTrue(num_iter > 0)
+            self.assertAlmostEqual(float(np.nansum(params[1])), 0.0, places=10)
+            self.assertTrue(np.isnan(params[1][3]) and np.isnan(params[2][3]))
+            self.assertTrue(np.all(np.delete(params[2], 3) > 0))
+            if mode == 'CONTENT_OBLIVIOUS':
+                self.assertTrue(np.all(params[3] == 0))
+            # the optimum is a fixed point of the sweeps, up to the gauge of b_s
+            params2, _ = self._run_sweeps(dense, 200)
+            self.assertTrue(dense.loglikelihood(*params) >= dense.loglikelihood(*params2) - 1e-8)
+            for engine in [inplace, sparse]:
+                params3, _ = engine.solve_lbfgs(*engine.get_initial_params(self.mos))
+                for x, x3 in zip(params, params3):
+                    np.testing.assert_allclose(self._drop_empty_subject(x), self._drop_empty_subject(x3), atol=1e-5)
+
+    def test_loglikelihood_fcn_uniform(self):
+        x_e = self.mos
+        b_s = np.random.normal(0.0, 0.2, self.S)
+        v_s = np.random.uniform(0.5, 1.5, self.S)
+        a_c = np.random.uniform(0.0, 0.5, self.C)
+        a_c[0] = 0.0
+        loglikelihoods = MaximumLikelihoodEstimationModel.loglikelihood_fcn(
+            self.x_es, x_e, b_s, v_s, a_c, self.cids, 1, 'uniform')
+        for e in range(self.E):
+            loglikelihood = 0.0
+            for s in range(self.S):
+                if not np.isnan(self.x_es[e, s]):
+                    loglikelihood += np.log(convolution_of_two_uniforms(
+                        self.x_es[e, s], b_s[s], np.sqrt(12.) * v_s[s], x_e[e], np.sqrt(12.) * a_c[self.cids[e]]))
+            self.assertAlmostEqual(float(loglikelihoods[e]), float(loglikelihood), places=10)
+
+    def test_sparse_free_params(self):
+        sparse = SparseMleEngine.from_opinion_score_2darray(self.x_es, self.cids, self.C, 'DEFAULT', 'simplified', 'gaussian')
+        params = sparse.get_initial_params(self.mos)
+        free_e = np.arange(self.E) < 10
+        free_s = np.arange(self.S) < 6
+        free_c = np.zeros(self.C, dtype=bool)
+        sparse.free_params = (free_e, free_s, free_c)
+        params2, _ = sparse.sweep(*params)
+        for x, x2, free in zip(params, params2, [free_e, free_s, free_s, free_c]):
+            np.testing.assert_array_equal(x[~free], x2[~free])
+        self.assertFalse(np.allclose(params[0][free_e], params2[0][free_e]))
+
+    def test_wrong_args(self):
+        with self.assertRaises(AssertionError):
+            SparseMleEngine.from_opinion_score_2darray(self.x_es, self.cids, self.C, 'DEFAULT', 'simplified', 'logistic')
+        with self.assertRaises(AssertionError):
+            InplaceMleEngine(self.x_es, self.cids, self.C, 'DEFAULT', 'numerical', 'gaussian')
+
+
+if __name__ == '__main__':
+    unittest.main()
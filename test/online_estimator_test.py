@@ -0,0 +1,90 @@
+import unittest
+
+import numpy as np
+
+from sureal.config import SurealConfig
+from sureal.online_estimator import OnlineMaximumLikelihoodEstimator
+from sureal.subjective_model import MaximumLikelihoodEstimationModel, \
+    MaximumLikelihoodEstimationModelContentOblivious
+from sureal.tools.misc import import_python_file
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+class OnlineMaximumLikelihoodEstimatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset_filepath = SurealConfig.test_resource_path('NFLX_dataset_public_raw.py')
+        dataset = import_python_file(self.dataset_filepath)
+        self.ratings = [(dis_video['asset_id'], dis_video['content_id'], subject, score)
+                        for dis_video in dataset.dis_videos
+                        for subject, score in enumerate(dis_video['os'])]
+        np.random.seed(0)
+        self.batches = np.array_split(np.random.permutation(len(self.ratings)), 5)
+
+    def _stream(self, estimator):
+        for batch in self.batches:
+            estimator.ingest([{'asset_id': self.ratings[i][0], 'content_id': self.ratings[i][1],
+                               'os': {self.ratings[i][2]: self.ratings[i][3]}} for i in batch])
+
+    def _reorder(self, estimator, xs):
+        return np.asarray(xs)[np.argsort(estimator.asset_ids)]
+
+    def test_ingest(self):
+        estimator = OnlineMaximumLikelihoodEstimator(mode='CONTENT_OBLIVIOUS', refresh_every=500)
+        self._stream(estimator)
+        self.assertEqual(estimator.num_ratings, len(self.ratings))
+        self.assertEqual(len(estimator.asset_ids), 79)
+        self.assertEqual(len(estimator.observers), 26)
+        self.assertEqual(estimator.num_refreshes, 3)
+        self.assertAlmostEqual(float(np.sum(estimator.observer_bias)), 0.0, places=8)
+        self.assertTrue(np.all(np.isfinite(estimator.quality_scores)))
+        self.assertTrue(np.all(np.array(estimator.observer_inconsistency) >= estimator.MIN_STD))
+        self.assertTrue(np.all(np.array(estimator.content_ambiguity) == 0))
+
+        result = MaximumLikelihoodEstimationModelContentOblivious.from_dataset_file(
+            self.dataset_filepath).run_modeling(engine='sparse')
+        # the local sweeps track the full solve closely...
+        np.testing.assert_allclose(self._reorder(estimator, estimator.quality_scores),
+                                   result['quality_scores'], atol=0.05)
+        # ...and a refresh recovers it
+        estimator.refresh()
+        np.testing.assert_allclose(self._reorder(estimator, estimator.quality_scores),
+                                   result['quality_scores'], atol=1e-6)
+        np.testing.assert_allclose(np.array(estimator.observer_bias)[np.argsort(estimator.observers)],
+                                   result['observer_bias'], atol=1e-6)
+
+    def test_refresh(self):
+        estimator = OnlineMaximumLikelihoodEstimator(mode='DEFAULT')
+        self._stream(estimator)
+        self.assertEqual(estimator.num_refreshes, 1)
+        self.assertTrue(estimator.refresh() > 0)
+        result = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath).run_modeling(engine='sparse')
+        np.testing.assert_allclose(self._reorder(estimator, estimator.quality_scores),
+                                   result['quality_scores'], atol=1e-6)
+        # but for one subject, which the full solve fits exactly, under MIN_STD,
+        # and through it the content ambiguities
+        np.testing.assert_allclose(np.array(estimator.observer_inconsistency)[np.argsort(estimator.observers)],
+                                   result['observer_inconsistency'], atol=estimator.MIN_STD)
+        np.testing.assert_allclose(estimator.content_ambiguity, result['content_ambiguity'], atol=1e-3)
+
+    def test_ingest_replaces_score(self):
+        estimator = OnlineMaximumLikelihoodEstimator(mode='CONTENT_OBLIVIOUS')
+        estimator.ingest([{'asset_id': 0, 'content_id': 0, 'os': [3, 4, 5]},
+                          {'asset_id': 1, 'content_id': 1, 'os': [2, 3, 3]}])
+        estimator.ingest([{'asset_id': 0, 'content_id': 0, 'os': {1: 5, 2: float('NaN')}},
+                          {'asset_id': 2, 'content_id': 1, 'os': {0: 1, 1: 2}}])
+        self.assertEqual(estimator.num_ratings, 8)
+        self.assertEqual(estimator.asset_ids, [0, 1, 2])
+        self.assertEqual(estimator.observers, [0, 1, 2])
+        self.assertTrue(np.all(np.isfinite(estimator.quality_scores)))
+        with self.assertRaises(AssertionError):
+            estimator.ingest([{'asset_id': 0, 'content_id': 1, 'os': [3]}])
+        with self.assertRaises(AssertionError):
+            OnlineMaximumLikelihoodEstimator(mode='SUBJECT_OBLIVIOUS', refresh_every=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
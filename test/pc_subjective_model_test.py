@@ -27,6 +27,19 @@ class PcSubjectiveModelTest(unittest.TestCase):
         self.assertAlmostEqual(st.kurtosis(result['quality_scores']), -0.05721221160408296, places=4)
         self.assertTrue(result['quality_scores_std'] is None)
 
+    def test_bt_subjective_model_trace(self):
+        for subjective_model_class in [BradleyTerryNewtonRaphsonPairedCompSubjectiveModel,
+                                       BradleyTerryMlePairedCompSubjectiveModel]:
+            subjective_model = subjective_model_class(self.pc_dataset_reader)
+            result = subjective_model.run_modeling()
+            trace = result['trace']
+            self.assertTrue(len(trace['itr']) > 1)
+            self.assertEqual(trace['itr'], list(range(1, len(trace['itr']) + 1)))
+            self.assertTrue(trace['change'][-1] < 1e-8)
+            result = subjective_model.run_modeling(callback=lambda itr, metrics: True)
+            self.assertEqual(result['trace']['itr'], [1])
+            self.assertTrue(result['trace']['stopped_early'])
+
     def test_btmle_subjective_model(self):
         subjective_model = BradleyTerryMlePairedCompSubjectiveModel(self.pc_dataset_reader)
         result = subjective_model.run_modeling()
@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+
+from sureal.config import SurealConfig
+from sureal.dataset_reader import RawDatasetReader
+from sureal.preprocessing import PreprocessingPipeline, PreprocessingStage, DscoreStage, ZscoreStage, \
+    BiasOffsetStage, SubjectRejectionStage
+from sureal.subjective_model import SubjectiveModel
+from sureal.tools.blocks import RowBlocks
+from sureal.tools.misc import import_python_file
+
+__copyright__ = "Copyright 2016-2018, Netflix, Inc."
+__license__ = "Apache, Version 2.0"
+
+
+class PreprocessingPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw.py'))
+        self.dataset_reader = RawDatasetReader(dataset)
+        np.random.seed(0)
+        self.os_2darray = self.dataset_reader.opinion_score_2darray
+        self.os_2darray[np.random.rand(*self.os_2darray.shape) < 0.1] = float('NaN')
+
+    def _run(self, stages, block_size):
+        return PreprocessingPipeline(stages).run(RowBlocks(self.os_2darray, block_size=block_size))
+
+    def test_blocks_same_as_single_block(self):
+        ref_rows = SubjectiveModel._get_preprocessing_pipeline(
+            self.dataset_reader, dscore_mode=True).stages[0].ref_rows
+        for stages in [[ZscoreStage()],
+                       [DscoreStage(5.0, ref_rows), ZscoreStage(), SubjectRejectionStage()],
+                       [DscoreStage(5.0, ref_rows), BiasOffsetStage(), SubjectRejectionStage()]]:
+            s_es, ret = self._run(stages, len(self.os_2darray))
+            for block_size in [1, 7, 30]:
+                s_es2, ret2 = self._run(stages, block_size)
+                np.testing.assert_allclose(s_es2.to_array(), s_es.to_array(), rtol=1e-12, atol=1e-12)
+                self.assertEqual(sorted(ret2.keys()), sorted(ret.keys()))
+                if 'observer_rejected' in ret:
+                    self.assertEqual(ret2['observer_rejected'], ret['observer_rejected'])
+
+    def test_zscore(self):
+        s_es, _ = self._run([ZscoreStage()], 10)
+        s_es = s_es.to_array()
+        np.testing.assert_allclose(np.nanmean(s_es, axis=0), 0.0, atol=1e-12)
+        np.testing.assert_allclose(np.nanstd(s_es, axis=0, ddof=1), 1.0, rtol=1e-12)
+
+    def test_bias_offset(self):
+        s_es, ret = self._run([BiasOffsetStage()], 10)
+        x_es = self.os_2darray
+        delta_s = np.nanmean(x_es - np.nanmean(x_es, axis=1)[:, np.newaxis], axis=0)
+        np.testing.assert_allclose(ret['bias_offset_estimate'], delta_s, rtol=1e-12)
+        np.testing.assert_allclose(s_es.to_array(), x_es - delta_s, rtol=1e-12)
+
+    def test_stage(self):
+        with self.assertRaises(AssertionError):
+            PreprocessingPipeline([ZscoreStage, BiasOffsetStage()])
+        with self.assertRaises(NotImplementedError):
+            self._run([PreprocessingStage()], 10)
+        s_es, ret = self._run([], 10)
+        self.assertFalse(s_es.is_transformed)
+        self.assertEqual(ret, {})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -1,16 +1,21 @@
+import io
 import os
 import unittest
+from contextlib import redirect_stdout
 import numpy as np
 from sureal.config import SurealConfig
 from sureal.dataset_reader import RawDatasetReader, MissingDataRawDatasetReader, \
-    SyntheticRawDatasetReader, CorruptSubjectRawDatasetReader
-from sureal.subjective_model import MosModel, DmosModel, \
+    SyntheticRawDatasetReader, CorruptSubjectRawDatasetReader, SelectSubjectRawDatasetReader, MemmapRawDatasetReader
+from sureal.subjective_model import SubjectiveModel, MosModel, DmosModel, \
     LegacyMaximumLikelihoodEstimationModel, MaximumLikelihoodEstimationModel, \
     LiveDmosModel, MaximumLikelihoodEstimationDmosModel, LeastSquaresModel, \
     SubjrejMosModel, ZscoringSubjrejMosModel, SubjrejDmosModel, \
     ZscoringSubjrejDmosModel, PerSubjectModel, \
     MaximumLikelihoodEstimationModelContentOblivious, \
     MaximumLikelihoodEstimationModelSubjectOblivious, ZscoringMosModel, BiasremvMosModel, BiasremvSubjrejMosModel, SubjectMLEModelProjectionSolver, SubjectMLEModelProjectionSolver2
+from sureal.preprocessing import get_subject_rejection_counts, get_subject_rejection_counts_sparse, \
+    get_subject_rejection
+from sureal.mle_engine import DenseMleEngine
 from sureal.tools.misc import import_python_file
 
 __copyright__ = "Copyright 2016-2018, Netflix, Inc."
@@ -51,6 +56,32 @@ class SubjectiveModelTest(unittest.TestCase):
         self.assertAlmostEqual(result['aic'], 2.0307880836843775, places=6)
         self.assertAlmostEqual(result['bic'], 2.4636761137219545, places=6)
 
+    def test_mos_subjective_model_npz(self):
+        dataset = import_python_file(self.dataset_filepath)
+        output_dataset_filepath = SurealConfig.workdir_path('NFLX_dataset_public_test.npz')
+        try:
+            RawDatasetReader.write_out_dataset(dataset, output_dataset_filepath)
+            subjective_model = MosModel.from_dataset_file(output_dataset_filepath, content_ids=[0, 1])
+            result = subjective_model.run_modeling()
+        finally:
+            os.remove(output_dataset_filepath)
+        scores = result['quality_scores']
+        self.assertEqual(len(scores), 20)
+        self.assertAlmostEqual(scores[0], 4.884615384615385, places=4)
+
+    def test_mos_subjective_model_sqlite(self):
+        dataset = import_python_file(self.dataset_filepath)
+        output_store_filepath = SurealConfig.workdir_path('sureal_test_store.db')
+        try:
+            RawDatasetReader.write_out_dataset(dataset, output_store_filepath)
+            subjective_model = MosModel.from_dataset_file(output_store_filepath, content_ids=[0, 1])
+            result = subjective_model.run_modeling()
+        finally:
+            os.remove(output_store_filepath)
+        scores = result['quality_scores']
+        self.assertEqual(len(scores), 20)
+        self.assertAlmostEqual(scores[0], 4.884615384615385, places=4)
+
     def test_mos_subjective_model_output(self):
         dataset = import_python_file(self.dataset_filepath)
         dataset_reader = RawDatasetReader(dataset)
@@ -253,6 +284,17 @@ class SubjectiveModelTest(unittest.TestCase):
         self.assertAlmostEqual(float(np.sum(result['quality_scores'])), 280.2889206910113, places=4)
         self.assertAlmostEqual(float(np.var(result['quality_scores'])), 1.4355485462027884, places=4)
 
+    def test_observer_aware_subjective_model_squarem(self):
+        subjective_model = LegacyMaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(acceleration='squarem')
+        result2 = subjective_model.run_modeling()
+
+        for key in ['observer_bias', 'observer_inconsistency', 'quality_scores']:
+            np.testing.assert_allclose(result[key], result2[key], atol=1e-4)
+        self.assertEqual(result['num_iter'], 30)
+        self.assertEqual(result2['num_iter'], 254)
+
     def test_observer_content_aware_subjective_model(self):
         subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
             self.dataset_filepath)
@@ -282,6 +324,187 @@ class SubjectiveModelTest(unittest.TestCase):
         self.assertAlmostEqual(result['aic'], 1.915854139138279, places=6)
         self.assertAlmostEqual(result['bic'], 2.299425811323474, places=6)
 
+    def test_observer_content_aware_subjective_model_sparse(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(force_subjbias_zeromean=False, engine='sparse')
+
+        self.assertAlmostEqual(float(np.sum(result['content_ambiguity'])), 3.8972884776604402, places=4)
+        self.assertAlmostEqual(float(np.var(result['content_ambiguity'])), 0.0041122094732031289, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['observer_bias'])), -0.055712761348815837, places=4)
+        self.assertAlmostEqual(float(np.var(result['observer_bias'])), 0.085842891905121704, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['observer_inconsistency'])), 10.164665557559516, places=4)
+        self.assertAlmostEqual(float(np.var(result['observer_inconsistency'])), 0.028749990587721687, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['quality_scores'])), 280.20774261173619, places=4)
+        self.assertAlmostEqual(float(np.var(result['quality_scores'])), 1.4351342153719635, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['content_ambiguity_std'])), 0.30465244947706538, places=4)
+        self.assertAlmostEqual(float(np.sum(result['observer_bias_std'])), 1.7392847550878989, places=4)
+        self.assertAlmostEqual(float(np.sum(result['observer_inconsistency_std'])), 22.108576292956428, places=4)
+        self.assertAlmostEqual(float(np.sum(result['quality_scores_std'])), 8.8863877635750423, places=4)
+
+        self.assertAlmostEqual(result['dof'], 0.06815968841285297, places=6)
+        self.assertAlmostEqual(result['loglikelihood'], -0.8897673811562866, places=6)
+        self.assertAlmostEqual(result['aic'], 1.915854139138279, places=6)
+        self.assertAlmostEqual(result['bic'], 2.299425811323474, places=6)
+        self.assertTrue('raw_scores' not in result)
+        self.assertTrue('reconstructions' not in result)
+
+    def test_observer_content_aware_subjective_model_inplace(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(force_subjbias_zeromean=False, engine='inplace')
+
+        self.assertAlmostEqual(float(np.sum(result['content_ambiguity'])), 3.8972884776604402, places=4)
+        self.assertAlmostEqual(float(np.var(result['content_ambiguity'])), 0.0041122094732031289, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['observer_bias'])), -0.055712761348815837, places=4)
+        self.assertAlmostEqual(float(np.var(result['observer_bias'])), 0.085842891905121704, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['observer_inconsistency'])), 10.164665557559516, places=4)
+        self.assertAlmostEqual(float(np.var(result['observer_inconsistency'])), 0.028749990587721687, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['quality_scores'])), 280.20774261173619, places=4)
+        self.assertAlmostEqual(float(np.var(result['quality_scores'])), 1.4351342153719635, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['content_ambiguity_std'])), 0.30465244947706538, places=4)
+        self.assertAlmostEqual(float(np.sum(result['observer_bias_std'])), 1.7392847550878989, places=4)
+        self.assertAlmostEqual(float(np.sum(result['observer_inconsistency_std'])), 22.108576292956428, places=4)
+        self.assertAlmostEqual(float(np.sum(result['quality_scores_std'])), 8.8863877635750423, places=4)
+
+        self.assertAlmostEqual(result['dof'], 0.06815968841285297, places=6)
+        self.assertAlmostEqual(result['loglikelihood'], -0.8897673811562866, places=6)
+        self.assertAlmostEqual(float(np.std(result['raw_scores'])), 1.3654128030298962, places=6)
+        self.assertAlmostEqual(float(np.std(result['reconstructions'])), 1.2332790063154353, places=6)
+        self.assertAlmostEqual(result['aic'], 1.915854139138279, places=6)
+        self.assertAlmostEqual(result['bic'], 2.299425811323474, places=6)
+
+    def test_observer_content_aware_subjective_model_inplace_profile(self):
+        subjective_model = MaximumLikelihoodEstimationModelContentOblivious.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(engine='inplace', profile=True)
+        profile = result['profile']
+        self.assertEqual(profile['engine'], 'inplace')
+        self.assertEqual(len(profile['sec_per_iter']), result['num_iter'])
+        self.assertEqual(len(profile['alloc_bytes_per_iter']), result['num_iter'])
+        self.assertEqual(profile['workspace_nbytes'], 120712)
+        self.assertTrue(profile['mean_alloc_bytes_per_iter'] > 0)
+
+    def test_observer_content_aware_subjective_model_trace(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            result = subjective_model.run_modeling(trace_every=10)
+        self.assertEqual(stdout.getvalue(), '')
+        trace = result['trace']
+        self.assertEqual(trace['itr'], list(range(10, result['num_iter'] + 1, 10)))
+        self.assertFalse(trace['stopped_early'])
+        for name in ['sec', 'change', 'loglikelihood', 'x_e', 'b_s', 'v_s', 'a_c']:
+            self.assertEqual(len(trace[name]), len(trace['itr']))
+        self.assertTrue(np.all(np.diff(trace['loglikelihood']) > 0))
+        self.assertTrue(trace['change'][-1] < trace['change'][0])
+
+    def test_observer_content_aware_subjective_model_trace_default(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        loglikelihood = DenseMleEngine.loglikelihood
+        calls = []
+
+        def counted_loglikelihood(engine, *params):
+            calls.append(params)
+            return loglikelihood(engine, *params)
+
+        DenseMleEngine.loglikelihood = counted_loglikelihood
+        try:
+            result = subjective_model.run_modeling()
+            # only for result['loglikelihood'], unless the trace is asked for
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(result['trace']['itr'], list(range(1, result['num_iter'] + 1)))
+            self.assertTrue(np.all(np.isnan(result['trace']['loglikelihood'])))
+            self.assertFalse(np.any(np.isnan(result['trace']['change'])))
+            result = subjective_model.run_modeling(callback=lambda itr, metrics: False)
+            self.assertEqual(len(calls), 1 + result['num_iter'] + 1)
+            self.assertFalse(np.any(np.isnan(result['trace']['loglikelihood'])))
+        finally:
+            DenseMleEngine.loglikelihood = loglikelihood
+
+    def test_observer_content_aware_subjective_model_trace_callback(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        itrs = []
+
+        def callback(itr, metrics):
+            itrs.append(itr)
+            return itr >= 50
+
+        result = subjective_model.run_modeling(callback=callback)
+        self.assertEqual(result['num_iter'], 50)
+        self.assertEqual(itrs, list(range(1, 51)))
+        self.assertTrue(result['trace']['stopped_early'])
+
+    def test_observer_content_aware_subjective_model_lbfgs_trace(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            result = subjective_model.run_modeling(gradient_method='lbfgs', trace_every=5)
+        self.assertEqual(stdout.getvalue(), '')
+        trace = result['trace']
+        self.assertEqual(trace['itr'], list(range(5, result['num_iter'] + 1, 5)))
+        self.assertFalse(trace['stopped_early'])
+        for name in ['sec', 'change', 'loglikelihood', 'x_e', 'b_s', 'v_s', 'a_c']:
+            self.assertEqual(len(trace[name]), len(trace['itr']))
+        self.assertTrue(np.all(np.diff(trace['loglikelihood']) >= 0))
+
+        itrs = []
+
+        def callback(itr, metrics):
+            itrs.append(itr)
+            return itr >= 10
+
+        result = subjective_model.run_modeling(gradient_method='lbfgs', callback=callback)
+        self.assertEqual(result['num_iter'], 10)
+        self.assertEqual(itrs, list(range(1, 11)))
+        self.assertTrue(result['trace']['stopped_early'])
+        self.assertTrue(result['loglikelihood'] < -0.8897673811562866)
+
+        with redirect_stdout(stdout):
+            subjective_model.run_modeling(gradient_method='lbfgs', display=True, trace_every=10)
+        self.assertTrue(stdout.getvalue().startswith('=== L-BFGS-B ===\nIteration   10: sec '))
+
+    def test_observer_content_aware_subjective_model_trace_display(self):
+        subjective_model = MaximumLikelihoodEstimationModelContentOblivious.from_dataset_file(
+            self.dataset_filepath)
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            result = subjective_model.run_modeling(display=True, trace_every=100)
+        lines = stdout.getvalue().split('\r')
+        self.assertEqual(lines[0], '=== Belief Propagation ===\nIteration  100: sec {}, change {}, loglikelihood {}, '
+                                   'x_e {}, b_s {}, v_s {}, a_c {}'.format(
+            *[result['trace'][name][0] for name in ['sec', 'change', 'loglikelihood', 'x_e', 'b_s', 'v_s', 'a_c']]))
+        self.assertEqual(len(lines), len(result['trace']['itr']) + 1)
+
+    def test_trace_legacy_and_projection(self):
+        for subjective_model_class in [LegacyMaximumLikelihoodEstimationModel, SubjectMLEModelProjectionSolver]:
+            subjective_model = subjective_model_class.from_dataset_file(self.dataset_filepath)
+            stdout = io.StringIO()
+            with redirect_stdout(stdout):
+                result = subjective_model.run_modeling()
+            self.assertEqual(stdout.getvalue(), '')
+            self.assertEqual(result['trace']['itr'], list(range(1, result['num_iter'] + 1)))
+            result = subjective_model.run_modeling(callback=lambda itr, metrics: itr >= 5)
+            self.assertEqual(result['num_iter'], 5)
+
+    def test_observer_content_aware_subjective_model_sparse_wrong_gradient_method(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        with self.assertRaises(AssertionError):
+            subjective_model.run_modeling(engine='sparse', gradient_method='numerical')
+
     def test_observer_content_aware_subjective_model_subjbias_zeromean(self):
         subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
             self.dataset_filepath)
@@ -304,6 +527,164 @@ class SubjectiveModelTest(unittest.TestCase):
         self.assertAlmostEqual(float(np.sum(result['observer_inconsistency_std'])), 22.108576292956428, places=4)
         self.assertAlmostEqual(float(np.sum(result['quality_scores_std'])), 8.8863877635750423, places=4)
 
+    def test_observer_content_aware_subjective_model_logistic(self):
+        subjective_model = MaximumLikelihoodEstimationModelContentOblivious.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(numerical_pdf='logistic', gradient_method='numerical')
+        self.assertAlmostEqual(float(np.sum(result['quality_scores'])), 281.2789941394013, places=4)
+        self.assertAlmostEqual(float(np.var(result['quality_scores'])), 1.4912533893139626, places=4)
+        self.assertAlmostEqual(float(np.sum(result['observer_inconsistency'])), 15.846813980562253, places=4)
+        self.assertAlmostEqual(result['loglikelihood'], -0.8936697681448473, places=4)
+
+    def test_observer_content_aware_subjective_model_squarem(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(acceleration='squarem')
+
+        self.assertAlmostEqual(float(np.sum(result['content_ambiguity'])), 3.8972884776604402, places=4)
+        self.assertAlmostEqual(float(np.var(result['content_ambiguity'])), 0.0041122094732031289, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['observer_bias'])), 0.0, places=4)
+        self.assertAlmostEqual(float(np.var(result['observer_bias'])), 0.085842891905121704, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['observer_inconsistency'])), 10.164665557559516, places=4)
+        self.assertAlmostEqual(float(np.var(result['observer_inconsistency'])), 0.028749990587721687, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['quality_scores'])), 280.0384615291764, places=4)
+        self.assertAlmostEqual(float(np.var(result['quality_scores'])), 1.4351342153719635, places=4)
+
+        self.assertAlmostEqual(result['loglikelihood'], -0.8897673811562866, places=6)
+        self.assertEqual(result['num_iter'], 165)
+
+    def test_observer_content_aware_subjective_model_lbfgs(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(gradient_method='lbfgs')
+
+        # same likelihood as the sweeps, but the split of the variance between
+        # v_s and a_c is only weakly identified, and ends up elsewhere
+        self.assertAlmostEqual(float(np.sum(result['content_ambiguity'])), 3.0902729940149722, places=3)
+        self.assertAlmostEqual(float(np.var(result['content_ambiguity'])), 0.0061979253378707565, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['observer_bias'])), 0.0, places=8)
+        self.assertAlmostEqual(float(np.var(result['observer_bias'])), 0.085842891905121704, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['observer_inconsistency'])), 12.516510869009297, places=3)
+        self.assertAlmostEqual(float(np.var(result['observer_inconsistency'])), 0.017373264228399257, places=4)
+
+        self.assertAlmostEqual(float(np.sum(result['quality_scores'])), 280.0384615291764, places=4)
+        self.assertAlmostEqual(float(np.var(result['quality_scores'])), 1.4351342153719635, places=4)
+
+        self.assertAlmostEqual(result['loglikelihood'], -0.8897673811562866, places=6)
+
+        for engine in ['inplace', 'sparse']:
+            result2 = subjective_model.run_modeling(gradient_method='lbfgs', engine=engine)
+            for key in ['observer_bias', 'observer_inconsistency', 'content_ambiguity', 'quality_scores']:
+                np.testing.assert_allclose(result[key], result2[key], atol=1e-5)
+
+    def test_observer_content_aware_subjective_model_lbfgs_wrong_args(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        with self.assertRaises(AssertionError):
+            subjective_model.run_modeling(gradient_method='lbfgs', numerical_pdf='logistic')
+        with self.assertRaises(AssertionError):
+            subjective_model.run_modeling(gradient_method='lbfgs', acceleration='squarem')
+        with self.assertRaises(AssertionError):
+            subjective_model.run_modeling(gradient_method='lbfgs', force_subjbias_zeromean=False)
+
+    def test_observer_content_aware_subjective_model_batch(self):
+        dataset = import_python_file(self.dataset_filepath)
+        np.random.seed(0)
+        dataset_readers = []
+        for _ in range(3):
+            info_dict = {
+                'quality_scores': np.random.uniform(1, 5, 79),
+                'observer_bias': np.random.normal(0, 1, 26),
+                'observer_inconsistency': np.abs(np.random.uniform(0.1, 1, 26)),
+                'content_bias': np.zeros(9),
+                'content_ambiguity': np.abs(np.random.uniform(0, 0.5, 9)),
+            }
+            # freeze the synthetic scores, which are redrawn on every read
+            dataset_readers.append(RawDatasetReader(
+                SyntheticRawDatasetReader(dataset, input_dict=info_dict).to_dataset()))
+        # fewer subjects, padded in the batch
+        dataset_readers.append(SelectSubjectRawDatasetReader(dataset, input_dict={'selected_subjects': range(5, 26)}))
+
+        for subjective_model_class in [MaximumLikelihoodEstimationModel,
+                                       MaximumLikelihoodEstimationModelContentOblivious]:
+            results = subjective_model_class.run_modeling_batch(dataset_readers)
+            self.assertEqual(len(results), 4)
+            self.assertEqual(results[0]['trace']['num_converged'][-1], 4)
+            for dataset_reader, result in zip(dataset_readers, results):
+                result2 = subjective_model_class(dataset_reader).run_modeling(engine='inplace')
+                self.assertEqual(sorted(result.keys()), sorted(result2.keys()))
+                self.assertEqual(result['num_iter'], result2['num_iter'])
+                for key in ['quality_scores', 'quality_scores_std', 'observer_bias', 'observer_inconsistency',
+                            'observer_inconsistency_std', 'reconstructions']:
+                    np.testing.assert_allclose(result[key], result2[key], atol=1e-10)
+                self.assertAlmostEqual(result['loglikelihood'], result2['loglikelihood'], places=8)
+                self.assertAlmostEqual(result['aic'], result2['aic'], places=8)
+            self.assertEqual(len(results[3]['observer_bias']), 21)
+            self.assertAlmostEqual(float(np.sum(results[3]['observer_bias'])), 0.0, places=8)
+
+    def test_observer_content_aware_subjective_model_batch_wrong_args(self):
+        dataset = import_python_file(self.dataset_filepath)
+        dataset_reader = RawDatasetReader(dataset)
+        with self.assertRaises(AssertionError):
+            MaximumLikelihoodEstimationModel.run_modeling_batch([dataset_reader], gradient_method='numerical')
+        dataset2 = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw_PARTIAL.py'))
+        with self.assertRaises(AssertionError):
+            MaximumLikelihoodEstimationModel.run_modeling_batch([dataset_reader, RawDatasetReader(dataset2)])
+
+    def test_observer_content_aware_subjective_model_warm_start(self):
+        dataset = import_python_file(self.dataset_filepath)
+        for subjective_model_class in [MaximumLikelihoodEstimationModel,
+                                       MaximumLikelihoodEstimationModelContentOblivious,
+                                       SubjectMLEModelProjectionSolver]:
+            result = subjective_model_class(RawDatasetReader(dataset)).run_modeling()
+
+            # restarting from the solution stops right away
+            result2 = subjective_model_class(RawDatasetReader(dataset)).run_modeling(initial_params=result)
+            self.assertEqual(result2['num_iter'], 1)
+            np.testing.assert_allclose(result['quality_scores'], result2['quality_scores'], atol=1e-6)
+
+            # two more subjects, seeded by the cold-start values
+            dataset_reader = SelectSubjectRawDatasetReader(dataset, input_dict={'selected_subjects': range(24)})
+            result3 = subjective_model_class(dataset_reader).run_modeling()
+            result4 = subjective_model_class(RawDatasetReader(dataset)).run_modeling(initial_params=result3)
+            self.assertTrue(result4['num_iter'] <= result['num_iter'])
+            self.assertAlmostEqual(result4['loglikelihood'], result['loglikelihood'], places=4)
+
+    def test_observer_content_aware_subjective_model_warm_start_squarem(self):
+        dataset = import_python_file(self.dataset_filepath)
+        dataset_reader = SelectSubjectRawDatasetReader(dataset, input_dict={'selected_subjects': range(24)})
+        result = MaximumLikelihoodEstimationModel(dataset_reader).run_modeling(acceleration='squarem')
+        result2 = MaximumLikelihoodEstimationModel(RawDatasetReader(dataset)).run_modeling(
+            acceleration='squarem', initial_params=result)
+        self.assertEqual(result2['num_iter'], 60)
+        self.assertAlmostEqual(result2['loglikelihood'], -0.889801349918185, places=6)
+
+    def test_warm_start_params(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('test_dataset_os_as_dict.py'))
+        dataset_reader = RawDatasetReader(dataset)
+        initial_params = {
+            'asset_ids': [2, 0, 5],
+            'quality_scores': [4.5, 3.5, 1.0],
+            'observers': ['Pinokio', 'Tom', 'Zorro'],
+            'observer_bias': [0.3, float('NaN'), 9.0],
+            'content_ambiguity': [0.2],
+        }
+        params = MaximumLikelihoodEstimationModel._get_warm_start_params(dataset_reader, initial_params, {
+            'quality_scores': [3.0, 2.0, 1.0],
+            'observer_bias': [0.0, 0.0, 0.0],  # Jerry, Pinokio, Tom
+            'observer_inconsistency': [1.0, 1.0, 1.0],
+            'content_ambiguity': [0.5, 0.5],
+        })
+        np.testing.assert_allclose(params['quality_scores'], [3.5, 2.0, 4.5])
+        np.testing.assert_allclose(params['observer_bias'], [0.0, 0.3, 0.0])
+        np.testing.assert_allclose(params['observer_inconsistency'], [1.0, 1.0, 1.0])
+        np.testing.assert_allclose(params['content_ambiguity'], [0.2, 0.5])
+
     def test_observer_content_aware_subjective_model_original(self):
         subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
             self.dataset_filepath)
@@ -679,6 +1060,75 @@ class SubjectiveModelTest(unittest.TestCase):
         self.assertAlmostEqual(float(np.sum(result['observer_bias'])), 0, places=4)
         self.assertAlmostEqual(float(np.var(result['observer_bias'])), 0.089032585621522581, places=4)
 
+    def test_dataset_without_path_and_asset_id(self):
+        dataset = import_python_file(self.dataset_filepath)
+        for video in dataset.ref_videos + dataset.dis_videos:
+            video.pop('path', None)
+            video.pop('asset_id', None)
+        dataset_reader = RawDatasetReader(dataset)
+        mos = MosModel(dataset_reader).run_modeling()['quality_scores']
+        self.assertAlmostEqual(float(np.sum(mos)), 280.0384615384616, places=4)
+        result = LeastSquaresModel(dataset_reader).run_modeling()
+        self.assertAlmostEqual(float(np.sum(result['quality_scores'])), 280.03846153847428, places=4)
+        result = MaximumLikelihoodEstimationModel(dataset_reader).run_modeling()
+        self.assertEqual(len(result['quality_scores']), 79)
+        self.assertEqual(dataset_reader.max_content_id_of_ref_videos, 8)
+        self.assertEqual(sorted(dataset_reader.content_ids), list(range(9)))
+        self.assertEqual(len(dataset_reader.view(dis_video_idxs=[0, 1]).content_id_of_dis_videos), 2)
+        # only the properties that need the fields read them
+        with self.assertRaises(KeyError):
+            dataset_reader.disvideo_is_refvideo
+        with self.assertRaises(KeyError):
+            dataset_reader.asset_ids
+
+    def test_least_squares_model_missingdata(self):
+        dataset = import_python_file(self.dataset_filepath)
+        np.random.seed(0)
+        dataset_reader = MissingDataRawDatasetReader(dataset, input_dict={'missing_probability': 0.3})
+        dataset_reader = RawDatasetReader(dataset_reader.to_dataset())
+        os_2darray = dataset_reader.opinion_score_2darray
+        result = LeastSquaresModel(dataset_reader).run_modeling()
+        q = np.array(result['quality_scores'])
+        b = np.array(result['observer_bias'])
+        self.assertFalse(np.any(np.isnan(q)))
+        self.assertFalse(np.any(np.isnan(b)))
+        self.assertAlmostEqual(q[0], np.nanmean(os_2darray[0]), places=8)
+
+        # the residuals are orthogonal to each of the unknowns
+        rows, cols = np.nonzero(~np.isnan(os_2darray))
+        r = os_2darray[rows, cols] - q[rows] - b[cols]
+        np.testing.assert_allclose(np.bincount(rows, r), 0.0, atol=1e-8)
+        np.testing.assert_allclose(np.bincount(cols, r), 0.0, atol=1e-8)
+
+    def test_least_squares_model_unrated_and_disconnected(self):
+        dataset = import_python_file(self.dataset_filepath)
+        dataset.dis_videos[0]['os'] = [float('NaN')] * 26
+        dataset_reader = RawDatasetReader(dataset)
+        os_2darray = dataset_reader.opinion_score_2darray
+        result = LeastSquaresModel(dataset_reader).run_modeling()
+        q = np.array(result['quality_scores'])
+        b = np.array(result['observer_bias'])
+        self.assertTrue(np.isnan(q[0]))
+        self.assertFalse(np.any(np.isnan(q[1:])))
+        self.assertFalse(np.any(np.isnan(b)))
+        self.assertAlmostEqual(q[1], np.mean(os_2darray[1]), places=8)
+
+        # two groups of videos, each rated by its own group of subjects, are
+        # each anchored on their first rated video, as if fit apart
+        for e, dis_video in enumerate(dataset.dis_videos):
+            dis_video['os'] = [score if (e < 40) == (s < 13) else float('NaN')
+                               for s, score in enumerate(dis_video['os'])]
+        dataset_reader = RawDatasetReader(dataset)
+        result = LeastSquaresModel(dataset_reader).run_modeling()
+        for dis_video_idxs, observer_idxs in [(range(40), range(13)), (range(40, 79), range(13, 26))]:
+            result2 = LeastSquaresModel(dataset_reader.view(dis_video_idxs, observer_idxs)).run_modeling()
+            np.testing.assert_allclose(np.array(result['quality_scores'])[list(dis_video_idxs)],
+                                       result2['quality_scores'], atol=1e-8)
+            np.testing.assert_allclose(np.array(result['observer_bias'])[list(observer_idxs)],
+                                       result2['observer_bias'], atol=1e-8)
+        self.assertAlmostEqual(result['quality_scores'][40], np.nanmean(dataset_reader.opinion_score_2darray[40]),
+                               places=8)
+
     def test_subjrejmos_subjective_model_corruptdata_subjreject(self):
         dataset = import_python_file(self.dataset_filepath)
         np.random.seed(0)
@@ -848,6 +1298,26 @@ class SubjectiveModelTest(unittest.TestCase):
         self.assertAlmostEqual(float(np.sum(result['observer_inconsistency_std'])), 1.6737192530463552, places=4)
         self.assertAlmostEqual(float(np.sum(result['quality_scores_std'])), 9.592833401286343, places=4)
 
+    def test_proj_mle_subjective_model_corruptdata_squarem(self):
+        dataset = import_python_file(self.dataset_filepath)
+        np.random.seed(0)
+        info_dict = {
+            'selected_subjects': range(5),
+        }
+        dataset_reader = CorruptSubjectRawDatasetReader(dataset, input_dict=info_dict)
+        subjective_model = SubjectMLEModelProjectionSolver(dataset_reader)
+        result = subjective_model.run_modeling(acceleration='squarem')
+        scores = result['quality_scores']
+        bias = result['observer_bias']
+        inconsistency = result['observer_inconsistency']
+
+        self.assertAlmostEqual(float(np.mean(scores)), 3.5447906523855877, places=8)
+        self.assertAlmostEqual(float(np.var(scores)), 1.3559834679453553, places=8)
+        self.assertAlmostEqual(float(np.mean(bias)), 0.0, places=8)
+        self.assertAlmostEqual(float(np.var(bias)), 0.08903258562151985, places=8)
+        self.assertAlmostEqual(float(np.mean(inconsistency)), 0.8091663380211014, places=8)
+        self.assertAlmostEqual(float(np.var(inconsistency)), 0.21269010120806528, places=8)
+
     def test_proj_mle_subjective_model_corruptdata_nonzero_bias(self):
         dataset = import_python_file(self.dataset_filepath)
         np.random.seed(0)
@@ -983,6 +1453,42 @@ class SubjectiveModelTest(unittest.TestCase):
         self.assertAlmostEqual(float(np.sum(result['observer_inconsistency_std'])), 1.673273950838568, places=4)
         self.assertAlmostEqual(float(np.sum(result['quality_scores_std'])), 13.712083371807026, places=4)
 
+    def test_preprocessing_cache(self):
+        dataset = import_python_file(self.dataset_filepath)
+        dataset_reader = RawDatasetReader(dataset)
+        ret = SubjectiveModel._get_opinion_score_2darray_with_preprocessing(dataset_reader, subject_rejection=True)
+        ret2 = SubjectiveModel._get_opinion_score_2darray_with_preprocessing(
+            dataset_reader, subject_rejection=True, dscore_mode=False)
+        self.assertTrue(np.shares_memory(ret['opinion_score_2darray'], ret2['opinion_score_2darray']))
+        self.assertFalse(ret['opinion_score_2darray'].flags.writeable)
+        with self.assertRaises(ValueError):
+            ret['original_opinion_score_2darray'][0, 0] = 0.0
+        ret['observer_rejected'][0] = True
+        self.assertFalse(ret2['observer_rejected'][0])
+
+        # the same as uncached
+        ret3 = SubjectiveModel._compile_opinion_score_2darray_with_preprocessing(
+            RawDatasetReader(dataset), subject_rejection=True)
+        np.testing.assert_array_equal(ret2['opinion_score_2darray'], ret3['opinion_score_2darray'])
+        self.assertEqual(ret2['observer_rejected'], ret3['observer_rejected'])
+
+        ret4 = SubjectiveModel._get_opinion_score_2darray_with_preprocessing(dataset_reader, zscore_mode=True)
+        self.assertFalse(np.shares_memory(ret['opinion_score_2darray'], ret4['opinion_score_2darray']))
+
+        # models share it, and a replaced dataset drops it
+        result = MosModel(dataset_reader).run_modeling()
+        result2 = PerSubjectModel(dataset_reader).run_modeling()
+        self.assertTrue(np.shares_memory(result['raw_scores'], result2['quality_scores']))
+        dataset_reader.dataset.dis_videos = dataset_reader.dataset.dis_videos[:-1]
+        result3 = MosModel(dataset_reader).run_modeling()
+        self.assertEqual(len(result3['quality_scores']), len(result['quality_scores']) - 1)
+
+        # a mocked reader's scores may change on every read, and are not cached
+        dataset_reader = CorruptSubjectRawDatasetReader(dataset, input_dict={'selected_subjects': range(5)})
+        ret = SubjectiveModel._get_opinion_score_2darray_with_preprocessing(dataset_reader)
+        ret2 = SubjectiveModel._get_opinion_score_2darray_with_preprocessing(dataset_reader)
+        self.assertFalse(np.shares_memory(ret['opinion_score_2darray'], ret2['opinion_score_2darray']))
+
 
 class SubjectiveModelPartialTest(unittest.TestCase):
 
@@ -1112,6 +1618,24 @@ class SubjectiveModelPartialTest(unittest.TestCase):
         self.assertAlmostEqual(float(np.sum(result['observer_inconsistency_std'])), 27.520643824238352, places=4)
         self.assertAlmostEqual(float(np.sum(result['quality_scores_std'])), 5.7355563435912256, places=4)
 
+    def test_observer_content_aware_subjective_model_sparse(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(force_subjbias_zeromean=False, engine='sparse')
+
+    def test_observer_content_aware_subjective_model_inplace(self):
+        subjective_model = MaximumLikelihoodEstimationModel.from_dataset_file(
+            self.dataset_filepath)
+        result = subjective_model.run_modeling(force_subjbias_zeromean=False, engine='inplace')
+
+        self.assertAlmostEqual(float(np.nansum(result['content_ambiguity'])), 2.653508643860357, places=4)
+        self.assertAlmostEqual(float(np.sum(result['observer_bias'])), -0.020313188445860726, places=4)
+        self.assertAlmostEqual(float(np.sum(result['observer_inconsistency'])), 11.232923468639161, places=4)
+        self.assertAlmostEqual(float(np.sum(result['quality_scores'])), 177.88599894484821, places=4)
+        self.assertAlmostEqual(float(np.sum(result['observer_bias_std'])), 2.165903882505483, places=4)
+        self.assertAlmostEqual(float(np.sum(result['observer_inconsistency_std'])), 27.520643824238352, places=4)
+        self.assertAlmostEqual(float(np.sum(result['quality_scores_std'])), 5.7355563435912256, places=4)
+
     def test_observer_content_aware_subjective_model_nocontent(self):
         subjective_model = MaximumLikelihoodEstimationModelContentOblivious.from_dataset_file(
             self.dataset_filepath)
@@ -1127,5 +1651,71 @@ class SubjectiveModelPartialTest(unittest.TestCase):
         self.assertAlmostEqual(float(np.var(result['quality_scores'])), 1.4830610442685492, places=4)
 
 
+class SubjectiveModelMemmapTest(unittest.TestCase):
+
+    def setUp(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw.py'))
+        self.dataset_reader = RawDatasetReader(dataset)
+        self.output_npy_filepath = SurealConfig.workdir_path('NFLX_dataset_public_test.npy')
+        self.memmap_dataset_reader = MemmapRawDatasetReader.from_dataset_reader(
+            self.dataset_reader, self.output_npy_filepath, block_size=7)
+
+    def tearDown(self):
+        del self.memmap_dataset_reader
+        if os.path.exists(self.output_npy_filepath):
+            os.remove(self.output_npy_filepath)
+
+    def _assert_same_results(self, subjective_model_class, keys, **kwargs):
+        result = subjective_model_class(self.dataset_reader).run_modeling(**kwargs)
+        result2 = subjective_model_class(self.memmap_dataset_reader).run_modeling(**kwargs)
+        for key in keys:
+            np.testing.assert_allclose(result2[key], result[key], rtol=1e-9, atol=1e-12, err_msg=key)
+        self.assertAlmostEqual(result2['loglikelihood'], result['loglikelihood'], places=8)
+        self.assertAlmostEqual(result2['dof'], result['dof'], places=8)
+        return result2
+
+    def test_mos_subjective_model(self):
+        result = self._assert_same_results(
+            MosModel, ['quality_scores', 'quality_scores_std', 'quality_ambiguity'])
+        self.assertIsInstance(result['raw_scores'], np.memmap)
+        self.assertEqual(result['reconstructions'].shape, (79, 26))
+        self.assertAlmostEqual(float(np.sum(result['quality_scores'])), 280.0384615384616, places=4)
+
+    def test_preprocessed_mos_subjective_models(self):
+        result = self._assert_same_results(ZscoringMosModel, ['quality_scores', 'quality_scores_std'])
+        self.assertNotIn('raw_scores', result)
+        self._assert_same_results(DmosModel, ['quality_scores', 'quality_scores_std'])
+        self._assert_same_results(BiasremvMosModel, ['quality_scores', 'observer_bias'])
+        result = self._assert_same_results(
+            ZscoringSubjrejMosModel, ['quality_scores', 'observer_rejected', 'observer_rejected_1st_stats'])
+        self.assertEqual(result['observer_rejected'].count(True), 3)
+
+    def test_subject_rejection_counts(self):
+        dataset = import_python_file(SurealConfig.test_resource_path('NFLX_dataset_public_raw.py'))
+        np.random.seed(0)
+        info_dict = {
+            'selected_subjects': range(5),
+        }
+        dataset_reader = CorruptSubjectRawDatasetReader(dataset, input_dict=info_dict)
+        os_2darray = dataset_reader.opinion_score_2darray
+        os_2darray[np.random.rand(*os_2darray.shape) < 0.2] = float('NaN')
+        ps, qs = get_subject_rejection_counts(os_2darray)
+        rows, cols = np.nonzero(~np.isnan(os_2darray))
+        ps2, qs2 = get_subject_rejection_counts_sparse(
+            rows, cols, os_2darray[rows, cols], os_2darray.shape)
+        np.testing.assert_array_equal(ps2, ps)
+        np.testing.assert_array_equal(qs2, qs)
+        observer_rejected, _, _ = get_subject_rejection(ps, qs, os_2darray.shape[0])
+        self.assertEqual(np.flatnonzero(observer_rejected).tolist(), [0])
+
+    def test_projection_solver(self):
+        keys = ['quality_scores', 'quality_scores_std', 'observer_bias', 'observer_bias_std',
+                'observer_inconsistency', 'observer_inconsistency_std']
+        result = self._assert_same_results(SubjectMLEModelProjectionSolver, keys)
+        self.assertNotIn('reconstructions', result)
+        self._assert_same_results(SubjectMLEModelProjectionSolver2, keys)
+        self._assert_same_results(SubjectMLEModelProjectionSolver, keys, zscore_mode=True)
+
+
 if __name__ == '__main__':
     unittest.main()